@@ -0,0 +1,15 @@
+"""pytest bootstrap: configure Django for the unit tests under memories/tests.
+
+The tests never reach Azure; these placeholders only satisfy modules that build their
+clients at import time (memories/models.py, memories/azure_openai.py).
+"""
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "memories_project.settings")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+os.environ.setdefault("AZURE_OPENAI_KEY", "test-key")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+
+django.setup()
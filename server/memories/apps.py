@@ -1,6 +1,25 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _serves_requests() -> bool:
+    """False for manage.py commands other than runserver, and for runserver's autoreload parent."""
+    if os.path.basename(sys.argv[0]) != 'manage.py' or len(sys.argv) < 2:
+        return True  # WSGI/ASGI servers (gunicorn, uvicorn, ...)
+    if sys.argv[1] != 'runserver':
+        return False
+    return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
 
 
 class MemoriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'memories'
+
+    def ready(self):
+        # Keep this process's local vector/lexical indexes in sync with Cosmos (see change_feed.py)
+        if getattr(settings, 'CHANGE_FEED_IN_PROCESS', False) and _serves_requests():
+            from .change_feed import start_background_projector
+            start_background_projector()
@@ -4,12 +4,14 @@ BaseOpenAIClient._create_structured_completion is invoked with reasoning & verbo
 keywords, but the Azure implementation shipped in graphiti_core lacks these parameters.
 Until upstream updates, this shim preserves compatibility.
 """
-import os
+import time
 from typing import Any
-from openai import AsyncAzureOpenAI
+from openai import LengthFinishReasonError
 from pydantic import BaseModel
 from graphiti_core.llm_client.azure_openai_client import AzureOpenAILLMClient
 
+from . import output_budget
+
 
 class PatchedAzureOpenAILLMClient(AzureOpenAILLMClient):
     class _Shim:
@@ -26,49 +28,63 @@ class PatchedAzureOpenAILLMClient(AzureOpenAILLMClient):
         reasoning: str | None = None,  # accepted but unused (Azure beta parse currently ignores)
         verbosity: str | None = None,  # accepted but unused
     ):
-        """Invoke Azure structured completion with defensive token limiting & adaptive retry.
+        """Invoke Azure structured completion with learned token budgets & adaptive retry.
 
         Problems observed during batch Graphiti ingestion:
           * Azure responses hitting 'Output length exceeded max tokens 8192' causing hard failures.
+          * Every response model reserving the same large max_tokens regardless of its real output size.
 
         Mitigations applied here:
           1. Clamp requested max_tokens to GRAPHITI_LLM_MAX_TOKENS (default 4096) to avoid overly large generations.
-          2. On 'Output length exceeded max tokens' errors, retry once with a halved token budget (min 512).
+          2. Request the budget learned for this response model (memories/output_budget.py) instead of the cap;
+             if the output overflows it, retry once at the cap.
+          3. On 'Output length exceeded max tokens' errors at the cap, retry once with a halved token budget (min 512).
+        Prompt/completion tokens and latency are recorded per response model.
         """
+        model_type = getattr(response_model, "__name__", "unknown")
 
-        # 1. Clamp via env var override
-        try:
-            cap = int(os.getenv("GRAPHITI_LLM_MAX_TOKENS", "4096"))
-            if cap > 0:
-                if max_tokens > cap:
-                    max_tokens = cap
-        except Exception:
-            # Ignore parsing errors; proceed with provided max_tokens
-            pass
+        # 1. Clamp to GRAPHITI_LLM_MAX_TOKENS
+        max_tokens = output_budget.max_tokens_cap(max_tokens)
+        budget = output_budget.budget_for(model_type, max_tokens)
 
         async def _call(requested_tokens: int):
-            return await self.client.beta.chat.completions.parse(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=requested_tokens,
-                response_format=response_model,  # type: ignore
-            )
+            started = time.perf_counter()
+            try:
+                resp = await self.client.beta.chat.completions.parse(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=requested_tokens,
+                    response_format=response_model,  # type: ignore
+                )
+            except LengthFinishReasonError as e:
+                output_budget.record(model_type, e.completion.usage, (time.perf_counter() - started) * 1000, "length")
+                raise
+            except Exception:
+                output_budget.record(model_type, None, (time.perf_counter() - started) * 1000, "error")
+                raise
+            output_budget.record(model_type, resp.usage, (time.perf_counter() - started) * 1000)
+            return resp
 
-        try:
-            resp = await _call(max_tokens)
-        except Exception as e:  # noqa: BLE001
-            msg = str(e)
-            if "Output length exceeded max tokens" in msg and max_tokens > 512:
-                # 2. Adaptive single retry with halved token budget (floor 512)
-                reduced = max(512, max_tokens // 2)
-                try:
-                    resp = await _call(reduced)
-                except Exception:
-                    raise
-            else:
+        async def _call_at_cap():
+            try:
+                return await _call(max_tokens)
+            except Exception as e:  # noqa: BLE001
+                if "Output length exceeded max tokens" in str(e) and max_tokens > 512:
+                    # 3. Adaptive single retry with halved token budget (floor 512)
+                    return await _call(max(512, max_tokens // 2))
                 raise
 
+        if budget >= max_tokens:
+            resp = await _call_at_cap()
+        else:
+            try:
+                resp = await _call(budget)
+            except LengthFinishReasonError:
+                # 2. The learned budget was too small for this output; its real size now joins the window
+                output_budget.record_overflow(model_type, budget)
+                resp = await _call_at_cap()
+
         # Adapt OpenAI parse response to what BaseOpenAIClient expects: object.output_text -> JSON string
         try:
             parsed = resp.choices[0].message.parsed  # pydantic model
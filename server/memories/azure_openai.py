@@ -1,6 +1,11 @@
+import time
+
 import numpy as np
 from openai import AzureOpenAI
 from django.conf import settings
+from . import model_tiers
+from .llm_cache import get_cache, make_key, should_cache
+from .openai_router import get_router
 
 class AzureOpenAIManager:
     def __init__(self):
@@ -12,7 +17,7 @@ class AzureOpenAIManager:
         self.deployment_name = settings.AZURE_OPENAI_DEPLOYMENT
         self.embedding_deployment = settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
 
-    def generate_completion(self, prompt, max_tokens=1000, temperature=0.7):
+    def generate_completion(self, prompt, max_tokens=1000, temperature=0.7, cache=None, prompt_name=None):
         """
         Generate a completion using Azure OpenAI
         
@@ -20,21 +25,38 @@ class AzureOpenAIManager:
             prompt (str): The input prompt
             max_tokens (int): Maximum number of tokens to generate
             temperature (float): Controls randomness (0-1)
+            cache (bool|None): None caches only temperature-0 calls; True/False force or bypass the cache
+            prompt_name (str|None): Prompt name whose model tier (PROMPT_MODEL_TIERS) serves the call
         
         Returns:
             str: The generated text
         """
+        messages = [
+            {"role": "user", "content": prompt}
+        ]
+        cache_key = None
+        if should_cache(temperature, cache):
+            cache_key = make_key(model_tiers.deployment_for(prompt_name), messages, {"max_tokens": max_tokens, "temperature": temperature})
+            cached = get_cache().get(cache_key)
+            if cached is not None:
+                return cached
+        start = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+            router = get_router()
+            response = router.call_sync(model_tiers.kind_for(prompt_name), lambda dep: router.sync_client(dep).chat.completions.create(
+                model=dep.deployment,
+                messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature
-            )
-            return response.choices[0].message.content
+            ))
+            model_tiers.record(prompt_name, (time.perf_counter() - start) * 1000,
+                               usage=getattr(response, "usage", None))
+            text = response.choices[0].message.content
+            if cache_key:
+                get_cache().set(cache_key, text)
+            return text
         except Exception as e:
+            model_tiers.record(prompt_name, (time.perf_counter() - start) * 1000, ok=False)
             print(f"Error generating completion: {str(e)}")
             return None
 
@@ -50,15 +72,16 @@ class AzureOpenAIManager:
         """
         prompt = f"Analyze the following text and provide key themes, sentiment, and main points:\n\n{text}"
         try:
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
+            router = get_router()
+            response = router.call_sync("chat", lambda dep: router.sync_client(dep).chat.completions.create(
+                model=dep.deployment,
                 messages=[
                     {"role": "system", "content": "You are a text analysis expert."},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=500,
                 temperature=0.3
-            )
+            ))
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error analyzing text: {str(e)}")
@@ -75,10 +98,11 @@ class AzureOpenAIManager:
             list: The embedding vector
         """
         try:
-            response = self.client.embeddings.create(
-                model=self.embedding_deployment,
+            router = get_router()
+            response = router.call_sync("embedding", lambda dep: router.sync_client(dep).embeddings.create(
+                model=dep.deployment,
                 input=text
-            )
+            ))
             return response.data[0].embedding
         except Exception as e:
             print(f"Error generating embeddings: {str(e)}")
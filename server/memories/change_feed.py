@@ -0,0 +1,440 @@
+"""Cosmos DB change-feed projector for the memories container.
+
+Writes reach the memories container from several places (process_memory, the dashboard,
+seed scripts, other workers). Rather than having each writer update every derived structure,
+this module tails the container's change feed and streams inserts / updates / deletes in
+batches to pluggable sinks:
+
+  * VectorIndexSink   -> memories.local_index.vector_index  (in-process NumPy index)
+  * LexicalIndexSink  -> memories.local_index.lexical_index (in-process BM25 index)
+  * CacheSink         -> invalidation callbacks registered by in-process caches
+  * GraphitiSink      -> ingests changed memories as Graphiti episodes
+
+The local indexes only serve the process that holds them (retrieve_memories falls back to them
+when Cosmos vector search or query embedding fails), so they belong to the in-process projector
+(CHANGE_FEED_IN_PROCESS_SINKS, default vector,lexical); the standalone worker defaults to graphiti.
+
+Checkpoints:
+  * CosmosLeaseStore keeps the continuation token + an expiring ownership lease in the
+    COSMOS_LEASES_CONTAINER so a standalone worker (`manage.py run_change_feed`) resumes
+    where it stopped and two workers never project the same feed concurrently.
+  * InMemoryCheckpointStore is used by the in-process projector (CHANGE_FEED_IN_PROCESS=1),
+    which rebuilds its local indexes from the beginning of the feed on startup.
+
+Deletes:
+  * In the default LatestVersion mode Cosmos does not emit hard deletes, so soft-deleted
+    documents (`deleted: true`, see consolidation tombstones) are projected as deletes.
+  * With CHANGE_FEED_MODE=AllVersionsAndDeletes (must be enabled on the account) hard deletes
+    are projected as well.
+
+Lag metrics (memories.metrics):
+  change_feed.lag_seconds{processor}   now - _ts of the newest change seen in the last batch
+  change_feed.events{processor,op}     number of upserts / deletes projected
+  change_feed.batch_ms{processor}      wall time spent applying each batch
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from . import graphiti_loop, metrics
+from .cosmos_db import BaseCosmosDBManager, MemoriesDBManager
+from .graph_groups import group_for_user
+from .local_index import doc_meta, lexical_index, vector_index
+
+
+class ChangeBatch:
+    """A batch of projected changes: full documents upserted and ids deleted."""
+
+    def __init__(self, upserts: list[dict] | None = None, deletes: list[str] | None = None):
+        self.upserts = upserts or []
+        self.deletes = deletes or []
+
+    def __len__(self):
+        return len(self.upserts) + len(self.deletes)
+
+
+# -----------------------------
+# Sinks
+# -----------------------------
+class ChangeFeedSink:
+    """Base class for change-feed consumers. Subclasses override `apply`."""
+
+    name = "base"
+
+    def apply(self, batch: ChangeBatch) -> None:  # pragma: no cover - interface
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class VectorIndexSink(ChangeFeedSink):
+    name = "vector"
+
+    def __init__(self, index=None):
+        self.index = index or vector_index
+
+    def apply(self, batch: ChangeBatch) -> None:
+        for doc in batch.upserts:
+            self.index.upsert(doc["id"], doc.get("embedding"), meta=doc_meta(doc))
+        for doc_id in batch.deletes:
+            self.index.delete(doc_id)
+
+
+class LexicalIndexSink(ChangeFeedSink):
+    name = "lexical"
+
+    def __init__(self, index=None):
+        self.index = index or lexical_index
+
+    def apply(self, batch: ChangeBatch) -> None:
+        for doc in batch.upserts:
+            self.index.upsert(doc["id"], doc.get("content") or "", meta=doc_meta(doc))
+        for doc_id in batch.deletes:
+            self.index.delete(doc_id)
+
+
+_cache_invalidators: list = []
+
+
+def register_cache_invalidator(callback) -> None:
+    """Register `callback(changed_ids: list[str], docs: list[dict])` to run for every batch."""
+    if callback not in _cache_invalidators:
+        _cache_invalidators.append(callback)
+
+
+class CacheSink(ChangeFeedSink):
+    """Fans each batch out to invalidation callbacks registered by in-process caches."""
+
+    name = "cache"
+
+    def apply(self, batch: ChangeBatch) -> None:
+        changed_ids = [d["id"] for d in batch.upserts] + list(batch.deletes)
+        for callback in list(_cache_invalidators):
+            try:
+                callback(changed_ids, batch.upserts)
+            except Exception as e:
+                print(f"[change_feed] Cache invalidator {callback!r} failed: {e}")
+
+
+class GraphitiSink(ChangeFeedSink):
+    """Ingest new/changed memory content as Graphiti episodes.
+
+    process_memory and add-with-graphiti ingest their own writes and flag them
+    `graphiti_synced: true`, so those are skipped; everything else (dashboard edits, which reset
+    the flag, scripts, imports) is ingested here. Graphiti has no episode delete by content, so
+    deletes are only counted (change_feed.graphiti_deletes).
+    """
+
+    name = "graphiti"
+
+    def apply(self, batch: ChangeBatch) -> None:
+        from .views import ingest_graphiti_episode  # local import to avoid circular dependency
+
+        if batch.deletes:
+            metrics.incr("change_feed.graphiti_deletes", len(batch.deletes))
+        docs = [d for d in batch.upserts if d.get("content") and not d.get("graphiti_synced")]
+        if not docs:
+            return
+
+        async def _ingest_all():
+            results = await asyncio.gather(
+                *(ingest_graphiti_episode(d["content"], source_desc="change_feed", group_id=group_for_user(d.get("userId")))
+                  for d in docs),
+                return_exceptions=True,
+            )
+            for doc, res in zip(docs, results):
+                if isinstance(res, Exception):
+                    metrics.incr("change_feed.graphiti_errors")
+                    print(f"[change_feed] Graphiti ingestion failed id={doc.get('id')}: {res}")
+
+        # The shared Graphiti loop keeps the singleton's driver pool warm across batches
+        graphiti_loop.run(_ingest_all(), timeout=0)
+
+
+SINK_CLASSES = {
+    VectorIndexSink.name: VectorIndexSink,
+    LexicalIndexSink.name: LexicalIndexSink,
+    CacheSink.name: CacheSink,
+    GraphitiSink.name: GraphitiSink,
+}
+
+
+def build_sinks(names) -> list[ChangeFeedSink]:
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SINK_CLASSES]
+    if unknown:
+        raise ValueError(f"Unknown change feed sink(s): {', '.join(unknown)}")
+    return [SINK_CLASSES[n]() for n in names]
+
+
+# -----------------------------
+# Checkpoint / lease storage
+# -----------------------------
+class InMemoryCheckpointStore:
+    """Process-local checkpoint; used when derived state is itself process-local."""
+
+    def __init__(self):
+        self.continuation = None
+
+    def acquire(self) -> bool:
+        return True
+
+    def renew(self) -> bool:
+        return True
+
+    def load(self):
+        return self.continuation
+
+    def checkpoint(self, continuation) -> None:
+        self.continuation = continuation
+
+    def release(self) -> None:
+        pass
+
+
+class LeasesDBManager(BaseCosmosDBManager):
+    def __init__(self):
+        super().__init__(getattr(settings, "COSMOS_LEASES_CONTAINER", "leases"))
+
+
+class CosmosLeaseStore:
+    """Continuation checkpoint + ownership lease stored as one document per processor.
+
+    The lease document id is the processor name. Ownership is taken with an ETag-conditioned
+    replace so only one worker projects a given feed at a time; an expired lease can be stolen.
+    """
+
+    def __init__(self, processor_name: str, lease_seconds: int | None = None, db: LeasesDBManager | None = None):
+        self.processor_name = processor_name
+        self.lease_seconds = lease_seconds or getattr(settings, "CHANGE_FEED_LEASE_TTL_SECONDS", 60)
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.db = db or LeasesDBManager()
+        self._doc = None
+
+    def _read(self):
+        try:
+            return self.db.get_item(self.processor_name)
+        except Exception:
+            return None
+
+    def _write(self, doc: dict) -> bool:
+        from azure.core import MatchConditions
+        from azure.cosmos.exceptions import CosmosHttpResponseError
+
+        try:
+            if doc.get("_etag"):
+                self._doc = self.db.container.replace_item(
+                    item=doc["id"], body=doc, etag=doc["_etag"], match_condition=MatchConditions.IfNotModified
+                )
+            else:
+                self._doc = self.db.create_item(doc)
+            return True
+        except CosmosHttpResponseError as e:
+            # 412 (precondition failed) / 409 (conflict) -> someone else won the race
+            if e.status_code in (409, 412):
+                return False
+            raise
+
+    def acquire(self) -> bool:
+        now = time.time()
+        doc = self._read() or {"id": self.processor_name, "continuation": None}
+        holder = doc.get("owner")
+        if holder and holder != self.owner and doc.get("leaseExpiresAt", 0) > now:
+            return False
+        doc["owner"] = self.owner
+        doc["leaseExpiresAt"] = now + self.lease_seconds
+        return self._write(doc)
+
+    def renew(self) -> bool:
+        if self._doc is None or self._doc.get("owner") != self.owner:
+            return self.acquire()
+        doc = dict(self._doc)
+        doc["leaseExpiresAt"] = time.time() + self.lease_seconds
+        return self._write(doc)
+
+    def load(self):
+        doc = self._doc or self._read()
+        return (doc or {}).get("continuation")
+
+    def checkpoint(self, continuation) -> None:
+        if self._doc is None:
+            raise RuntimeError("Lease not acquired")
+        doc = dict(self._doc)
+        doc["continuation"] = continuation
+        doc["leaseExpiresAt"] = time.time() + self.lease_seconds
+        doc["checkpointedAt"] = datetime.now(timezone.utc).isoformat()
+        if not self._write(doc):
+            raise RuntimeError(f"Lost lease '{self.processor_name}' while checkpointing")
+
+    def release(self) -> None:
+        if self._doc is None or self._doc.get("owner") != self.owner:
+            return
+        doc = dict(self._doc)
+        doc["owner"] = None
+        doc["leaseExpiresAt"] = 0
+        try:
+            self._write(doc)
+        except Exception as e:
+            print(f"[change_feed] Failed to release lease: {e}")
+
+
+# -----------------------------
+# Projector
+# -----------------------------
+class ChangeFeedProjector:
+    """Poll the memories change feed and apply each page to all sinks, then checkpoint."""
+
+    def __init__(self, sinks: list[ChangeFeedSink], checkpoint_store=None, processor_name: str | None = None,
+                 batch_size: int | None = None, poll_interval: float | None = None, mode: str | None = None,
+                 start_from_beginning: bool = False, container=None):
+        self.sinks = sinks
+        self.processor_name = processor_name or getattr(settings, "CHANGE_FEED_PROCESSOR_NAME", "memories-projector")
+        self.checkpoint_store = checkpoint_store or InMemoryCheckpointStore()
+        self.batch_size = batch_size or getattr(settings, "CHANGE_FEED_BATCH_SIZE", 100)
+        self.poll_interval = poll_interval if poll_interval is not None else getattr(settings, "CHANGE_FEED_POLL_INTERVAL_SECONDS", 5)
+        self.mode = mode or getattr(settings, "CHANGE_FEED_MODE", "LatestVersion")
+        self.start_from_beginning = start_from_beginning
+        self.container = container or MemoriesDBManager().container
+
+    def _to_batch(self, items: list[dict]) -> tuple[ChangeBatch, float | None]:
+        """Split raw feed items into upserts/deletes (last write per id wins)."""
+        latest: dict[str, tuple[str, dict]] = {}
+        newest_ts = None
+        for item in items:
+            metadata = item.get("metadata") if isinstance(item.get("metadata"), dict) else None
+            if metadata is not None and ("current" in item or "previous" in item):
+                # AllVersionsAndDeletes shape: {current, previous, metadata: {operationType, ...}}
+                op = (metadata.get("operationType") or "").lower()
+                doc = item.get("current") or item.get("previous") or {}
+                ts = metadata.get("crts") or doc.get("_ts")
+                if op == "delete":
+                    doc_id = doc.get("id") or metadata.get("id")
+                    if doc_id:
+                        latest[doc_id] = ("delete", doc)
+                else:
+                    if doc.get("id"):
+                        latest[doc["id"]] = ("delete" if doc.get("deleted") else "upsert", doc)
+            else:
+                doc = item
+                ts = doc.get("_ts")
+                if doc.get("id"):
+                    latest[doc["id"]] = ("delete" if doc.get("deleted") else "upsert", doc)
+            if ts is not None:
+                newest_ts = ts if newest_ts is None else max(newest_ts, ts)
+        batch = ChangeBatch()
+        for doc_id, (op, doc) in latest.items():
+            if op == "delete":
+                batch.deletes.append(doc_id)
+            else:
+                batch.upserts.append(doc)
+        return batch, newest_ts
+
+    def _apply(self, batch: ChangeBatch) -> None:
+        for sink in self.sinks:
+            sink.apply(batch)
+
+    def run_once(self) -> int:
+        """Drain all currently available changes. Returns the number of changes applied."""
+        continuation = self.checkpoint_store.load()
+        kwargs = {"max_item_count": self.batch_size}
+        if continuation:
+            kwargs["continuation"] = continuation
+        else:
+            kwargs["start_time"] = "Beginning" if self.start_from_beginning else "Now"
+            kwargs["mode"] = self.mode
+
+        applied = 0
+        saved = continuation
+        feed = self.container.query_items_change_feed(**kwargs)
+        for page in feed.by_page():
+            items = list(page)
+            # Continuation for the change feed is surfaced as the etag of the last response
+            token = self.container.client_connection.last_response_headers.get("etag")
+            if items:
+                batch, newest_ts = self._to_batch(items)
+                started = time.perf_counter()
+                self._apply(batch)
+                metrics.observe("change_feed.batch_ms", (time.perf_counter() - started) * 1000.0,
+                                processor=self.processor_name)
+                metrics.incr("change_feed.events", len(batch.upserts), processor=self.processor_name, op="upsert")
+                metrics.incr("change_feed.events", len(batch.deletes), processor=self.processor_name, op="delete")
+                if newest_ts is not None:
+                    metrics.set_gauge("change_feed.lag_seconds", max(0.0, time.time() - float(newest_ts)),
+                                      processor=self.processor_name)
+                applied += len(batch)
+            if token and token != saved:
+                self.checkpoint_store.checkpoint(token)
+                saved = token
+        # An empty poll (e.g. start_time="Now" with no writes yet) yields no pages but still
+        # returns a continuation; save it so the next poll resumes from here rather than "Now"
+        token = self.container.client_connection.last_response_headers.get("etag")
+        if token and token != saved:
+            self.checkpoint_store.checkpoint(token)
+        if applied == 0:
+            # Caught up with the head of the feed
+            metrics.set_gauge("change_feed.lag_seconds", 0.0, processor=self.processor_name)
+        return applied
+
+    def run_forever(self, stop_event: threading.Event | None = None) -> None:
+        stop_event = stop_event or threading.Event()
+        print(f"[change_feed] Projector '{self.processor_name}' starting sinks={[s.name for s in self.sinks]}")
+        owns_lease = False
+        try:
+            while not stop_event.is_set():
+                owns_lease = self.checkpoint_store.renew() if owns_lease else self.checkpoint_store.acquire()
+                if not owns_lease:
+                    print(f"[change_feed] Lease '{self.processor_name}' held by another worker; waiting")
+                    stop_event.wait(self.poll_interval)
+                    continue
+                try:
+                    applied = self.run_once()
+                    if applied:
+                        print(f"[change_feed] Applied {applied} changes")
+                except Exception as e:
+                    metrics.incr("change_feed.errors", processor=self.processor_name)
+                    print(f"[change_feed] Batch failed (will retry): {e}")
+                stop_event.wait(self.poll_interval)
+        finally:
+            self.checkpoint_store.release()
+            for sink in self.sinks:
+                sink.close()
+
+
+_background_thread: threading.Thread | None = None
+_background_stop = threading.Event()
+
+
+def start_background_projector() -> None:
+    """Start an in-process projector thread that keeps this process's local indexes current.
+
+    Local indexes are empty at startup, so the in-process projector replays the feed from the
+    beginning with a process-local checkpoint (no lease needed).
+    """
+    global _background_thread
+    if _background_thread is not None and _background_thread.is_alive():
+        return
+    sink_names = getattr(settings, "CHANGE_FEED_IN_PROCESS_SINKS", "vector,lexical")
+    projector = ChangeFeedProjector(
+        build_sinks(sink_names),
+        checkpoint_store=InMemoryCheckpointStore(),
+        processor_name=f"in-process-{os.getpid()}",
+        start_from_beginning=True,
+    )
+    _background_thread = threading.Thread(
+        target=projector.run_forever, args=(_background_stop,), name="change-feed-projector", daemon=True
+    )
+    _background_thread.start()
+
+
+def stop_background_projector() -> None:
+    _background_stop.set()
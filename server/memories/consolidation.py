@@ -0,0 +1,260 @@
+"""Offline consolidation of near-duplicate memories.
+
+`decide_action` only compares a new candidate against its single best neighbour, so over time
+overlapping facts accumulate. This job works over a user's whole corpus instead:
+
+  1. Load the user's live memories (id, content, embedding). Across all users, each user's
+     memories are clustered separately; a cluster never spans two userIds.
+  2. Compute cosine similarities in blocks (X[i:i+B] @ X[j:j+B].T on normalized float32
+     embeddings) so memory stays O(B^2) regardless of corpus size, and union every pair at or
+     above the threshold into clusters.
+  3. Merge each cluster with ONE LLM call and re-embed the merged text.
+  4. Write merged memories and tombstones for the originals in bulk (concurrent upserts).
+
+Merged memories are written with `graphiti_synced: true`: the graph already holds the members'
+facts, so the change-feed GraphitiSink does not re-ingest them as new episodes.
+
+Tombstones are soft deletes (`deleted: true`, `merged_into`, optional `ttl`) without an
+embedding, so vector search skips them and the change-feed projector treats them as deletes.
+
+Entry point: `python manage.py consolidate_memories --user <id> [--dry-run]`.
+"""
+from __future__ import annotations
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .azure_openai import azure_openai
+from .cosmos_db import MemoriesDBManager
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def load_user_memories(db: MemoriesDBManager, user_id: str | None) -> list[dict]:
+    """Fetch live memories (with embeddings) for a user, or for all users when user_id is None."""
+    where = ["(NOT IS_DEFINED(c.deleted) OR c.deleted = false)", "IS_DEFINED(c.embedding)"]
+    parameters = []
+    if user_id:
+        where.append("c.userId = @user_id")
+        parameters.append({"name": "@user_id", "value": user_id})
+    query = (
+        "SELECT c.id, c.content, c.embedding, c.userId, c.conversationId, c.created_at, c.updated_at "
+        f"FROM c WHERE {' AND '.join(where)}"
+    )
+    return list(db.container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True))
+
+
+def find_clusters(embeddings: np.ndarray, threshold: float, block_size: int = 1024) -> list[list[int]]:
+    """Return clusters (lists of row indices, size >= 2) of rows with cosine >= threshold.
+
+    Only the upper triangle of the similarity matrix is computed, one block pair at a time.
+    """
+    n = embeddings.shape[0]
+    if n < 2:
+        return []
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    x = (embeddings / norms).astype(np.float32, copy=False)
+
+    uf = _UnionFind(n)
+    for i in range(0, n, block_size):
+        xi = x[i:i + block_size]
+        for j in range(i, n, block_size):
+            sims = xi @ x[j:j + block_size].T
+            if i == j:
+                # Ignore the diagonal and lower triangle within the same block
+                sims = np.triu(sims, k=1)
+            rows, cols = np.nonzero(sims >= threshold)
+            for r, c in zip(rows.tolist(), cols.tolist()):
+                uf.union(i + r, j + c)
+
+    groups: dict[int, list[int]] = {}
+    for idx in range(n):
+        groups.setdefault(uf.find(idx), []).append(idx)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def _split_oversized(members: list[int], embeddings: np.ndarray, max_size: int) -> list[list[int]]:
+    """Chunk a transitive cluster that grew too large, ordered by closeness to its centroid."""
+    if len(members) <= max_size:
+        return [members]
+    vecs = embeddings[members]
+    centroid = vecs.mean(axis=0)
+    order = np.argsort(-(vecs @ centroid))
+    ordered = [members[k] for k in order.tolist()]
+    chunks = [ordered[k:k + max_size] for k in range(0, len(ordered), max_size)]
+    return [c for c in chunks if len(c) > 1]
+
+
+def merge_cluster_text(docs: list[dict]) -> str | None:
+    """Merge a cluster of memories into a single memory with one LLM call."""
+    ordered = sorted(docs, key=lambda d: d.get("created_at") or "")
+    listing = "\n".join(f"- ({d.get('created_at') or 'unknown date'}) {d.get('content')}" for d in ordered)
+    prompt = (
+        "You consolidate overlapping user memories into one memory.\n"
+        "Keep every distinct fact, drop repetition, and when statements conflict keep the most recent one.\n"
+        "Return ONLY the consolidated memory text (one to three sentences).\n\n"
+        f"Memories (oldest first):\n{listing}"
+    )
+    merged = azure_openai.generate_completion(prompt, max_tokens=300, temperature=0)
+    return merged.strip() if merged else None
+
+
+def consolidate(user_id: str | None = None, threshold: float | None = None, block_size: int | None = None,
+                max_cluster_size: int | None = None, dry_run: bool = False, concurrency: int | None = None,
+                db: MemoriesDBManager | None = None) -> dict:
+    """Cluster and merge near-duplicate memories. Returns a report dict."""
+    threshold = threshold if threshold is not None else getattr(settings, "CONSOLIDATION_SIMILARITY_THRESHOLD", 0.9)
+    block_size = block_size or getattr(settings, "CONSOLIDATION_BLOCK_SIZE", 1024)
+    max_cluster_size = max_cluster_size or getattr(settings, "CONSOLIDATION_MAX_CLUSTER_SIZE", 8)
+    concurrency = concurrency or getattr(settings, "CONSOLIDATION_CONCURRENCY", 8)
+    tombstone_ttl = getattr(settings, "CONSOLIDATION_TOMBSTONE_TTL_SECONDS", 0)
+    db = db or MemoriesDBManager()
+
+    docs = load_user_memories(db, user_id)
+    report = {
+        "user_id": user_id,
+        "dry_run": dry_run,
+        "threshold": threshold,
+        "memories_scanned": len(docs),
+        "clusters": [],
+        "merged": 0,
+        "tombstoned": 0,
+        "errors": [],
+    }
+    print(f"[consolidation] Loaded {len(docs)} memories user={user_id or '*'}")
+    if len(docs) < 2:
+        return report
+
+    # Embeddings of different dimensions cannot be compared; keep the dominant dimension only.
+    dims = [len(d["embedding"]) for d in docs]
+    dim = max(set(dims), key=dims.count)
+    docs = [d for d in docs if len(d["embedding"]) == dim]
+    embeddings = np.asarray([d["embedding"] for d in docs], dtype=np.float32)
+
+    # Cluster per user: merging writes one userId and tombstones every member
+    by_user: dict[str | None, list[int]] = {}
+    for k, d in enumerate(docs):
+        by_user.setdefault(d.get("userId"), []).append(k)
+    clusters = []
+    for rows in by_user.values():
+        for members in find_clusters(embeddings[rows], threshold, block_size):
+            clusters.extend(_split_oversized([rows[m] for m in members], embeddings, max_cluster_size))
+    print(f"[consolidation] Found {len(clusters)} clusters covering {sum(len(c) for c in clusters)} memories")
+
+    for members in clusters:
+        report["clusters"].append({
+            "size": len(members),
+            "members": [{"id": docs[k]["id"], "content": docs[k].get("content")} for k in members],
+        })
+    if dry_run or not clusters:
+        return report
+
+    def _merge(cluster_idx: int):
+        members = [docs[k] for k in clusters[cluster_idx]]
+        owners = {d.get("userId") for d in members}
+        if len(owners) != 1:
+            raise RuntimeError(f"cluster spans several users {sorted(map(str, owners))}; not merged")
+        merged_text = merge_cluster_text(members)
+        if not merged_text:
+            raise RuntimeError("merge LLM call returned no text")
+        embedding = azure_openai.generate_embeddings(merged_text)
+        if embedding is None:
+            raise RuntimeError("failed to embed merged memory")
+        latest = max(members, key=lambda d: d.get("created_at") or "")
+        now = datetime.utcnow().isoformat()
+        merged_doc = {
+            "id": str(uuid.uuid4()),
+            "userId": latest.get("userId"),
+            "conversationId": latest.get("conversationId"),
+            "content": merged_text,
+            "embedding": embedding,
+            "created_at": min((d.get("created_at") or now) for d in members),
+            "updated_at": now,
+            "merged_from": [d["id"] for d in members],
+            # Every member's facts already reached the graph; the change-feed GraphitiSink must not
+            # ingest the restated text again as a new episode
+            "graphiti_synced": True,
+        }
+        tombstones = []
+        for d in members:
+            tomb = {
+                "id": d["id"],
+                "userId": d.get("userId"),
+                "conversationId": d.get("conversationId"),
+                "content": d.get("content"),
+                "deleted": True,
+                "merged_into": merged_doc["id"],
+                "deleted_at": now,
+            }
+            if tombstone_ttl:
+                tomb["ttl"] = tombstone_ttl
+            tombstones.append(tomb)
+        return cluster_idx, merged_doc, tombstones
+
+    merged_docs: list[dict] = []
+    tombstones_by_merge: dict[str, list[dict]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_merge, idx) for idx in range(len(clusters))]
+        for fut in futures:
+            try:
+                idx, merged_doc, tombstones = fut.result()
+            except Exception as e:
+                report["errors"].append(str(e))
+                print(f"[consolidation] Merge failed: {e}")
+                continue
+            report["clusters"][idx]["merged_id"] = merged_doc["id"]
+            report["clusters"][idx]["merged_content"] = merged_doc["content"]
+            merged_docs.append(merged_doc)
+            tombstones_by_merge[merged_doc["id"]] = tombstones
+
+        # Phase 1: merged memories. Phase 2: tombstones only for merges that were written,
+        # so a failed write never leaves originals deleted without their replacement.
+        upsert = _safe_upsert(db)
+        written = []
+        for doc, error in zip(merged_docs, pool.map(upsert, merged_docs)):
+            if error is not None:
+                report["errors"].append(f"write {doc['id']}: {error}")
+            else:
+                report["merged"] += 1
+                written.append(doc["id"])
+        tombstones = [t for merged_id in written for t in tombstones_by_merge[merged_id]]
+        for doc, error in zip(tombstones, pool.map(upsert, tombstones)):
+            if error is not None:
+                report["errors"].append(f"tombstone {doc['id']}: {error}")
+            else:
+                report["tombstoned"] += 1
+
+    metrics.incr("consolidation.merged", report["merged"])
+    metrics.incr("consolidation.tombstoned", report["tombstoned"])
+    print(f"[consolidation] Wrote {report['merged']} merged memories and {report['tombstoned']} tombstones")
+    return report
+
+
+def _safe_upsert(db: MemoriesDBManager):
+    def _upsert(doc: dict):
+        try:
+            db.upsert_item(doc)
+            return None
+        except Exception as e:
+            return str(e)
+    return _upsert
@@ -0,0 +1,131 @@
+"""Bounded hierarchical conversation summaries.
+
+Instead of rewriting one ever-growing summary on every message, each summary doc (summaries
+container, id = conversationId) keeps two bounded sections:
+
+  longTermSummary       compacted history, at most SUMMARY_LONG_TERM_MAX_TOKENS
+  recentSummary         incrementally updated section; once it exceeds SUMMARY_RECENT_MAX_TOKENS
+                        it is compacted into longTermSummary and starts again empty
+  summary               longTermSummary + recentSummary, for readers of the doc
+  lastNMessages         rolling window of raw messages
+  messagesSinceSummary  trailing messages in lastNMessages not yet folded into recentSummary
+
+The recent section is updated every SUMMARY_UPDATE_EVERY_N messages from the messages in the
+window, so an update only ever sees bounded inputs and the per-message summary cost stays flat.
+Docs written before this scheme (only `summary`) are read as a recent section.
+"""
+from __future__ import annotations
+
+import re
+
+from django.conf import settings
+
+from . import metrics
+from .prompt_budget import PromptBudget, count_tokens, get_max_output_tokens, truncate_tokens
+
+
+def window_size() -> int:
+    """lastNMessages must hold every message since the last update, deferred ones included."""
+    return max(
+        getattr(settings, "SUMMARY_LAST_N_MESSAGES", 5),
+        getattr(settings, "SUMMARY_UPDATE_EVERY_N", 3) + getattr(settings, "MEMORABILITY_MAX_PENDING", 5),
+    )
+
+
+def sections(doc: dict | None) -> tuple[str, str]:
+    """Return (long_term, recent) for a summary doc."""
+    if not doc:
+        return "", ""
+    if "recentSummary" not in doc and "longTermSummary" not in doc:
+        return "", doc.get("summary", "") or ""
+    return doc.get("longTermSummary", "") or "", doc.get("recentSummary", "") or ""
+
+
+def compose(long_term: str, recent: str) -> str:
+    return "\n\n".join(part for part in (long_term, recent) if part)
+
+
+def record_message(doc: dict, message: str) -> dict:
+    doc["lastNMessages"] = (doc.get("lastNMessages", []) + [message])[-window_size():]
+    doc["messagesSinceSummary"] = doc.get("messagesSinceSummary", 0) + 1
+    return doc
+
+
+def update_due(doc: dict) -> bool:
+    long_term, recent = sections(doc)
+    if not long_term and not recent:
+        return True
+    return doc.get("messagesSinceSummary", 0) >= getattr(settings, "SUMMARY_UPDATE_EVERY_N", 3)
+
+
+def unsummarized_messages(doc: dict) -> list[str]:
+    since = doc.get("messagesSinceSummary", 0)
+    return doc.get("lastNMessages", [])[-since:] if since else []
+
+
+def apply_update(doc: dict, recent: str) -> dict:
+    long_term, _ = sections(doc)
+    doc["longTermSummary"] = long_term
+    doc["recentSummary"] = recent
+    doc["summary"] = compose(long_term, recent)
+    doc["messagesSinceSummary"] = 0
+    return doc
+
+
+_WORD = re.compile(r"[^\W\d_]{3,}")
+
+
+def summary_drift(previous: str, message: str, updated: str) -> float:
+    """Fraction of the updated summary's words found in neither the previous summary nor the message.
+
+    Near 0 when an update only folds the message in; higher when the model rephrased or resolved
+    references in a way that could change what was extracted from the message.
+    """
+    words = {w.lower() for w in _WORD.findall(updated or "")}
+    if not words:
+        return 0.0
+    known = {w.lower() for w in _WORD.findall(f"{previous or ''} {message or ''}")}
+    return len(words - known) / len(words)
+
+
+def needs_compaction(doc: dict) -> bool:
+    _, recent = sections(doc)
+    return count_tokens(recent) > getattr(settings, "SUMMARY_RECENT_MAX_TOKENS", 400)
+
+
+COMPACTION_PROMPT = (
+    "Merge the long-term summary and the recent summary of a conversation into a single updated "
+    "long-term summary. Keep durable facts, decisions and open threads; drop small talk and detail "
+    "that no longer matters. Stay under {max_words} words.\n\n"
+    "Long-term summary:\n{long_term}\n\n"
+    "Recent summary:\n{recent}\n\n"
+    "Updated long-term summary:"
+)
+
+
+async def compact(doc: dict, generate) -> dict:
+    """Fold recentSummary into longTermSummary.
+
+    Args:
+        doc: summary doc, updated in place.
+        generate: async callable(prompt, max_tokens) -> str.
+    """
+    long_term, recent = sections(doc)
+    max_tokens = getattr(settings, "SUMMARY_LONG_TERM_MAX_TOKENS", 600)
+    budget = PromptBudget("summary_compaction")
+    budget.fixed(COMPACTION_PROMPT)
+    recent_part = budget.fit(recent, max_tokens=budget.budget // 2)
+    long_term_part = budget.fit(long_term)
+    budget.finish()
+    prompt = COMPACTION_PROMPT.format(
+        max_words=int(max_tokens * 0.75), long_term=long_term_part, recent=recent_part
+    )
+    compacted = (await generate(prompt, min(max_tokens, get_max_output_tokens("summary_compaction")))).strip()
+    # The output cap already bounds the section; this guards against an oversized cap override
+    doc["longTermSummary"] = truncate_tokens(compacted, max_tokens)
+    doc["recentSummary"] = ""
+    doc["summary"] = doc["longTermSummary"]
+    doc["compactions"] = doc.get("compactions", 0) + 1
+    metrics.incr("conversation_summary.compactions")
+    print(f"[conversation_summary] Compacted summary id={doc.get('id')} compactions={doc['compactions']}")
+    return doc
@@ -43,8 +43,10 @@ class MemoriesDBManager(BaseCosmosDBManager):
             c.created_at,
             c.updated_at,
             c.embedding,
+            c._etag,
             VectorDistance(c.embedding, @query_vector) AS distance
         FROM c
+        WHERE NOT IS_DEFINED(c.deleted) OR c.deleted = false
         ORDER BY VectorDistance(c.embedding, @query_vector)
         """
 
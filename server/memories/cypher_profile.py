@@ -0,0 +1,157 @@
+"""Cypher timing and sampled PROFILE for the Graphiti Neo4j driver.
+
+`instrument(driver)` wraps `driver.execute_query` (installed on the Graphiti singleton by
+get_graphiti, so Graphiti's own queries, graphiti_client maintenance queries and the scripts
+using `g.driver.execute_query` are all covered). Every query is timed and attributed to a
+fingerprint: the Cypher with string/number literals replaced by `?` and whitespace collapsed,
+hashed to 10 hex chars. Parameters are never logged.
+
+A CYPHER_PROFILE_SAMPLE_RATE fraction of queries runs as `PROFILE <query>` instead. PROFILE
+executes the query exactly once and returns the same records, plus a plan annotated with db hits
+and rows per operator; the totals are logged with the fingerprint:
+
+    [cypher_profile] fp=3f2a9c01be ms=41 rows=10 db_hits=18234 ops=NodeIndexSeek,Expand(All),... query=MATCH ...
+
+Queries slower than CYPHER_SLOW_QUERY_MS are logged too (without a plan unless sampled).
+Schema commands (CREATE/DROP INDEX, SHOW ...) and queries that already start with EXPLAIN,
+PROFILE or a CYPHER option prefix are never profiled.
+
+Metrics: cypher.queries{fingerprint}, cypher.latency_ms{fingerprint} (observation),
+cypher.rows{fingerprint}, cypher.db_hits{fingerprint} (profiled queries only), cypher.errors.
+Per-fingerprint totals are in `stats()` (GET /api/memories/metrics/ -> "cypher").
+"""
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_NOT_PROFILABLE = re.compile(r"^\s*(EXPLAIN|PROFILE|CYPHER|SHOW|CREATE\s+(INDEX|CONSTRAINT|FULLTEXT|VECTOR|RANGE|TEXT|POINT|LOOKUP)|DROP)\b", re.IGNORECASE)
+
+_stats: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def normalize(query: str) -> str:
+    """Cypher with literals replaced by `?` and whitespace collapsed."""
+    query = _STRING_LITERAL.sub("?", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    return " ".join(query.split())
+
+
+def fingerprint(query: str) -> str:
+    return hashlib.sha1(normalize(query).encode("utf-8")).hexdigest()[:10]
+
+
+def _profilable(query: str) -> bool:
+    return not _NOT_PROFILABLE.match(query)
+
+
+def _plan_totals(plan) -> tuple[int, list[str]]:
+    """(total db hits, operator types in pre-order) from a summary.profile plan dict."""
+    if not plan:
+        return 0, []
+    hits = int(plan.get("dbHits") or 0)
+    ops = [str(plan.get("operatorType", "?")).split("@")[0]]
+    for child in plan.get("children") or []:
+        child_hits, child_ops = _plan_totals(child)
+        hits += child_hits
+        ops.extend(child_ops)
+    return hits, ops
+
+
+def _row_count(result) -> int:
+    records = getattr(result, "records", None)
+    if records is None and isinstance(result, tuple) and result:
+        records = result[0]
+    try:
+        return len(records or [])
+    except TypeError:
+        return 0
+
+
+def _record(fp: str, query: str, elapsed_ms: float, rows: int, db_hits: int | None, ops: list[str] | None) -> None:
+    with _lock:
+        entry = _stats.setdefault(fp, {
+            "query": normalize(query)[:300], "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+            "profiled": 0, "db_hits": 0, "operators": [],
+        })
+        entry["calls"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["rows"] += rows
+        if db_hits is not None:
+            entry["profiled"] += 1
+            entry["db_hits"] += db_hits
+            entry["operators"] = ops or []
+    metrics.incr("cypher.queries", fingerprint=fp)
+    metrics.incr("cypher.rows", rows, fingerprint=fp)
+    metrics.observe("cypher.latency_ms", elapsed_ms, fingerprint=fp)
+    if db_hits is not None:
+        metrics.incr("cypher.db_hits", db_hits, fingerprint=fp)
+
+
+def instrument(driver) -> None:
+    """Wrap `driver.execute_query` once with timing and sampled PROFILE."""
+    if driver is None or getattr(driver, "_cypher_profiled", False):
+        return
+    execute_query = driver.execute_query
+
+    async def profiled_execute_query(cypher_query_, *args, **kwargs):
+        if not getattr(settings, "CYPHER_PROFILING_ENABLED", True):
+            return await execute_query(cypher_query_, *args, **kwargs)
+        query = str(cypher_query_)
+        fp = fingerprint(query)
+        sample_rate = getattr(settings, "CYPHER_PROFILE_SAMPLE_RATE", 0.0)
+        profile = sample_rate > 0 and random.random() < sample_rate and _profilable(query)
+        start = time.perf_counter()
+        try:
+            result = await execute_query(f"PROFILE {query}" if profile else cypher_query_, *args, **kwargs)
+        except Exception:
+            metrics.incr("cypher.errors", fingerprint=fp)
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        rows = _row_count(result)
+        db_hits = ops = None
+        if profile:
+            db_hits, ops = _plan_totals(getattr(getattr(result, "summary", None), "profile", None))
+        _record(fp, query, elapsed_ms, rows, db_hits, ops)
+        if profile or elapsed_ms >= getattr(settings, "CYPHER_SLOW_QUERY_MS", 1000):
+            plan = f" db_hits={db_hits} ops={','.join(ops[:8])}" if profile else ""
+            print(f"[cypher_profile] fp={fp} ms={elapsed_ms:.0f} rows={rows}{plan} query={normalize(query)[:160]}")
+        return result
+
+    driver.execute_query = profiled_execute_query
+    driver._cypher_profiled = True
+
+
+def stats(top: int = 10) -> dict:
+    """Fingerprints with the most total time, with averages and the last profiled plan's totals."""
+    with _lock:
+        entries = [(fp, dict(entry)) for fp, entry in _stats.items()]
+    entries.sort(key=lambda item: item[1]["total_ms"], reverse=True)
+    return {
+        "fingerprints": len(entries),
+        "top": [
+            {
+                "fingerprint": fp,
+                "query": e["query"],
+                "calls": e["calls"],
+                "avg_ms": round(e["total_ms"] / e["calls"], 1),
+                "max_ms": round(e["max_ms"], 1),
+                "avg_rows": round(e["rows"] / e["calls"], 1),
+                "profiled": e["profiled"],
+                "avg_db_hits": round(e["db_hits"] / e["profiled"]) if e["profiled"] else None,
+                "operators": e["operators"],
+            }
+            for fp, e in entries[:top]
+        ],
+    }
@@ -0,0 +1,95 @@
+"""Vectorized ADD / NO-OP / ambiguous decisions for a batch of candidate memories.
+
+process_memory extracts several atomic candidates per message. Instead of deciding each one
+against its best neighbour in a Python loop, the neighbour scores returned by the per-candidate
+vector searches are laid out as one (candidates x neighbours) matrix and thresholded at once:
+
+    best < MEMORY_DECISION_THRESHOLD_ADD     -> ADD
+    best >= MEMORY_DECISION_THRESHOLD_NOOP   -> NO-OP against the best neighbour
+    otherwise                                -> ambiguous, arbitrated by the LLM (UPDATE / DELETE)
+
+Scores are the ones `search_similar_memories` returns, so thresholds mean the same as in
+`decide_action`. Candidates from the same message that are near-duplicates of each other
+(cosine of their embeddings >= CANDIDATE_DEDUP_THRESHOLD) are dropped before deciding.
+`assign_actions` then turns the codes (plus the LLM's verdicts for the ambiguous ones) into
+actions, making sure no memory receives two conflicting changes.
+"""
+from __future__ import annotations
+
+import numpy as np
+from django.conf import settings
+
+ADD, NOOP, AMBIGUOUS = 0, 1, 2
+
+
+def dedupe_candidates(embeddings: list) -> list[int]:
+    """Return indices of candidates to keep, dropping later near-duplicates of earlier ones."""
+    if len(embeddings) < 2:
+        return list(range(len(embeddings)))
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    sims = matrix @ matrix.T
+    threshold = getattr(settings, "CANDIDATE_DEDUP_THRESHOLD", 0.95)
+    # A candidate is a duplicate if any earlier candidate is at least `threshold` similar
+    duplicate = np.triu(sims >= threshold, k=1).any(axis=0)
+    return [i for i in range(len(embeddings)) if not duplicate[i]]
+
+
+def score_matrix(neighbor_lists: list[list]) -> tuple[np.ndarray, list]:
+    """Build the (candidates x unique neighbours) score matrix from per-candidate search results.
+
+    `neighbor_lists[i]` is the [(memory, score), ...] list for candidate i. Neighbours a candidate's
+    search did not return score -inf for it. Returns (scores, neighbours) with neighbours in column order.
+    """
+    columns: dict[str, int] = {}
+    neighbours = []
+    for hits in neighbor_lists:
+        for memory, _ in hits:
+            if memory.id not in columns:
+                columns[memory.id] = len(neighbours)
+                neighbours.append(memory)
+    scores = np.full((len(neighbor_lists), len(neighbours)), -np.inf, dtype=np.float64)
+    for i, hits in enumerate(neighbor_lists):
+        for memory, score in hits:
+            scores[i, columns[memory.id]] = max(scores[i, columns[memory.id]], float(score))
+    return scores, neighbours
+
+
+def threshold_decisions(scores: np.ndarray, threshold_add: float | None = None,
+                        threshold_noop: float | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (codes, best_column, best_score) per candidate; best_column is -1 without neighbours."""
+    threshold_add = getattr(settings, "MEMORY_DECISION_THRESHOLD_ADD", 0.45) if threshold_add is None else threshold_add
+    threshold_noop = getattr(settings, "MEMORY_DECISION_THRESHOLD_NOOP", 0.85) if threshold_noop is None else threshold_noop
+    if scores.shape[1] == 0:
+        empty = np.full(scores.shape[0], -1)
+        return np.full(scores.shape[0], ADD), empty, np.full(scores.shape[0], -np.inf)
+    best_column = scores.argmax(axis=1)
+    best_score = scores[np.arange(scores.shape[0]), best_column]
+    codes = np.where(best_score < threshold_add, ADD, np.where(best_score >= threshold_noop, NOOP, AMBIGUOUS))
+    best_column = np.where(np.isfinite(best_score), best_column, -1)
+    return codes, best_column, best_score
+
+
+def assign_actions(codes, best_column, neighbour_ids: list[str], arbitrated: dict[int, str]) -> list[tuple[str, str | None]]:
+    """Return (action, target_id) per candidate: ADD, NO-OP, or the arbitrated UPDATE / DELETE.
+
+    A target gets at most one kind of change: several UPDATEs of one memory are merged later, but
+    an UPDATE or DELETE conflicting with an earlier claim on the same memory becomes an ADD. A
+    NO-OP writes nothing, so it never conflicts (turning it into ADD would store a duplicate).
+    """
+    actions = []
+    claimed: dict[str, str] = {}
+    for i, code in enumerate(codes):
+        if code == ADD:
+            action, target_id = "ADD", None
+        elif code == NOOP:
+            action, target_id = "NO-OP", neighbour_ids[best_column[i]]
+        else:
+            action, target_id = arbitrated[i], neighbour_ids[best_column[i]]
+        if (action in ("UPDATE", "DELETE") and target_id in claimed
+                and not (action == "UPDATE" and claimed[target_id] == "UPDATE")):
+            action, target_id = "ADD", None
+        if action in ("UPDATE", "DELETE"):
+            claimed[target_id] = action
+        actions.append((action, target_id))
+    return actions
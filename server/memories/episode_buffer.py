@@ -0,0 +1,266 @@
+"""Buffered Graphiti ingestion: many candidate memories per episode.
+
+Without buffering, process_memory ingests one episode per message, usually a single sentence,
+and Graphiti runs its whole extraction / dedupe pipeline (a dozen or so LLM calls) for each of
+them. With EPISODE_BUFFER_ENABLED, candidates are appended to a durable buffer per conversation
+(EPISODE_BUFFER_SCOPE=user: per user) and flushed as one episode once the buffer holds
+EPISODE_BUFFER_MAX_ITEMS candidates or EPISODE_BUFFER_MAX_CHARS characters, or its oldest
+candidate is EPISODE_BUFFER_MAX_AGE_SECONDS old.
+
+Buffers are Cosmos documents (`episode-buffer:<scope>:<id>` in EPISODE_BUFFER_CONTAINER, the
+change-feed leases container by default) updated with ETag-conditioned replaces. A flush is
+crash-safe in three steps:
+
+  1. claim   - move the pending items into `inflight` with a fresh episode name (one write)
+  2. ingest  - add the episode to Graphiti
+  3. complete - clear `inflight`
+
+If the process dies between 1 and 3, the inflight batch is picked up again once it is older than
+EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS; if the episode already reached the graph it is only
+cleared, so nothing is lost or ingested twice. Batches failing EPISODE_BUFFER_MAX_ATTEMPTS times
+are parked in `failedBatches` on the buffer document.
+
+The size thresholds are checked when candidates are added; age is checked by
+`manage.py flush_episode_buffers` (run it with --interval) and on the next add.
+Run `flush` / `flush_due` on the Graphiti loop (memories/graphiti_loop.py).
+
+Metrics: episode_buffer.items_added, episode_buffer.flushes{outcome},
+episode_buffer.items_per_episode (observation).
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from . import metrics
+from .cosmos_db import BaseCosmosDBManager
+from .graph_groups import group_for_user
+
+DOC_PREFIX = "episode-buffer:"
+DOC_TYPE = "episode_buffer"
+_MAX_WRITE_ATTEMPTS = 5
+
+
+class EpisodeBufferDBManager(BaseCosmosDBManager):
+    def __init__(self):
+        super().__init__(getattr(settings, "EPISODE_BUFFER_CONTAINER", None)
+                         or getattr(settings, "COSMOS_LEASES_CONTAINER", "leases"))
+
+
+class EpisodeBufferContention(RuntimeError):
+    pass
+
+
+def buffer_key(user_id: str, conversation_id: str) -> str:
+    if getattr(settings, "EPISODE_BUFFER_SCOPE", "conversation") == "user":
+        return f"user:{user_id}"
+    return f"conversation:{conversation_id}"
+
+
+def _doc_id(key: str) -> str:
+    return DOC_PREFIX + key
+
+
+def _is_due(doc: dict, now: float) -> bool:
+    items = doc.get("items") or []
+    if not items:
+        return False
+    return (
+        len(items) >= getattr(settings, "EPISODE_BUFFER_MAX_ITEMS", 20)
+        or doc.get("chars", 0) >= getattr(settings, "EPISODE_BUFFER_MAX_CHARS", 4000)
+        or now - (doc.get("firstAt") or now) >= getattr(settings, "EPISODE_BUFFER_MAX_AGE_SECONDS", 600)
+    )
+
+
+def _update(db, doc_id: str, mutate) -> dict | None:
+    """Read-modify-write `doc_id` with an ETag condition; `mutate` returns None to leave it unchanged."""
+    from azure.core import MatchConditions
+    from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+
+    for _ in range(_MAX_WRITE_ATTEMPTS):
+        try:
+            current = db.get_item(doc_id)
+        except CosmosResourceNotFoundError:
+            current = None
+        doc = mutate(copy.deepcopy(current) if current is not None else None)
+        if doc is None:
+            return None
+        try:
+            if current is not None:
+                return db.container.replace_item(
+                    item=doc_id, body=doc, etag=current["_etag"], match_condition=MatchConditions.IfNotModified
+                )
+            return db.create_item(doc)
+        except CosmosHttpResponseError as e:
+            # 412 (precondition failed) / 409 (conflict) -> another writer got there first; re-read
+            if e.status_code not in (409, 412):
+                raise
+    raise EpisodeBufferContention(f"{doc_id}: gave up after {_MAX_WRITE_ATTEMPTS} conflicting writes")
+
+
+def add(key: str, user_id: str, conversation_id: str, texts: list[str], db=None) -> dict:
+    """Append candidate memories to the buffer; returns {"pending", "due"}."""
+    texts = [t.strip() for t in texts if t and t.strip()]
+    db = db or EpisodeBufferDBManager()
+    now = time.time()
+
+    def append(doc):
+        if doc is None:
+            doc = {
+                "id": _doc_id(key), "type": DOC_TYPE, "key": key, "userId": user_id,
+                "conversationId": conversation_id, "items": [], "chars": 0, "firstAt": None,
+                "inflight": None, "flushedEpisodes": 0, "flushedItems": 0,
+            }
+        at = datetime.now(timezone.utc).isoformat()
+        doc["items"] = (doc.get("items") or []) + [{"text": t, "at": at} for t in texts]
+        doc["chars"] = doc.get("chars", 0) + sum(len(t) for t in texts)
+        doc["firstAt"] = doc.get("firstAt") or now
+        return doc
+
+    doc = _update(db, _doc_id(key), append) if texts else None
+    if doc is None:
+        try:
+            doc = db.get_item(_doc_id(key))
+        except Exception:
+            doc = {}
+    metrics.incr("episode_buffer.items_added", len(texts))
+    return {"pending": len(doc.get("items") or []), "due": _is_due(doc, now)}
+
+
+async def _episode_exists(name: str, since: str) -> bool:
+    from .graphiti_client import get_graphiti  # local import: graphiti_client imports graphiti_core
+
+    graphiti = await get_graphiti()
+    # The created_at range keeps this an index seek (schema v2) rather than a scan over every episode
+    records, _, _ = await graphiti.driver.execute_query(
+        "MATCH (e:Episodic) WHERE e.created_at >= datetime($since) AND e.name = $name RETURN e.uuid AS uuid LIMIT 1",
+        params={"since": since, "name": name},
+    )
+    return bool(records)
+
+
+async def flush(key: str, force: bool = False, db=None) -> str | None:
+    """Flush the buffer for `key` if due (or `force`); returns the ingested episode name, else None."""
+    from .views import ingest_graphiti_episode  # local import to avoid circular dependency
+
+    db = db or EpisodeBufferDBManager()
+    doc_id = _doc_id(key)
+    now = time.time()
+    timeout = getattr(settings, "EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS", 900)
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+
+    def claim(doc):
+        if doc is None:
+            return None
+        inflight = doc.get("inflight")
+        if inflight:
+            if now - inflight.get("startedAt", 0) < timeout:
+                return None  # another flush is (or recently was) working on it
+            doc["inflight"] = {**inflight, "startedAt": now, "owner": owner, "attempts": inflight.get("attempts", 1) + 1}
+            return doc
+        if not doc.get("items") or not (force or _is_due(doc, now)):
+            return None
+        batch_id = uuid.uuid4().hex
+        doc["inflight"] = {
+            "batchId": batch_id,
+            "name": f"memory-batch-{batch_id[:16]}",
+            "items": doc["items"],
+            "claimedAt": datetime.now(timezone.utc).isoformat(),
+            "startedAt": now,
+            "owner": owner,
+            "attempts": 1,
+        }
+        doc["items"], doc["chars"], doc["firstAt"] = [], 0, None
+        return doc
+
+    claimed = await asyncio.to_thread(_update, db, doc_id, claim)
+    if claimed is None:
+        return None
+    batch = claimed["inflight"]
+    items = batch["items"]
+
+    def complete(outcome: str):
+        def _complete(doc):
+            if doc is None or (doc.get("inflight") or {}).get("batchId") != batch["batchId"]:
+                return None
+            doc["inflight"] = None
+            if outcome == "failed":
+                doc["failedBatches"] = ((doc.get("failedBatches") or []) + [batch])[-10:]
+            else:
+                doc["flushedEpisodes"] = doc.get("flushedEpisodes", 0) + 1
+                doc["flushedItems"] = doc.get("flushedItems", 0) + len(items)
+                doc["lastFlushedAt"] = datetime.now(timezone.utc).isoformat()
+            return doc
+        return _complete
+
+    try:
+        if batch["attempts"] > 1 and await _episode_exists(batch["name"], batch["claimedAt"]):
+            outcome = "recovered"
+        else:
+            await ingest_graphiti_episode(
+                "\n".join(item["text"] for item in items),
+                source_desc="processed_memory_batch",
+                name=batch["name"],
+                reference_time=datetime.fromisoformat(items[0]["at"]),
+                group_id=group_for_user(claimed.get("userId")),
+            )
+            outcome = "ingested"
+    except Exception as e:
+        metrics.incr("episode_buffer.flushes", outcome="error")
+        if batch["attempts"] < getattr(settings, "EPISODE_BUFFER_MAX_ATTEMPTS", 5):
+            # Left inflight: retried once EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS have passed
+            print(f"[episode_buffer] Flush of {key} failed (attempt {batch['attempts']}): {e}")
+            raise
+        print(f"[episode_buffer] Flush of {key} failed {batch['attempts']} times; parking batch {batch['batchId']}: {e}")
+        await asyncio.to_thread(_update, db, doc_id, complete("failed"))
+        raise
+
+    await asyncio.to_thread(_update, db, doc_id, complete(outcome))
+    metrics.incr("episode_buffer.flushes", outcome=outcome)
+    metrics.observe("episode_buffer.items_per_episode", len(items))
+    print(f"[episode_buffer] Flushed {len(items)} candidate(s) from {key} as {batch['name']} ({outcome})")
+    return batch["name"]
+
+
+def due_keys(force: bool = False, db=None) -> list[str]:
+    """Buffers past EPISODE_BUFFER_MAX_AGE_SECONDS (any non-empty buffer with `force`) or with a stale inflight batch."""
+    db = db or EpisodeBufferDBManager()
+    now = time.time()
+    cutoff = now if force else now - getattr(settings, "EPISODE_BUFFER_MAX_AGE_SECONDS", 600)
+    stale = now - getattr(settings, "EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS", 900)
+    query = """
+    SELECT c.key FROM c
+    WHERE c.type = @type
+      AND ((ARRAY_LENGTH(c.items) > 0 AND c.firstAt <= @cutoff)
+           OR (IS_DEFINED(c.inflight) AND NOT IS_NULL(c.inflight) AND c.inflight.startedAt <= @stale))
+    """
+    parameters = [
+        {"name": "@type", "value": DOC_TYPE},
+        {"name": "@cutoff", "value": cutoff},
+        {"name": "@stale", "value": stale},
+    ]
+    rows = db.container.query_items(query=query, parameters=parameters, enable_cross_partition_query=True)
+    return [row["key"] for row in rows]
+
+
+async def flush_due(force: bool = False) -> dict:
+    """Flush every due buffer; returns {"flushed": [episode names], "errors": [...]}."""
+    db = EpisodeBufferDBManager()
+    keys = await asyncio.to_thread(due_keys, force, db)
+    flushed, errors = [], []
+    for key in keys:
+        try:
+            name = await flush(key, force=force, db=db)
+        except Exception as e:
+            errors.append(f"{key}: {e}")
+            continue
+        if name:
+            flushed.append(name)
+    return {"buffers": len(keys), "flushed": flushed, "errors": errors}
@@ -0,0 +1,101 @@
+"""Keyset-paginated listing of Graphiti episodes, newest first.
+
+Pages are ordered by (created_at DESC, uuid DESC) and continue from an opaque cursor encoding the
+last row's (created_at, uuid):
+
+    page = await list_episodes(limit=50)
+    page = await list_episodes(limit=50, cursor=page["next_cursor"])
+
+The predicate is a range on the bare `e.created_at` property, so Neo4j seeks the Episodic
+created_at range index (or the (group_id, created_at) index added by schema v2 when filtering by
+group) and reads index order instead of scanning and sorting every episode. Each page costs
+O(limit) regardless of how deep it is. Episodes without created_at (never written by graphiti-core)
+are not listed.
+
+`content` is only projected when asked for, optionally truncated to `content_chars`.
+Run on the Graphiti loop (memories/graphiti_loop.py).
+"""
+from __future__ import annotations
+
+import base64
+import json
+
+MAX_LIMIT = 500
+
+# Created by graphiti_client._ensure_schema (schema v2)
+EPISODE_LISTING_INDEXES = (
+    "CREATE INDEX episode_created_at IF NOT EXISTS FOR (e:Episodic) ON (e.created_at)",
+    "CREATE INDEX episode_group_created_at IF NOT EXISTS FOR (e:Episodic) ON (e.group_id, e.created_at)",
+)
+
+FIELDS = ("uuid", "name", "group_id", "source", "source_description", "created_at", "valid_at")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _iso(value) -> str | None:
+    if value is None:
+        return None
+    iso_format = getattr(value, "iso_format", None)  # neo4j.time.DateTime keeps nanoseconds
+    return iso_format() if iso_format else value.isoformat()
+
+
+def encode_cursor(created_at, uuid: str) -> str:
+    raw = json.dumps([_iso(created_at), uuid], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, uuid = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    if not isinstance(created_at, str) or not isinstance(uuid, str):
+        raise InvalidCursor("Invalid cursor")
+    return created_at, uuid
+
+
+def _query(group_id: str | None, cursor: bool, include_content: bool, content_chars: int | None) -> str:
+    where = ["e.created_at IS NOT NULL"]
+    if group_id is not None:
+        where.append("e.group_id = $group_id")
+    if cursor:
+        # The <= range drives the index seek; the OR only breaks ties on equal timestamps
+        where.append("e.created_at <= datetime($cursor_created_at)")
+        where.append("(e.created_at < datetime($cursor_created_at) OR e.uuid < $cursor_uuid)")
+    columns = [f"e.{field} AS {field}" for field in FIELDS]
+    if include_content:
+        columns.append("left(e.content, $content_chars) AS content" if content_chars else "e.content AS content")
+    return (
+        "MATCH (e:Episodic) "
+        f"WHERE {' AND '.join(where)} "
+        f"RETURN {', '.join(columns)} "
+        "ORDER BY e.created_at DESC, e.uuid DESC "
+        "LIMIT $limit"
+    )
+
+
+async def list_episodes(limit: int = 50, cursor: str | None = None, group_id: str | None = None,
+                        include_content: bool = False, content_chars: int | None = None) -> dict:
+    """Return {"episodes", "next_cursor"}; next_cursor is None on the last page."""
+    from .graphiti_client import get_graphiti  # local import: graphiti_client imports graphiti_core
+
+    limit = max(1, min(limit, MAX_LIMIT))
+    params = {"limit": limit + 1, "group_id": group_id, "content_chars": content_chars}
+    if cursor:
+        params["cursor_created_at"], params["cursor_uuid"] = decode_cursor(cursor)
+    graphiti = await get_graphiti()
+    records, _, _ = await graphiti.driver.execute_query(
+        _query(group_id, bool(cursor), include_content, content_chars), params=params,
+    )
+    rows = [dict(record) for record in records]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["uuid"]) if has_more else None
+    for row in rows:
+        row["created_at"] = _iso(row["created_at"])
+        row["valid_at"] = _iso(row["valid_at"])
+    return {"episodes": rows, "next_cursor": next_cursor}
@@ -0,0 +1,180 @@
+"""Graph-neighbourhood expansion of vector search hits.
+
+Vector search over Cosmos memories and Graphiti's graph never meet: a fact related to a hit but
+sharing no words with the query is only found by raising top_k a lot. `expand` maps the top
+GRAPH_EXPANSION_MAX_HITS hits to the Graphiti episodes holding their text (BM25 lookup on the
+`episode_content` full-text index that graphiti-core creates), then to the entities those episodes
+mention, and pulls the entities' 1-hop RELATES_TO facts - all in one Cypher query.
+
+Fan-out is capped at every step, so the cost is fixed by the settings rather than by the graph:
+
+    hits (GRAPH_EXPANSION_MAX_HITS)
+      x episodes per hit (GRAPH_EXPANSION_EPISODES_PER_HIT)
+      x entities per episode (GRAPH_EXPANSION_ENTITIES_PER_EPISODE)
+      x facts per entity (GRAPH_EXPANSION_FANOUT)
+
+The per-entity LIMIT is unordered, so Neo4j stops after GRAPH_EXPANSION_FANOUT relationships
+instead of reading every edge of a hub. Facts already extracted from the hit's own episode, and
+invalidated or expired facts, are skipped. Facts reached from several hits are merged, ranked by the
+number of hits supporting them (then the best hit's rank) and cut to GRAPH_EXPANSION_MAX_FACTS.
+
+Every returned fact and entity carries its provenance: the memory id, episode and entity it was
+reached through. Run `expand` on the Graphiti loop (memories/graphiti_loop.py).
+
+Metrics: graph_expansion.requests{outcome}, graph_expansion.latency_ms, graph_expansion.facts
+(observation).
+"""
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# Words of a memory used for its episode lookup (bounds the BM25 query)
+MAX_QUERY_WORDS = 32
+
+EXPANSION_QUERY = """
+UNWIND $hits AS hit
+CALL {
+    WITH hit
+    CALL db.index.fulltext.queryNodes('episode_content', hit.query, {limit: $episodes_per_hit})
+    YIELD node, score
+    RETURN node AS e, score
+}
+WITH hit, e, score
+// The Lucene query already carries the group; this only guards against analyzer surprises
+WHERE $group_id IS NULL OR e.group_id = $group_id
+CALL {
+    WITH e
+    MATCH (e)-[:MENTIONS]->(n:Entity)
+    RETURN n LIMIT $entities_per_episode
+}
+CALL {
+    WITH e, n
+    MATCH (n)-[r:RELATES_TO]-(m:Entity)
+    WHERE r.invalid_at IS NULL AND r.expired_at IS NULL AND NOT e.uuid IN coalesce(r.episodes, [])
+    WITH r, m LIMIT $fanout
+    RETURN collect({uuid: r.uuid, name: r.name, fact: r.fact, valid_at: r.valid_at,
+                    neighbour_uuid: m.uuid, neighbour: m.name}) AS facts
+}
+RETURN hit.id AS memory_id, hit.rank AS rank, e.uuid AS episode_uuid, e.name AS episode_name,
+       score AS episode_score, n.uuid AS entity_uuid, n.name AS entity_name, n.summary AS entity_summary, facts
+"""
+
+
+def _setting(name: str, default: int) -> int:
+    return int(getattr(settings, name, default))
+
+
+def _episode_query(text: str, group_id: str | None = None) -> str:
+    """BM25 query for the episodes holding `text`, restricted to `group_id` inside Lucene.
+
+    The group has to be part of the full-text query (as graphiti's own fulltext_query does): the
+    index returns at most GRAPH_EXPANSION_EPISODES_PER_HIT nodes, so filtering by group afterwards
+    would drop a hit whenever other groups' episodes rank above its own.
+    """
+    from graphiti_core.helpers import lucene_sanitize, validate_group_id  # local import: keeps graphiti_core off the import path
+
+    query = lucene_sanitize(" ".join(text.split()[:MAX_QUERY_WORDS]))
+    if not query or group_id is None:
+        return query
+    validate_group_id(group_id)
+    return f'group_id:"{group_id}" AND ({query})'
+
+
+def _iso(value) -> str | None:
+    if value is None:
+        return None
+    iso_format = getattr(value, "iso_format", None)  # neo4j.time.DateTime
+    return iso_format() if iso_format else value.isoformat()
+
+
+def _merge(rows: list[dict], max_facts: int) -> tuple[list[dict], list[dict]]:
+    """Deduplicate facts and entities across hits, keeping every path that reached them."""
+    facts: dict[str, dict] = {}
+    entities: dict[str, dict] = {}
+    for row in rows:
+        path = {"memory_id": row["memory_id"], "episode_uuid": row["episode_uuid"], "episode_name": row["episode_name"]}
+        entity = entities.setdefault(row["entity_uuid"], {
+            "uuid": row["entity_uuid"], "name": row["entity_name"], "summary": row["entity_summary"],
+            "rank": row["rank"], "via": [],
+        })
+        entity["rank"] = min(entity["rank"], row["rank"])
+        if path not in entity["via"]:
+            entity["via"].append(path)
+        for f in row["facts"] or []:
+            fact = facts.setdefault(f["uuid"], {
+                "uuid": f["uuid"], "name": f["name"], "fact": f["fact"], "valid_at": _iso(f["valid_at"]),
+                "rank": row["rank"], "via": [],
+            })
+            fact["rank"] = min(fact["rank"], row["rank"])
+            fact["via"].append({**path, "entity_uuid": row["entity_uuid"], "entity_name": row["entity_name"],
+                                "neighbour_uuid": f["neighbour_uuid"], "neighbour_name": f["neighbour"]})
+
+    def support(item):
+        return -len({p["memory_id"] for p in item["via"]}), item["rank"]
+
+    ranked_facts = sorted(facts.values(), key=support)[:max_facts]
+    ranked_entities = sorted(entities.values(), key=support)
+    for item in ranked_facts + ranked_entities:
+        del item["rank"]
+    return ranked_facts, ranked_entities
+
+
+async def expand(hits: list[dict], group_id: str | None = None) -> dict:
+    """Expand vector hits ({"id", "content", ...}, best first) into their graph neighbourhood.
+
+    Returns {"context", "facts", "entities", "cost"}: `context` lists the hits followed by the
+    ranked facts, each as {"type", "text", "provenance"}; `facts` / `entities` hold the full records
+    with every path (`via`) that reached them.
+    """
+    from .graphiti_client import get_graphiti  # local import: graphiti_client imports graphiti_core
+
+    max_hits = _setting("GRAPH_EXPANSION_MAX_HITS", 3)
+    seeds = [
+        {"id": hit["id"], "rank": rank, "query": _episode_query(hit.get("content") or "", group_id)}
+        for rank, hit in enumerate(hits[:max_hits])
+    ]
+    seeds = [seed for seed in seeds if seed["query"]]
+    rows: list[dict] = []
+    started = time.perf_counter()
+    if seeds:
+        graphiti = await get_graphiti()
+        try:
+            records, _, _ = await graphiti.driver.execute_query(EXPANSION_QUERY, params={
+                "hits": seeds,
+                "group_id": group_id,
+                "episodes_per_hit": _setting("GRAPH_EXPANSION_EPISODES_PER_HIT", 2),
+                "entities_per_episode": _setting("GRAPH_EXPANSION_ENTITIES_PER_EPISODE", 5),
+                "fanout": _setting("GRAPH_EXPANSION_FANOUT", 5),
+            })
+        except Exception:
+            metrics.incr("graph_expansion.requests", outcome="error")
+            raise
+        rows = [dict(record) for record in records]
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    facts, entities = _merge(rows, _setting("GRAPH_EXPANSION_MAX_FACTS", 20))
+
+    context = [
+        {"type": "memory", "text": hit.get("content"), "provenance": {"memory_id": hit["id"]}}
+        for hit in hits
+    ]
+    context += [
+        {"type": "fact", "text": fact["fact"], "provenance": {
+            "fact_uuid": fact["uuid"],
+            "memory_ids": list(dict.fromkeys(p["memory_id"] for p in fact["via"])),
+            "entities": list(dict.fromkeys(p["entity_name"] for p in fact["via"])),
+        }}
+        for fact in facts
+    ]
+    metrics.incr("graph_expansion.requests", outcome="ok")
+    metrics.observe("graph_expansion.latency_ms", latency_ms)
+    metrics.observe("graph_expansion.facts", len(facts))
+    return {
+        "context": context,
+        "facts": facts,
+        "entities": entities,
+        "cost": {"seeds": len(seeds), "rows": len(rows), "latency_ms": latency_ms},
+    }
@@ -0,0 +1,42 @@
+"""Graphiti group_id per user.
+
+Graphiti dedupes entities and searches candidates within a group_id. Episodes added without one all
+land in the default group (""), so dedupe and search cost grow with every user's data. Ingestion
+paths call `group_for_user` and pass the result to add_episode; per-user searches pass it as their
+group filter.
+
+GRAPHITI_GROUP_ID_TEMPLATE formats the user id into a group id (default "{user_id}"; e.g.
+"tenant-a-{user_id}"). Set it empty to keep one shared graph. Graphiti only accepts ASCII letters,
+digits, "-" and "_" in a group id, so other characters are replaced with "_" and a short hash of the
+original id is appended to keep distinct users apart.
+
+Episodes ingested before grouping was enabled stay in the default group until
+`manage.py regroup_graphiti_episodes` re-tags them (memories/graph_regroup.py).
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+
+from django.conf import settings
+
+_INVALID = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def group_for_user(user_id: str | None) -> str | None:
+    """Graphiti group_id for `user_id`; None (Graphiti's default group) without a user or template."""
+    template = getattr(settings, "GRAPHITI_GROUP_ID_TEMPLATE", "{user_id}")
+    if not template or not user_id:
+        return None
+    raw = template.format(user_id=user_id)
+    group_id = _INVALID.sub("_", raw)
+    if group_id != raw:
+        group_id = f"{group_id}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]}"
+    return group_id
+
+
+def resolve_group(group_id: str | None = None, user_id: str | None = None) -> str | None:
+    """An explicit `group_id` wins; otherwise the group of `user_id` (None = no group filter)."""
+    if group_id is not None:
+        return group_id
+    return group_for_user(user_id)
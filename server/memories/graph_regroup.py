@@ -0,0 +1,191 @@
+"""Re-tag Graphiti data ingested before per-user groups (memories/graph_groups.py).
+
+Episodes carry no user id, so each one is traced back through Cosmos: its content lines are the
+candidate memories process_memory (or the change feed) ingested, and the memories with that content
+carry `userId`. An episode whose lines all belong to one user moves to that user's group; episodes
+matching nobody go to `default_group` when given, and episodes matching several users stay put.
+
+Three keyset-paginated passes, `batch_size` rows per read and one UNWIND write per batch:
+
+  1. episodes  - Episodic.group_id (and their MENTIONS edges)
+  2. entities  - an Entity moves when every episode mentioning it is now in the same group;
+                 entities mentioned from several groups stay in `from_group` ("shared")
+  3. facts     - a RELATES_TO edge moves when both of its entities are in the same new group
+
+Every pass only reads rows still in `from_group`, so an interrupted run is resumed by running it
+again. Communities are not re-tagged; rebuild them per group afterwards. Search caches in running
+servers expire after GRAPH_SEARCH_CACHE_TTL_SECONDS. Run `regroup` on the Graphiti loop
+(memories/graphiti_loop.py); see `manage.py regroup_graphiti_episodes`.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+
+from .cosmos_db import MemoriesDBManager
+from .graph_groups import group_for_user
+
+# Contents per Cosmos ARRAY_CONTAINS lookup
+_LOOKUP_CHUNK = 100
+
+EPISODE_BATCH_QUERY = """
+MATCH (e:Episodic)
+WHERE e.group_id = $from_group AND e.uuid > $after
+RETURN e.uuid AS uuid, e.content AS content
+ORDER BY e.uuid
+LIMIT $limit
+"""
+
+EPISODE_WRITE_QUERY = """
+UNWIND $assignments AS a
+MATCH (e:Episodic {uuid: a.uuid})
+SET e.group_id = a.group_id
+WITH e, a
+OPTIONAL MATCH (e)-[m:MENTIONS]->(:Entity)
+SET m.group_id = a.group_id
+"""
+
+ENTITY_BATCH_QUERY = """
+MATCH (n:Entity)
+WHERE n.group_id = $from_group AND n.uuid > $after
+WITH n ORDER BY n.uuid LIMIT $limit
+OPTIONAL MATCH (e:Episodic)-[:MENTIONS]->(n)
+RETURN n.uuid AS uuid, collect(DISTINCT e.group_id) AS groups
+ORDER BY uuid
+"""
+
+ENTITY_WRITE_QUERY = """
+UNWIND $assignments AS a
+MATCH (n:Entity {uuid: a.uuid})
+SET n.group_id = a.group_id
+"""
+
+EDGE_BATCH_QUERY = """
+MATCH (a:Entity)-[r:RELATES_TO]->(b:Entity)
+WHERE r.group_id = $from_group AND r.uuid > $after
+RETURN r.uuid AS uuid, a.group_id AS source_group, b.group_id AS target_group
+ORDER BY r.uuid
+LIMIT $limit
+"""
+
+EDGE_WRITE_QUERY = """
+UNWIND $assignments AS a
+MATCH (:Entity)-[r:RELATES_TO {uuid: a.uuid}]->(:Entity)
+SET r.group_id = a.group_id
+"""
+
+
+def _candidate_texts(content: str) -> list[str]:
+    lines = [line.strip() for line in (content or "").splitlines() if line.strip()]
+    return list(dict.fromkeys(lines + [(content or "").strip()]))
+
+
+def lookup_users(texts: list[str], db=None) -> dict[str, set[str]]:
+    """Map each memory content in `texts` to the user ids of the Cosmos memories holding it."""
+    db = db or MemoriesDBManager()
+    users: dict[str, set[str]] = {}
+    texts = list(dict.fromkeys(t for t in texts if t))
+    for start in range(0, len(texts), _LOOKUP_CHUNK):
+        rows = db.container.query_items(
+            query="SELECT c.content, c.userId FROM c WHERE ARRAY_CONTAINS(@contents, c.content) AND IS_DEFINED(c.userId)",
+            parameters=[{"name": "@contents", "value": texts[start:start + _LOOKUP_CHUNK]}],
+            enable_cross_partition_query=True,
+        )
+        for row in rows:
+            if row.get("userId"):
+                users.setdefault(row["content"], set()).add(row["userId"])
+    return users
+
+
+async def _pages(driver, query: str, from_group: str, batch_size: int):
+    after = ""
+    while True:
+        records, _, _ = await driver.execute_query(
+            query, params={"from_group": from_group, "after": after, "limit": batch_size},
+        )
+        rows = [dict(record) for record in records]
+        if not rows:
+            return
+        yield rows
+        after = rows[-1]["uuid"]
+
+
+async def _regroup_episodes(driver, from_group, batch_size, default_group, dry_run, db, report) -> None:
+    stats = report["episodes"]
+    async for rows in _pages(driver, EPISODE_BATCH_QUERY, from_group, batch_size):
+        texts = {row["uuid"]: _candidate_texts(row["content"]) for row in rows}
+        users = await asyncio.to_thread(lookup_users, [t for ts in texts.values() for t in ts], db)
+        assignments = []
+        for row in rows:
+            owners = set().union(*(users.get(t, set()) for t in texts[row["uuid"]]))
+            if len(owners) > 1:
+                stats["conflicting"] += 1
+                continue
+            group_id = group_for_user(next(iter(owners))) if owners else default_group
+            if not group_id or group_id == from_group:
+                stats["unresolved"] += 1
+                continue
+            assignments.append({"uuid": row["uuid"], "group_id": group_id})
+            report["groups"][group_id] += 1
+        stats["scanned"] += len(rows)
+        stats["regrouped"] += len(assignments)
+        if assignments and not dry_run:
+            await driver.execute_query(EPISODE_WRITE_QUERY, params={"assignments": assignments})
+        print(f"[graph_regroup] Episodes scanned={stats['scanned']} regrouped={stats['regrouped']}")
+
+
+async def _regroup_entities(driver, from_group, batch_size, report) -> None:
+    stats = report["entities"]
+    async for rows in _pages(driver, ENTITY_BATCH_QUERY, from_group, batch_size):
+        assignments = []
+        for row in rows:
+            groups = [g for g in row["groups"] if g is not None]
+            if len(groups) > 1:
+                stats["shared"] += 1
+            elif groups and groups[0] != from_group:
+                assignments.append({"uuid": row["uuid"], "group_id": groups[0]})
+        stats["scanned"] += len(rows)
+        stats["regrouped"] += len(assignments)
+        if assignments:
+            await driver.execute_query(ENTITY_WRITE_QUERY, params={"assignments": assignments})
+    print(f"[graph_regroup] Entities scanned={stats['scanned']} regrouped={stats['regrouped']} shared={stats['shared']}")
+
+
+async def _regroup_edges(driver, from_group, batch_size, report) -> None:
+    stats = report["edges"]
+    async for rows in _pages(driver, EDGE_BATCH_QUERY, from_group, batch_size):
+        assignments = [
+            {"uuid": row["uuid"], "group_id": row["source_group"]}
+            for row in rows
+            if row["source_group"] == row["target_group"] and row["source_group"] != from_group
+        ]
+        stats["scanned"] += len(rows)
+        stats["regrouped"] += len(assignments)
+        if assignments:
+            await driver.execute_query(EDGE_WRITE_QUERY, params={"assignments": assignments})
+    print(f"[graph_regroup] Facts scanned={stats['scanned']} regrouped={stats['regrouped']}")
+
+
+async def regroup(from_group: str = "", batch_size: int = 200, default_group: str | None = None,
+                  dry_run: bool = False, db=None) -> dict:
+    """Move episodes (then their entities and facts) out of `from_group` into per-user groups.
+
+    With `dry_run` only the episode pass runs and nothing is written; entity and fact moves depend
+    on the episodes having moved.
+    """
+    from .graphiti_client import get_graphiti  # local import: graphiti_client imports graphiti_core
+
+    graphiti = await get_graphiti()
+    db = db or MemoriesDBManager()
+    report = {
+        "dry_run": dry_run,
+        "episodes": Counter(scanned=0, regrouped=0, unresolved=0, conflicting=0),
+        "entities": Counter(scanned=0, regrouped=0, shared=0),
+        "edges": Counter(scanned=0, regrouped=0),
+        "groups": Counter(),
+    }
+    await _regroup_episodes(graphiti.driver, from_group, batch_size, default_group, dry_run, db, report)
+    if not dry_run:
+        await _regroup_entities(graphiti.driver, from_group, batch_size, report)
+        await _regroup_edges(graphiti.driver, from_group, batch_size, report)
+    return {key: dict(value) if isinstance(value, Counter) else value for key, value in report.items()}
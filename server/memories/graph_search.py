@@ -0,0 +1,181 @@
+"""Cached Graphiti search.
+
+Hybrid graph search (BM25 + vector + cross-encoder rerank) costs one reranker LLM call per
+candidate passage with OpenAIRerankerClient, and the same queries repeat from polling clients.
+`search_graph` caches results keyed by
+
+    (group, group generation, normalized query, search config, num_results)
+
+Every episode `ingest_graphiti_episode` adds bumps the generation of its group (and of the
+all-groups scope), so entries for that group stop matching without scanning the cache. Entries
+also expire after GRAPH_SEARCH_CACHE_TTL_SECONDS, which bounds staleness from episodes added by
+other processes. Each entry records what computing it cost (reranker calls, latency); hits
+report that cost as saved.
+
+Run `search_graph` on the Graphiti loop (memories/graphiti_loop.py).
+
+Metrics: graph_search.requests{cache=hit|miss}, graph_search.latency_ms (misses),
+graph_search.rerank_calls, graph_search.saved_rerank_calls, graph_search.saved_ms,
+graph_search.invalidations.
+"""
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+ALL_GROUPS = "*"
+DEFAULT_CONFIG = "COMBINED_HYBRID_SEARCH_CROSS_ENCODER"
+
+_generations: dict[str, int] = {}
+_entries: OrderedDict[str, dict] = OrderedDict()
+_lock = threading.Lock()
+
+# Reranker passages scored by the search running in the current task (None outside a search)
+_rerank_counter: contextvars.ContextVar[list | None] = contextvars.ContextVar("graph_search_rerank", default=None)
+
+
+def _generation(group: str) -> int:
+    return _generations.get(group, 0)
+
+
+def bump_group(group_id: str | None) -> None:
+    """Invalidate cached searches over `group_id` (and over all groups) after an ingest."""
+    with _lock:
+        for group in {group_id or "", ALL_GROUPS}:
+            _generations[group] = _generation(group) + 1
+    metrics.incr("graph_search.invalidations")
+
+
+def _key(group: str, query: str, config_name: str, num_results: int) -> str:
+    canonical = json.dumps(
+        [group, _generation(group), " ".join(query.lower().split()), config_name, num_results],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _get(key: str) -> dict | None:
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.time():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        entry["hits"] += 1
+        return entry
+
+
+def _put(key: str, entry: dict) -> None:
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > getattr(settings, "GRAPH_SEARCH_CACHE_MAX_ENTRIES", 512):
+            _entries.popitem(last=False)
+
+
+def _count_reranks(graphiti) -> None:
+    """Wrap the cross-encoder once so searches can count the passages it scores."""
+    encoder = getattr(graphiti, "cross_encoder", None)
+    if encoder is None or getattr(encoder, "_graph_search_counted", False):
+        return
+    rank = encoder.rank
+
+    async def counted_rank(query, passages):
+        counter = _rerank_counter.get()
+        if counter is not None:
+            counter.append(len(passages))
+        return await rank(query, passages)
+
+    encoder.rank = counted_rank
+    encoder._graph_search_counted = True
+
+
+def _search_config(config_name: str):
+    from graphiti_core.search import search_config_recipes
+
+    config = getattr(search_config_recipes, config_name, None)
+    if config is None or not config_name.isupper():
+        raise ValueError(f"Unknown search config '{config_name}'")
+    return config
+
+
+def _serialize(results) -> dict:
+    def _iso(value):
+        return value.isoformat() if value is not None else None
+
+    return {
+        "edges": [
+            {"uuid": e.uuid, "name": e.name, "fact": e.fact, "valid_at": _iso(e.valid_at), "invalid_at": _iso(e.invalid_at)}
+            for e in results.edges
+        ],
+        "nodes": [{"uuid": n.uuid, "name": n.name, "summary": n.summary} for n in results.nodes],
+        "episodes": [
+            {"uuid": ep.uuid, "name": ep.name, "content": ep.content, "valid_at": _iso(ep.valid_at)}
+            for ep in results.episodes
+        ],
+        "communities": [{"uuid": c.uuid, "name": c.name, "summary": c.summary} for c in results.communities],
+    }
+
+
+async def search_graph(query: str, group_id: str | None = None, config_name: str | None = None,
+                       num_results: int = 10) -> dict:
+    """Return {"results", "cached", "cost"} for a Graphiti search, served from cache when possible.
+
+    `group_id` None searches every group. `config_name` is a recipe from
+    graphiti_core.search.search_config_recipes (default GRAPH_SEARCH_CONFIG).
+    """
+    from .graphiti_client import get_graphiti  # local import: graphiti_client imports graphiti_core
+
+    config_name = config_name or getattr(settings, "GRAPH_SEARCH_CONFIG", DEFAULT_CONFIG)
+    config = _search_config(config_name).model_copy(update={"limit": num_results})
+    group = ALL_GROUPS if group_id is None else group_id
+    key = _key(group, query, config_name, num_results)
+    enabled = getattr(settings, "GRAPH_SEARCH_CACHE_ENABLED", True)
+    if enabled:
+        entry = _get(key)
+        if entry is not None:
+            metrics.incr("graph_search.requests", cache="hit")
+            metrics.incr("graph_search.saved_rerank_calls", entry["cost"]["rerank_calls"])
+            metrics.incr("graph_search.saved_ms", entry["cost"]["latency_ms"])
+            return {"results": entry["results"], "cached": True, "cost": entry["cost"], "hits": entry["hits"]}
+
+    graphiti = await get_graphiti()
+    _count_reranks(graphiti)
+    counter: list[int] = []
+    token = _rerank_counter.set(counter)
+    start = time.perf_counter()
+    try:
+        results = await graphiti.search_(query, config=config, group_ids=None if group_id is None else [group_id])
+    finally:
+        _rerank_counter.reset(token)
+    cost = {"rerank_calls": sum(counter), "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+    metrics.incr("graph_search.requests", cache="miss")
+    metrics.incr("graph_search.rerank_calls", cost["rerank_calls"])
+    metrics.observe("graph_search.latency_ms", cost["latency_ms"])
+    serialized = _serialize(results)
+    if enabled:
+        ttl = getattr(settings, "GRAPH_SEARCH_CACHE_TTL_SECONDS", 300)
+        _put(key, {"results": serialized, "cost": cost, "hits": 0, "expires_at": time.time() + ttl})
+    return {"results": serialized, "cached": False, "cost": cost, "hits": 0}
+
+
+def stats() -> dict:
+    """Cache size and the entries that saved the most reranker calls."""
+    with _lock:
+        entries = list(_entries.values())
+    top = sorted(entries, key=lambda e: e["hits"] * e["cost"]["rerank_calls"], reverse=True)[:5]
+    return {
+        "entries": len(entries),
+        "generations": dict(_generations),
+        "top_entries": [{"hits": e["hits"], **e["cost"]} for e in top],
+    }
@@ -0,0 +1,142 @@
+"""Neo4j graph statistics for the Graphiti store (used by `manage.py graph_stats`).
+
+Reports:
+  * node counts per label and relationship counts per type (served from Neo4j's count store)
+  * degree distribution of Entity and Episodic nodes: percentiles, buckets and the top hubs
+  * range indexes graphiti-core expects (graphiti_core.graph_queries.get_range_indices) that the
+    database does not have, plus indexes that are not ONLINE
+
+Run `collect()` on the Graphiti loop (memories/graphiti_loop.py).
+"""
+from __future__ import annotations
+
+import re
+
+DEGREE_LABELS = ("Entity", "Episodic")
+DEGREE_BUCKETS = ((0, 0), (1, 1), (2, 4), (5, 9), (10, 49), (50, 99), (100, None))
+
+_INDEX_DEFINITION = re.compile(
+    r"FOR\s+(?:\(\w+:(?P<label>\w+)\)|\(\)-\[\w+:(?P<type>\w+)\]-\(\))\s+ON\s+\((?P<props>[^)]*)\)",
+    re.IGNORECASE,
+)
+
+
+async def _rows(driver, query: str, **params) -> list[dict]:
+    records, _, _ = await driver.execute_query(query, params=params)
+    return [dict(record) for record in records]
+
+
+async def _counts(driver) -> tuple[dict, dict]:
+    labels = [r["label"] for r in await _rows(driver, "CALL db.labels() YIELD label RETURN label")]
+    types = [r["relationshipType"] for r in await _rows(driver, "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType")]
+    nodes, edges = {}, {}
+    # One query per label / type so each count is answered from the count store, not a scan
+    for label in labels:
+        rows = await _rows(driver, f"MATCH (n:`{label}`) RETURN count(n) AS count")
+        nodes[label] = rows[0]["count"]
+    for rel_type in types:
+        rows = await _rows(driver, f"MATCH ()-[r:`{rel_type}`]->() RETURN count(r) AS count")
+        edges[rel_type] = rows[0]["count"]
+    return nodes, edges
+
+
+def _bucket_expression() -> str:
+    cases = []
+    for low, high in DEGREE_BUCKETS:
+        if high is None:
+            cases.append(f"ELSE '{low}+'")
+        elif low == high:
+            cases.append(f"WHEN degree = {low} THEN '{low}'")
+        else:
+            cases.append(f"WHEN degree <= {high} THEN '{low}-{high}'")
+    return "CASE " + " ".join(cases) + " END"
+
+
+async def _degrees(driver, label: str, top: int) -> dict:
+    degree = f"MATCH (n:`{label}`) WITH n, size([(n)--() | 1]) AS degree"
+    summary = await _rows(
+        driver,
+        f"""
+        {degree}
+        RETURN count(n) AS nodes, avg(degree) AS avg, max(degree) AS max,
+               percentileDisc(degree, 0.5) AS p50, percentileDisc(degree, 0.9) AS p90,
+               percentileDisc(degree, 0.99) AS p99
+        """,
+    )
+    row = summary[0] if summary else {}
+    counted = {
+        r["bucket"]: r["count"]
+        for r in await _rows(driver, f"{degree} RETURN {_bucket_expression()} AS bucket, count(*) AS count")
+    }
+    buckets = {}
+    for low, high in DEGREE_BUCKETS:
+        name = f"{low}+" if high is None else (str(low) if low == high else f"{low}-{high}")
+        buckets[name] = counted.get(name, 0)
+    hubs = await _rows(
+        driver,
+        f"""
+        {degree}
+        ORDER BY degree DESC LIMIT $top
+        RETURN n.uuid AS uuid, n.name AS name, n.group_id AS group_id, degree
+        """,
+        top=top,
+    )
+    return {
+        "nodes": row.get("nodes", 0),
+        "avg": round(row.get("avg") or 0, 2),
+        "max": row.get("max") or 0,
+        "p50": row.get("p50") or 0,
+        "p90": row.get("p90") or 0,
+        "p99": row.get("p99") or 0,
+        "buckets": buckets,
+        "top": hubs,
+    }
+
+
+def expected_indexes(provider) -> list[dict]:
+    """Range indexes graphiti-core creates for `provider`, as {"entity", "properties"}."""
+    from graphiti_core.graph_queries import get_range_indices
+
+    expected = []
+    for query in get_range_indices(provider):
+        match = _INDEX_DEFINITION.search(query)
+        if match:
+            props = [p.strip().split(".", 1)[-1] for p in match.group("props").split(",")]
+            expected.append({"entity": match.group("label") or match.group("type"), "properties": props})
+    return expected
+
+
+async def _indexes(driver) -> dict:
+    from graphiti_core.driver.driver import GraphProvider
+
+    existing = await _rows(
+        driver,
+        "SHOW INDEXES YIELD name, type, state, labelsOrTypes, properties RETURN name, type, state, labelsOrTypes, properties",
+    )
+    have = {
+        (entity, tuple(row.get("properties") or ()))
+        for row in existing
+        for entity in row.get("labelsOrTypes") or ()
+    }
+    provider = getattr(driver, "provider", GraphProvider.NEO4J)
+    missing = [ix for ix in expected_indexes(provider) if (ix["entity"], tuple(ix["properties"])) not in have]
+    return {
+        "total": len(existing),
+        "missing": missing,
+        "not_online": [
+            {"name": row["name"], "state": row["state"]} for row in existing if row.get("state") != "ONLINE"
+        ],
+    }
+
+
+async def collect(top: int = 10) -> dict:
+    from .graphiti_client import get_graphiti  # local import: graphiti_client imports graphiti_core
+
+    driver = (await get_graphiti()).driver
+    nodes, edges = await _counts(driver)
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "degrees": {label: await _degrees(driver, label, top) for label in DEGREE_LABELS if label in nodes},
+        "indexes": await _indexes(driver),
+    }
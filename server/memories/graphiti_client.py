@@ -1,24 +1,35 @@
 import os
 import asyncio
+import importlib.metadata
+import json
+import tempfile
+import time
 from typing import Optional
 
+from django.conf import settings
+
 from graphiti_core import Graphiti
 from graphiti_core.llm_client.azure_openai_client import AzureOpenAILLMClient  # original (fallback)
 from .azure_llm_client_patch import PatchedAzureOpenAILLMClient
 from graphiti_core.llm_client.config import LLMConfig
 from graphiti_core.embedder.openai import OpenAIEmbedder, OpenAIEmbedderConfig
 from graphiti_core.cross_encoder.openai_reranker_client import OpenAIRerankerClient
-from openai import AsyncAzureOpenAI, NotFoundError
+from openai import NotFoundError
+from . import cypher_profile, metrics
+from .episodes import EPISODE_LISTING_INDEXES
+from .openai_router import RoutedAsyncOpenAI, get_router
 
-# Lazy-initialized singleton Graphiti instance
+# Lazy-initialized singleton Graphiti instance, bound to the loop in memories/graphiti_loop.py
 _graphiti: Optional[Graphiti] = None
+_graphiti_loop: Optional[asyncio.AbstractEventLoop] = None
 _lock = asyncio.Lock()
 
 """Graphiti Azure OpenAI client bootstrap.
 
 This module now mirrors the guidance in `README_GRAPHITI_AZURE.md`, supporting:
 
-1. Separate Azure OpenAI endpoints for LLM vs Embeddings.
+1. Separate Azure OpenAI endpoints for LLM vs Embeddings (or a pool of deployments per kind via
+   AZURE_OPENAI_POOL; all calls are routed through memories/openai_router.py).
     - AZURE_OPENAI_LLM_ENDPOINT (optional) overrides AZURE_OPENAI_ENDPOINT for chat models
     - AZURE_OPENAI_EMBEDDING_ENDPOINT (optional) overrides for embedding models
 2. Distinct deployment names for:
@@ -27,6 +38,11 @@ This module now mirrors the guidance in `README_GRAPHITI_AZURE.md`, supporting:
     - Embeddings: AZURE_OPENAI_EMBEDDING_DEPLOYMENT (optional; enables vector store & rerank quality)
 3. Cross encoder (reranker) using the small model via OpenAIRerankerClient.
 4. Preflight validation of deployments to yield early actionable errors (especially 404).
+   Every chat, small and embedding deployment in the router pool is checked (concurrently) under its
+   own key, and successes are cached for GRAPHITI_PREFLIGHT_TTL_SECONDS.
+5. Incremental startup: index building, the Episodic.entity_edges backfill (v1) and the episode listing
+   indexes (v2) run only when the (:SchemaMarker {name: "memories"}) node is behind
+   GRAPHITI_SCHEMA_VERSION or graphiti-core changed; the backfill runs in batches of GRAPHITI_BACKFILL_BATCH_SIZE.
 
 Environment Variables Summary:
   AZURE_OPENAI_KEY (required)
@@ -46,9 +62,218 @@ Notes:
 * We intentionally keep the legacy single-endpoint behaviour for backward compatibility when the new *_LLM_ENDPOINT / *_EMBEDDING_ENDPOINT vars are not set.
 """
 
+# ---------------------------------------------------------------------------
+# Preflight checks (cached across processes)
+# ---------------------------------------------------------------------------
+# Successful checks: key -> unix time. Mirrored to GRAPHITI_PREFLIGHT_CACHE_PATH (a small JSON
+# file, kept apart from the LLM response cache) so restarts and other workers on the host reuse them.
+_preflight_state: dict[str, float] = {}
+
+
+def _preflight_key(dep) -> str:
+    """One key per router pool deployment, since the router may send a call to any of them."""
+    return "|".join((dep.kind, (dep.endpoint or "").rstrip("/"), dep.deployment, dep.api_version or ""))
+
+
+def _preflight_path() -> str:
+    return getattr(settings, "GRAPHITI_PREFLIGHT_CACHE_PATH",
+                   os.path.join(tempfile.gettempdir(), "memories_graphiti_preflight.json"))
+
+
+def _load_preflight_state() -> dict[str, float]:
+    path = _preflight_path()
+    if path:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                _preflight_state.update(json.load(fh))
+        except (OSError, ValueError):
+            pass
+    return _preflight_state
+
+
+def _record_preflight(key: str) -> None:
+    state = _load_preflight_state()
+    now = time.time()
+    state[key] = now
+    ttl = getattr(settings, "GRAPHITI_PREFLIGHT_TTL_SECONDS", 3600)
+    for stale in [k for k, checked_at in state.items() if now - checked_at >= ttl]:
+        del state[stale]
+    path = _preflight_path()
+    if not path:
+        return
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+        os.replace(tmp_path, path)  # atomic: concurrent readers never see a partial file
+    except OSError as e:
+        print(f"[graphiti_client] Could not persist preflight state to {path}: {e}")
+
+
+async def _cached_preflight(key: str, check) -> str:
+    """Run `check()` unless it succeeded within GRAPHITI_PREFLIGHT_TTL_SECONDS; returns its outcome."""
+    ttl = getattr(settings, "GRAPHITI_PREFLIGHT_TTL_SECONDS", 3600)
+    checked_at = _load_preflight_state().get(key)
+    if ttl > 0 and checked_at and time.time() - checked_at < ttl:
+        metrics.incr("graphiti.preflight", outcome="cached")
+        return "ok"
+    outcome = await check()
+    metrics.incr("graphiti.preflight", outcome=outcome)
+    if outcome == "ok" and ttl > 0:
+        _record_preflight(key)
+    return outcome
+
+
+async def _preflight_chat(client, model_name: str, llm_endpoint: str, azure_version: str) -> str:
+    try:
+        preflight_resp = await client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {"role": "system", "content": "ping"},
+                {"role": "user", "content": "ping"},
+            ],
+            max_tokens=1,
+            temperature=0,
+        )
+    except NotFoundError as nf:
+        raise RuntimeError(
+            (
+                "Azure OpenAI deployment not found (404). Verify that:\n"
+                f"  - The deployment name '{model_name}' exists in resource '{llm_endpoint}'.\n"
+                f"  - The api-version '{azure_version}' supports this model.\n"
+                "  - You are using the deployment name (not base model name) if they differ.\n"
+                "Tip: In Azure Portal -> Azure OpenAI -> Deployments, copy the exact deployment name.\n"
+            )
+        ) from nf
+    except Exception as e:
+        # Allow other errors to surface later; just log for now
+        print(f"[graphiti_client] Preflight check encountered non-fatal error: {e}")
+        return "error"
+    if not preflight_resp or not getattr(preflight_resp, 'choices', None):
+        print("[graphiti_client] WARNING: Preflight chat completion returned no choices; continuing anyway.")
+        return "error"
+    print("[graphiti_client] Preflight Azure OpenAI check succeeded.")
+    return "ok"
+
+
+async def _preflight_embedding(client, embed_deployment: str) -> str:
+    """Returns "missing" when the embedding deployment does not exist (embeddings get disabled)."""
+    try:
+        emb_resp = await client.embeddings.create(
+            model=embed_deployment,
+            input=["ping"],
+        )
+    except NotFoundError:
+        print(
+            "[graphiti_client] ERROR: Embedding deployment not found (AZURE_OPENAI_EMBEDDING_DEPLOYMENT). Embedding features will be disabled."
+        )
+        return "missing"
+    except Exception as e:  # non-fatal
+        print(f"[graphiti_client] Embedding preflight non-fatal error: {e}")
+        return "error"
+    if not emb_resp or not getattr(emb_resp, 'data', None):
+        print("[graphiti_client] WARNING: Embedding preflight returned no data; continuing anyway.")
+        return "error"
+    print("[graphiti_client] Embedding preflight succeeded.")
+    return "ok"
+
+
+# ---------------------------------------------------------------------------
+# Schema marker & migrations
+# ---------------------------------------------------------------------------
+# Bump when a migration step is added to _ensure_schema.
+GRAPHITI_SCHEMA_VERSION = 2
+SCHEMA_MARKER_NAME = "memories"
+
+
+def _installed_graphiti_version() -> str:
+    try:
+        return importlib.metadata.version("graphiti-core")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+async def _backfill_entity_edges(graphiti: Graphiti) -> int:
+    """Set entity_edges = [] on Episodic nodes missing it, GRAPHITI_BACKFILL_BATCH_SIZE per transaction."""
+    batch_size = getattr(settings, "GRAPHITI_BACKFILL_BATCH_SIZE", 1000)
+    total = 0
+    while True:
+        records, _, _ = await graphiti.driver.execute_query(
+            "MATCH (e:Episodic) WHERE e.entity_edges IS NULL "
+            "WITH e LIMIT $batch_size SET e.entity_edges = [] RETURN count(e) AS updated",
+            params={"batch_size": batch_size},
+        )
+        updated = records[0].get("updated", 0) if records else 0
+        total += updated
+        if updated < batch_size:
+            return total
+
+
+async def _ensure_schema(graphiti: Graphiti) -> None:
+    """Bring the graph up to GRAPHITI_SCHEMA_VERSION; a single marker read when already current."""
+    graphiti_version = _installed_graphiti_version()
+    try:
+        records, _, _ = await graphiti.driver.execute_query(
+            "MATCH (m:SchemaMarker {name: $name}) RETURN m.version AS version, m.graphiti_version AS graphiti_version",
+            params={"name": SCHEMA_MARKER_NAME},
+        )
+        marker = records[0] if records else None
+    except Exception as e:
+        print(f"[graphiti_client] Warning: could not read schema marker ({e}); running migrations")
+        marker = None
+    version = (marker.get("version") if marker else None) or 0
+    if version >= GRAPHITI_SCHEMA_VERSION and marker.get("graphiti_version") == graphiti_version:
+        metrics.incr("graphiti.schema", outcome="current")
+        print(f"[graphiti_client] Graphiti initialized. Schema v{version} is current")
+        return
+
+    # Index definitions belong to graphiti-core, so they are rebuilt on upgrades as well
+    await graphiti.build_indices_and_constraints()
+    if version < 1:
+        # Ensure the property key token for entity_edges exists even before first episode creation
+        # We create a throwaway node with the property then delete it so Neo4j registers the key.
+        try:
+            await graphiti.driver.execute_query(
+                "CREATE (tmp:Episodic {entity_edges: []}) WITH tmp DETACH DELETE tmp"
+            )
+        except Exception:
+            # Non-fatal: the backfill below also registers the key once any Episodic node exists
+            print("[graphiti_client] Warning: property key 'entity_edges' seed operation failed (continuing)")
+        # Ensure episodic nodes have entity_edges property to avoid Neo4j warnings
+        try:
+            updated = await _backfill_entity_edges(graphiti)
+            print(f"[graphiti_client] entity_edges backfilled on {updated} Episodic nodes")
+        except Exception as e:
+            # Leave the marker behind so the backfill is retried on the next start
+            print(f"[graphiti_client] Warning: failed to backfill entity_edges property: {e}")
+            metrics.incr("graphiti.schema", outcome="failed")
+            return
+    if version < 2:
+        # Range indexes on the bare created_at property for keyset episode listing (memories/episodes.py)
+        for query in EPISODE_LISTING_INDEXES:
+            await graphiti.driver.execute_query(query)
+    await graphiti.driver.execute_query(
+        "MERGE (m:SchemaMarker {name: $name}) "
+        "SET m.version = $version, m.graphiti_version = $graphiti_version, m.migrated_at = datetime()",
+        params={"name": SCHEMA_MARKER_NAME, "version": GRAPHITI_SCHEMA_VERSION, "graphiti_version": graphiti_version},
+    )
+    metrics.incr("graphiti.schema", outcome="migrated")
+    print(f"[graphiti_client] Graphiti initialized. Schema migrated v{version} -> v{GRAPHITI_SCHEMA_VERSION} "
+          f"(graphiti-core {graphiti_version})")
+
+
+def _check_loop() -> None:
+    if _graphiti_loop is not None and asyncio.get_running_loop() is not _graphiti_loop:
+        raise RuntimeError(
+            "Graphiti is bound to another event loop; run Graphiti coroutines through memories.graphiti_loop"
+        )
+
+
 async def get_graphiti() -> Graphiti:
-    global _graphiti
+    """Return the process-wide Graphiti instance; call it on the Graphiti loop (memories/graphiti_loop.py)."""
+    global _graphiti, _graphiti_loop
     if _graphiti is not None:
+        _check_loop()
         return _graphiti
     async with _lock:
         if _graphiti is not None:
@@ -89,22 +314,20 @@ async def get_graphiti() -> Graphiti:
                 "[graphiti_client] WARNING: 'text-embedding-ada-002' is legacy; deploy 'text-embedding-3-small' or 'text-embedding-3-large' instead."
             )
 
-        # Provide an AzureOpenAI client to the generic wrapper so it hits the correct Azure paths
-        # NOTE: The generic wrapper will call chat.completions.create(model=<deployment_name>, ...)
-        # which is compatible with AzureOpenAI client.
-        llm_azure_client = AsyncAzureOpenAI(
-            api_key=azure_api_key,
-            api_version=azure_version,
-            azure_endpoint=llm_endpoint.rstrip('/'),
-        )
+        # Chat, small-model and embedding calls go through the shared deployment router, so Graphiti
+        # is load-balanced / hedged across AZURE_OPENAI_POOL like the rest of the service.
+        # NOTE: The generic wrapper will call chat.completions.create(model=<deployment_name>, ...);
+        # the routed client maps that name to its pool and rewrites it to the chosen deployment.
+        router = get_router()
+        if upgraded_version:
+            for dep in router.deployments:
+                if dep.api_version < upgraded_version:
+                    dep.api_version = upgraded_version
+        llm_azure_client = RoutedAsyncOpenAI(router, "chat")
 
-        embedding_azure_client: Optional[AsyncAzureOpenAI] = None
+        embedding_azure_client: Optional[RoutedAsyncOpenAI] = None
         if embed_deployment:
-            embedding_azure_client = AsyncAzureOpenAI(
-                api_key=azure_api_key,
-                api_version=azure_version,
-                azure_endpoint=embedding_endpoint.rstrip('/'),
-            )
+            embedding_azure_client = RoutedAsyncOpenAI(router, "embedding")
         # Basic debug to aid diagnosing 404 (deployment not found) issues
         try:
             print(
@@ -120,56 +343,34 @@ async def get_graphiti() -> Graphiti:
         # ------------------------------------------------------------------
         # Preflight: validate deployment exists & api-version supports model.
         # This provides an early, clear error instead of opaque retries later.
+        # Checks run concurrently; a successful check is remembered per deployment for
+        # GRAPHITI_PREFLIGHT_TTL_SECONDS (GRAPHITI_PREFLIGHT_CACHE_PATH) so restarts and other workers skip it.
         # ------------------------------------------------------------------
-        try:
-            # Heuristic warning for obviously outdated API version with modern models
-            if ("4o" in model_name or "o1" in model_name or "o3" in model_name or "gpt-4.1" in model_name) and azure_version.startswith("2023-"):
-                print("[graphiti_client] WARNING: API version appears old for a modern model; consider upgrading AZURE_OPENAI_VERSION (e.g. 2024-06-01).")
-            preflight_resp = await llm_azure_client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "ping"},
-                    {"role": "user", "content": "ping"},
-                ],
-                max_tokens=1,
-                temperature=0,
-            )
-            if not preflight_resp or not getattr(preflight_resp, 'choices', None):
-                print("[graphiti_client] WARNING: Preflight chat completion returned no choices; continuing anyway.")
-            else:
-                print("[graphiti_client] Preflight Azure OpenAI check succeeded.")
-        except NotFoundError as nf:
-            raise RuntimeError(
-                (
-                    "Azure OpenAI deployment not found (404). Verify that:\n"
-                    f"  - The deployment name '{model_name}' exists in resource '{llm_endpoint}'.\n"
-                    f"  - The api-version '{azure_version}' supports this model.\n"
-                    "  - You are using the deployment name (not base model name) if they differ.\n"
-                    "Tip: In Azure Portal -> Azure OpenAI -> Deployments, copy the exact deployment name.\n"
-                )
-            ) from nf
-        except Exception as e:
-            # Allow other errors to surface later; just log for now
-            print(f"[graphiti_client] Preflight check encountered non-fatal error: {e}")
-
-        # Optional embedding preflight
-        if embed_deployment and embedding_azure_client:
-            try:
-                emb_resp = await embedding_azure_client.embeddings.create(
-                    model=embed_deployment,
-                    input=["ping"],
-                )
-                if not emb_resp or not getattr(emb_resp, 'data', None):
-                    print("[graphiti_client] WARNING: Embedding preflight returned no data; continuing anyway.")
-                else:
-                    print("[graphiti_client] Embedding preflight succeeded.")
-            except NotFoundError:
-                print(
-                    "[graphiti_client] ERROR: Embedding deployment not found (AZURE_OPENAI_EMBEDDING_DEPLOYMENT). Embedding features will be disabled."
-                )
-                embedding_azure_client = None
-            except Exception as e:  # non-fatal
-                print(f"[graphiti_client] Embedding preflight non-fatal error: {e}")
+        # Heuristic warning for obviously outdated API version with modern models
+        if ("4o" in model_name or "o1" in model_name or "o3" in model_name or "gpt-4.1" in model_name) and azure_version.startswith("2023-"):
+            print("[graphiti_client] WARNING: API version appears old for a modern model; consider upgrading AZURE_OPENAI_VERSION (e.g. 2024-06-01).")
+        # Ping each pool deployment directly (not through the router), so every deployment the
+        # router can pick is validated and cached under its own key
+        chat_deps = list({dep.name: dep for dep in router.pool("chat") + router.pool("small")}.values())
+        embedding_deps = [dep for dep in router.deployments if dep.kind == "embedding"] if embedding_azure_client else []
+        checks = [
+            _cached_preflight(_preflight_key(dep), lambda dep=dep: _preflight_chat(
+                router.async_client(dep), dep.deployment, dep.endpoint, dep.api_version))
+            for dep in chat_deps
+        ] + [
+            _cached_preflight(_preflight_key(dep), lambda dep=dep: _preflight_embedding(
+                router.async_client(dep), dep.deployment))
+            for dep in embedding_deps
+        ]
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*checks)
+        metrics.observe("graphiti.preflight_ms", (time.perf_counter() - started) * 1000)
+        embedding_outcomes = outcomes[len(chat_deps):]
+        missing = [dep.name for dep, outcome in zip(embedding_deps, embedding_outcomes) if outcome == "missing"]
+        if embedding_deps and len(missing) == len(embedding_deps):
+            embedding_azure_client = None
+        elif missing:
+            print(f"[graphiti_client] WARNING: embedding deployment(s) {missing} not found; the router will fail over from them.")
 
         # Still set OPENAI_* for any downstream code that inspects env (compat layer expectation)
         os.environ["OPENAI_API_KEY"] = azure_api_key
@@ -200,6 +401,7 @@ async def get_graphiti() -> Graphiti:
             client=llm_azure_client,
         ) if small_model_name else None
 
+        _graphiti_loop = asyncio.get_running_loop()
         _graphiti = Graphiti(
             os.environ.get("NEO4J_URI", "bolt://localhost:7687"),
             os.environ.get("NEO4J_USER", "neo4j"),
@@ -208,41 +410,32 @@ async def get_graphiti() -> Graphiti:
             embedder=embedder,
             cross_encoder=cross_encoder,
         )
-        # Build indices & constraints once per process
-        await _graphiti.build_indices_and_constraints()
-        # Ensure the property key token for entity_edges exists even before first episode creation
-        # We create a throwaway node with the property then delete it so Neo4j registers the key.
-        try:
-            print("[graphiti_client] Seeding Neo4j property key 'entity_edges' with temp Episodic node ...")
-            await _graphiti.driver.execute_query(
-                "CREATE (tmp:Episodic {entity_edges: []}) WITH tmp DETACH DELETE tmp"
-            )
-            print("[graphiti_client] Property key 'entity_edges' seed operation completed")
-        except Exception:
-            # Non-fatal: if this fails we'll fall back to later backfill.
-            print("[graphiti_client] Warning: property key 'entity_edges' seed operation failed (continuing)")
-            pass
-        # Ensure episodic nodes have entity_edges property to avoid Neo4j warnings
-        try:
-            records, _, _ = await _graphiti.driver.execute_query(
-                "MATCH (e:Episodic) WHERE e.entity_edges IS NULL SET e.entity_edges = [] RETURN count(e) as updated"
-            )
-            updated = 0
-            if records:
-                try:
-                    updated = records[0].get("updated", 0)
-                except Exception:
-                    pass
-            print(f"[graphiti_client] Graphiti initialized. entity_edges backfilled on {updated} Episodic nodes")
-        except Exception as e:
-            # Non-fatal; continue even if this maintenance step fails
-            print(f"[graphiti_client] Warning: failed to backfill entity_edges property: {e}")
+        # Time every Cypher query by fingerprint and PROFILE a CYPHER_PROFILE_SAMPLE_RATE sample of them
+        cypher_profile.instrument(_graphiti.driver)
+        # Indices, the entity_edges property key and the Episodic backfill only run when the
+        # schema marker node is behind GRAPHITI_SCHEMA_VERSION or graphiti-core was upgraded.
+        started = time.perf_counter()
+        await _ensure_schema(_graphiti)
+        metrics.observe("graphiti.schema_check_ms", (time.perf_counter() - started) * 1000)
         return _graphiti
 
+
+async def set_graphiti(graphiti: Graphiti) -> None:
+    """Install a pre-built Graphiti instance (offline benchmarks, see scripts/benchmark_ingest.py).
+
+    Call it on the Graphiti loop; get_graphiti() then returns `graphiti` without any Azure or Neo4j setup.
+    """
+    global _graphiti, _graphiti_loop
+    async with _lock:
+        _graphiti = graphiti
+        _graphiti_loop = asyncio.get_running_loop()
+
+
 async def close_graphiti():
-    global _graphiti
+    global _graphiti, _graphiti_loop
     if _graphiti is not None:
         try:
             await _graphiti.close()
         finally:
             _graphiti = None
+            _graphiti_loop = None
@@ -0,0 +1,107 @@
+"""Long-lived event loop that owns the Graphiti singleton.
+
+The Graphiti instance, its asyncio.Lock and the Neo4j driver's connection pool are bound to the
+event loop that created them. Running Graphiti coroutines with `asyncio.run` (or on whichever
+loop an async view happens to use) throws the pool away or breaks it between requests, so every
+Graphiti call goes through one daemon thread running one loop:
+
+    from memories import graphiti_loop
+    ep_name, _ = graphiti_loop.run(ingest_graphiti_episode(body))          # sync views, scripts
+    ep_name, _ = await graphiti_loop.run_async(ingest_graphiti_episode(body))  # async views
+    future = graphiti_loop.submit(coro)                                    # concurrent.futures.Future
+
+The loop starts on first use; `shutdown()` (also registered with atexit) closes Graphiti on its
+own loop and stops the thread. Sync calls wait at most GRAPHITI_CALL_TIMEOUT_SECONDS.
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+
+from django.conf import settings
+
+_loop: asyncio.AbstractEventLoop | None = None
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+
+
+def _run_forever(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+    asyncio.set_event_loop(loop)
+    loop.call_soon(ready.set)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the Graphiti loop, starting its thread on first use."""
+    global _loop, _thread
+    if _loop is not None and _thread is not None and _thread.is_alive():
+        return _loop
+    with _lock:
+        if _loop is None or _thread is None or not _thread.is_alive():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            thread = threading.Thread(target=_run_forever, args=(loop, ready), name="graphiti-loop", daemon=True)
+            thread.start()
+            ready.wait()
+            _loop, _thread = loop, thread
+            print("[graphiti_loop] Started Graphiti event loop thread")
+    return _loop
+
+
+def in_loop() -> bool:
+    """True when called from a coroutine already running on the Graphiti loop."""
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """Schedule `coro` on the Graphiti loop from any thread."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout: float | None = None):
+    """Run `coro` on the Graphiti loop and block for its result (sync views, scripts, workers)."""
+    if in_loop():
+        coro.close()
+        raise RuntimeError("graphiti_loop.run() called from the Graphiti loop; await the coroutine instead")
+    timeout = getattr(settings, "GRAPHITI_CALL_TIMEOUT_SECONDS", 300) if timeout is None else timeout
+    future = submit(coro)
+    try:
+        return future.result(timeout=timeout or None)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Graphiti call did not finish within {timeout}s")
+
+
+async def run_async(coro):
+    """Await `coro` on the Graphiti loop from a coroutine running on another loop."""
+    if in_loop():
+        return await coro
+    return await asyncio.wrap_future(submit(coro))
+
+
+def shutdown(timeout: float = 10) -> None:
+    """Close Graphiti (and its driver pool) on its own loop, then stop the thread."""
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+    if loop is None or thread is None or not thread.is_alive():
+        return
+    from .graphiti_client import close_graphiti  # local import: graphiti_client imports graphiti_core
+
+    try:
+        asyncio.run_coroutine_threadsafe(close_graphiti(), loop).result(timeout=timeout)
+    except Exception as e:
+        print(f"[graphiti_loop] Graphiti close failed: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=timeout)
+    if not thread.is_alive():
+        loop.close()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,215 @@
+"""Offline stand-ins for Graphiti's LLM, embedder, reranker and graph database.
+
+Used by scripts/benchmark_ingest.py to drive `Graphiti.add_episode` (and ingest_graphiti_episode)
+without Azure OpenAI or Neo4j:
+
+  ScriptedLLMClient   deterministic structured outputs derived from the prompt itself: entities are
+                      the capitalized phrases of the episode text, facts link entities mentioned in the
+                      same sentence, dedupe prompts answer "no duplicate", anything else gets the
+                      response model's empty/default instance. Sleeps `latency_ms` (+/- `jitter`) per
+                      call, counts calls per response model and reports them to memories/output_budget.py
+                      with tiktoken-estimated usage, like the real client.
+  HashEmbedder        unit vectors seeded from a hash of the text (identical text -> identical vector)
+  OverlapCrossEncoder ranks passages by word overlap with the query
+  offline_driver      graphiti-core's embedded Kuzu driver (in memory by default); needs the optional
+                      `kuzu` package (pip install "graphiti-core[kuzu]")
+
+The outputs are shaped like real ones, not correct ones: use them to compare the cost and latency of
+ingestion changes, not extraction quality.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import typing
+from collections import Counter
+
+from graphiti_core.cross_encoder.client import CrossEncoderClient
+from graphiti_core.embedder.client import EMBEDDING_DIM, EmbedderClient
+from graphiti_core.llm_client.client import LLMClient
+from graphiti_core.llm_client.config import DEFAULT_MAX_TOKENS, LLMConfig, ModelSize
+from pydantic import BaseModel
+
+from . import output_budget
+from .prompt_budget import count_tokens
+
+_PHRASE = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def _section(text: str, *tags: str) -> str | None:
+    """Body of the first <TAG>...</TAG> block present in a Graphiti prompt."""
+    for tag in tags:
+        match = re.search(rf"<{tag}>\s*(.*?)\s*</{tag}>", text, re.S)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _json_section(text: str, *tags: str):
+    body = _section(text, *tags)
+    if body is None:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def _default_for(annotation):
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin in (list, set, tuple) or annotation in (list, set, tuple):
+        return []
+    if origin is dict or annotation is dict:
+        return {}
+    if origin is typing.Union or type(annotation).__name__ == "UnionType":
+        return None if type(None) in args else _default_for(args[0])
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return default_instance(annotation)
+    return {str: "", int: 0, float: 0.0, bool: False}.get(annotation)
+
+
+def default_instance(model: type[BaseModel]) -> dict:
+    """Required fields of `model` filled with empty values (lists empty, optionals None)."""
+    return {
+        name: _default_for(field.annotation)
+        for name, field in model.model_fields.items()
+        if field.is_required()
+    }
+
+
+class ScriptedLLMClient(LLMClient):
+    def __init__(self, latency_ms: float = 0.0, jitter: float = 0.0, seed: int = 0, config: LLMConfig | None = None):
+        super().__init__(config or LLMConfig(model="scripted", small_model="scripted"), cache=False)
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self.calls: Counter[str] = Counter()
+
+    def _entities(self, text: str) -> list[dict]:
+        body = _section(text, "TEXT", "CURRENT MESSAGE", "CURRENT_MESSAGE", "JSON") or ""
+        names = dict.fromkeys(_PHRASE.findall(body))
+        return [{"name": name, "entity_type_id": 0} for name in names]
+
+    def _edges(self, text: str) -> list[dict]:
+        entities = [e.get("name") for e in _json_section(text, "ENTITIES") or [] if isinstance(e, dict)]
+        body = _section(text, "CURRENT_MESSAGE", "CURRENT MESSAGE", "TEXT") or ""
+        edges = []
+        for sentence in _SENTENCE.split(body):
+            mentioned = [name for name in entities if name and name in sentence]
+            for source, target in zip(mentioned, mentioned[1:]):
+                edges.append({
+                    "source_entity_name": source,
+                    "target_entity_name": target,
+                    "relation_type": "MENTIONED_WITH",
+                    "fact": sentence.strip(),
+                })
+        return edges
+
+    def _node_resolutions(self, text: str) -> list[dict]:
+        extracted = _json_section(text, "ENTITIES", "EXTRACTED ENTITIES", "NEW ENTITY") or []
+        if isinstance(extracted, dict):
+            extracted = [extracted]
+        return [
+            {"id": e.get("id", i), "name": e.get("name", ""), "duplicate_candidate_id": -1}
+            for i, e in enumerate(extracted) if isinstance(e, dict)
+        ]
+
+    def _respond(self, text: str, response_model: type[BaseModel] | None) -> dict:
+        name = response_model.__name__ if response_model is not None else None
+        if name == "ExtractedEntities":
+            return {"extracted_entities": self._entities(text)}
+        if name == "ExtractedEdges":
+            return {"edges": self._edges(text)}
+        if name == "NodeResolutions":
+            return {"entity_resolutions": self._node_resolutions(text)}
+        if response_model is None:
+            return {"content": ""}
+        return default_instance(response_model)
+
+    async def _generate_response(
+        self,
+        messages,
+        response_model: type[BaseModel] | None = None,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        model_size: ModelSize = ModelSize.medium,
+    ) -> dict[str, typing.Any]:
+        model_type = response_model.__name__ if response_model is not None else "text"
+        started = time.perf_counter()
+        if self.latency_ms > 0:
+            spread = 1 + self._random.uniform(-self.jitter, self.jitter)
+            await asyncio.sleep(max(0.0, self.latency_ms * spread) / 1000)
+        prompt = "\n".join(m.content for m in messages)
+        response = self._respond(messages[-1].content, response_model)
+        self.calls[model_type] += 1
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(json.dumps(response))}
+        output_budget.record(model_type, usage, (time.perf_counter() - started) * 1000)
+        return response
+
+
+class HashEmbedder(EmbedderClient):
+    def __init__(self, dim: int = EMBEDDING_DIM, latency_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def _vector(self, text: str) -> list[float]:
+        rng = random.Random(hashlib.sha1(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dim)]
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    async def create(self, input_data) -> list[float]:
+        self.calls += 1
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+        text = input_data if isinstance(input_data, str) else json.dumps(input_data, default=str)
+        return self._vector(text)
+
+    async def create_batch(self, input_data_list: list[str]) -> list[list[float]]:
+        self.calls += 1
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in input_data_list]
+
+
+class OverlapCrossEncoder(CrossEncoderClient):
+    def __init__(self):
+        self.calls = 0
+
+    async def rank(self, query: str, passages: list[str]) -> list[tuple[str, float]]:
+        self.calls += 1
+        words = set(query.lower().split())
+        scored = [(p, len(words & set(p.lower().split())) / (len(words) or 1)) for p in passages]
+        return sorted(scored, key=lambda item: item[1], reverse=True)
+
+
+def offline_driver(path: str = ":memory:"):
+    """graphiti-core's embedded Kuzu driver; raises ImportError with install instructions without kuzu."""
+    try:
+        import kuzu
+        from graphiti_core.driver.kuzu_driver import KuzuDriver
+    except ImportError as e:
+        raise ImportError('The offline graph needs the kuzu package: pip install "graphiti-core[kuzu]"') from e
+    from graphiti_core.driver.driver import GraphProvider
+    from graphiti_core.graph_queries import get_fulltext_indices
+
+    driver = KuzuDriver(db=path)
+    # KuzuDriver.build_indices_and_constraints is a no-op, but add_episode's searches need the
+    # full-text indexes (fts extension; INSTALL fetches it once, then it is cached locally)
+    conn = kuzu.Connection(driver.db)
+    try:
+        conn.execute("INSTALL fts")
+        conn.execute("LOAD EXTENSION fts")
+        existing = {row[1] for row in conn.execute("CALL SHOW_INDEXES() RETURN *").get_all()}
+        for query in get_fulltext_indices(GraphProvider.KUZU):
+            if re.search(r"'(\w+)', \[", query).group(1) not in existing:
+                conn.execute(query)
+    finally:
+        conn.close()
+    return driver
@@ -0,0 +1,187 @@
+"""Deterministic LLM response cache.
+
+Classification-style prompts (UPDATE vs CONTRADICTS decisions, memory merges, relevance
+filtering) are frequently repeated verbatim across retries and identical inputs. Responses
+to such calls are cached under a hash of (deployment, messages, generation params):
+
+  * memory tier     - per-process LRU bounded by LLM_CACHE_MAX_ENTRIES, TTL LLM_CACHE_TTL_SECONDS
+  * persistent tier - opt-in SQLite file at LLM_CACHE_PATH shared across processes/restarts
+                      (bounded by LLM_CACHE_PERSISTENT_MAX_ENTRIES, same TTL). Off unless a path is set.
+
+Only deterministic calls are cached: temperature == 0, or callers that pass cache=True.
+LLM_CACHE_ENABLED=0 bypasses the cache globally; cache=False bypasses it per call.
+
+Used by `views.llm_generate_async` / `views.llm_generate_json_async` and
+`AzureOpenAIManager.generate_completion`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+
+def make_key(deployment: str, messages: list, params: dict) -> str:
+    """Stable hash of everything that influences the completion."""
+    canonical = json.dumps(
+        {"deployment": deployment, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def should_cache(temperature, cache: bool | None) -> bool:
+    if not getattr(settings, "LLM_CACHE_ENABLED", True) or cache is False:
+        return False
+    if cache is True:
+        return True
+    return temperature is not None and float(temperature) == 0.0
+
+
+class _MemoryTier:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class _SQLiteTier:
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires_at)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self) -> None:
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+class LLMResponseCache:
+    """Two-tier (memory + SQLite) cache of completion text keyed by `make_key`."""
+
+    def __init__(self):
+        ttl = getattr(settings, "LLM_CACHE_TTL_SECONDS", 86400)
+        self.memory = _MemoryTier(getattr(settings, "LLM_CACHE_MAX_ENTRIES", 2048), ttl)
+        self.persistent = None
+        path = getattr(settings, "LLM_CACHE_PATH", "")
+        if path:
+            try:
+                self.persistent = _SQLiteTier(str(path), getattr(settings, "LLM_CACHE_PERSISTENT_MAX_ENTRIES", 50000), ttl)
+            except Exception as e:
+                print(f"[llm_cache] Persistent tier disabled ({path}): {e}")
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.incr("llm_cache.hits", tier="memory")
+            return value
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception as e:
+                print(f"[llm_cache] Persistent read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                metrics.incr("llm_cache.hits", tier="persistent")
+                return value
+        metrics.incr("llm_cache.misses")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        if value is None:
+            return
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value)
+            except Exception as e:
+                print(f"[llm_cache] Persistent write failed: {e}")
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+
+_cache: LLMResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
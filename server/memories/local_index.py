@@ -0,0 +1,206 @@
+"""In-process derived indexes over the memories container.
+
+These structures are maintained incrementally by the change-feed projector
+(see `change_feed.py`) instead of being rebuilt from Cosmos on demand:
+
+* LocalVectorIndex  - dense float32 matrix of normalized embeddings (cosine via dot product)
+* LexicalIndex      - token inverted index with BM25 scoring
+
+Both are thread-safe and keyed by memory id so upserts/deletes are O(1) amortized. Each row
+keeps the memory's content and timestamps as metadata, so `fallback_search` can answer
+`retrieve_memories` from this process when Cosmos vector search or query embedding fails.
+"""
+from __future__ import annotations
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+class LocalVectorIndex:
+    """Cosine-similarity index backed by a growable NumPy matrix.
+
+    Deleted rows are swapped with the last row so the matrix stays dense.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._matrix: np.ndarray | None = None
+        self._ids: list[str] = []
+        self._row_of: dict[str, int] = {}
+        self._meta: dict[str, dict] = {}
+        self._capacity = initial_capacity
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _ensure_matrix(self, dim: int):
+        if self._matrix is None:
+            self._matrix = np.zeros((self._capacity, dim), dtype=np.float32)
+        elif len(self._ids) >= self._matrix.shape[0]:
+            grown = np.zeros((self._matrix.shape[0] * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[: self._matrix.shape[0]] = self._matrix
+            self._matrix = grown
+
+    def upsert(self, memory_id: str, embedding, meta: dict | None = None) -> None:
+        if not embedding:
+            # Nothing to index; make sure a stale vector is not left behind
+            self.delete(memory_id)
+            return
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            self.delete(memory_id)  # not searchable either; drop the previous vector
+            return
+        vec = vec / norm
+        with self._lock:
+            if self._matrix is not None and vec.shape[0] != self._matrix.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {vec.shape[0]} does not match index dimension {self._matrix.shape[1]}"
+                )
+            row = self._row_of.get(memory_id)
+            if row is None:
+                self._ensure_matrix(vec.shape[0])
+                row = len(self._ids)
+                self._ids.append(memory_id)
+                self._row_of[memory_id] = row
+            self._matrix[row] = vec
+            self._meta[memory_id] = meta or {}
+
+    def delete(self, memory_id: str) -> bool:
+        with self._lock:
+            row = self._row_of.pop(memory_id, None)
+            if row is None:
+                return False
+            last = len(self._ids) - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                self._row_of[moved_id] = row
+            self._ids.pop()
+            self._meta.pop(memory_id, None)
+            return True
+
+    def search(self, query_embedding, top_k: int = 5) -> list[tuple[str, float, dict]]:
+        """Return [(id, cosine_similarity, meta)] for the top_k nearest rows."""
+        with self._lock:
+            n = len(self._ids)
+            if n == 0 or not query_embedding:
+                return []
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q_norm = float(np.linalg.norm(q))
+            if q_norm == 0.0:
+                return []
+            scores = self._matrix[:n] @ (q / q_norm)
+            k = min(top_k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[i], float(scores[i]), self._meta.get(self._ids[i], {})) for i in top]
+
+
+class LexicalIndex:
+    """BM25 inverted index over memory content."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self._lock = threading.RLock()
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._doc_len: dict[str, int] = {}
+        self._doc_terms: dict[str, list[str]] = {}
+        self._meta: dict[str, dict] = {}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def upsert(self, memory_id: str, text: str, meta: dict | None = None) -> None:
+        tokens = tokenize(text)
+        with self._lock:
+            self.delete(memory_id)
+            self._meta[memory_id] = meta or {}
+            counts = Counter(tokens)
+            for term, tf in counts.items():
+                self._postings[term][memory_id] = tf
+            self._doc_terms[memory_id] = list(counts)
+            self._doc_len[memory_id] = len(tokens)
+            self._total_len += len(tokens)
+
+    def delete(self, memory_id: str) -> bool:
+        with self._lock:
+            terms = self._doc_terms.pop(memory_id, None)
+            if terms is None:
+                return False
+            self._meta.pop(memory_id, None)
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.pop(memory_id, None)
+                    if not posting:
+                        del self._postings[term]
+            self._total_len -= self._doc_len.pop(memory_id, 0)
+            return True
+
+    def get_meta(self, memory_id: str) -> dict:
+        with self._lock:
+            return self._meta.get(memory_id, {})
+
+    def search(self, query: str, top_k: int = 5) -> list[tuple[str, float]]:
+        with self._lock:
+            n = len(self._doc_len)
+            if n == 0:
+                return []
+            avg_len = (self._total_len / n) or 1.0
+            scores: dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    dl = self._doc_len.get(doc_id, 0)
+                    denom = tf + self.k1 * (1 - self.b + self.b * dl / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / denom
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+            return ranked[:top_k]
+
+
+# Process-wide instances shared by the change-feed projector and readers
+vector_index = LocalVectorIndex()
+lexical_index = LexicalIndex()
+
+
+def doc_meta(doc: dict) -> dict:
+    """Metadata kept per row: enough to shape a retrieve_memories hit without Cosmos."""
+    return {key: doc.get(key) for key in ("content", "created_at", "updated_at", "userId")}
+
+
+def fallback_search(query_text: str, embedding=None, top_k: int = 5) -> list[dict] | None:
+    """Search this process's indexes; None when the relevant index has not been populated.
+
+    Uses the vector index when a query embedding is available, otherwise BM25 over content.
+    Hits are shaped like retrieve_memories items ({id, content, created_at, updated_at, similarity}).
+    """
+    if embedding is not None and len(vector_index):
+        hits = [(memory_id, score, meta) for memory_id, score, meta in vector_index.search(embedding, top_k)]
+    elif len(lexical_index):
+        hits = [(memory_id, score, lexical_index.get_meta(memory_id))
+                for memory_id, score in lexical_index.search(query_text, top_k)]
+    else:
+        return None
+    return [
+        {"id": memory_id, "content": meta.get("content"), "created_at": meta.get("created_at"),
+         "updated_at": meta.get("updated_at"), "similarity": score}
+        for memory_id, score, meta in hits
+        if meta.get("content")
+    ]
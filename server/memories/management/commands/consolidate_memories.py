@@ -0,0 +1,60 @@
+"""Cluster and merge near-duplicate memories.
+
+Usage:
+  python manage.py consolidate_memories --user <userId> --dry-run
+  python manage.py consolidate_memories --user <userId> --threshold 0.92
+  python manage.py consolidate_memories --all-users --json   # each user clustered separately
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from memories.consolidation import consolidate
+
+
+class Command(BaseCommand):
+    help = "Merge clusters of near-duplicate memories (one LLM call per cluster) and tombstone the originals"
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument("--user", help="userId whose memories should be consolidated")
+        scope.add_argument("--all-users", action="store_true", help="Consolidate every user (clusters never span users)")
+        parser.add_argument("--threshold", type=float, default=None, help="Cosine similarity threshold (default from settings)")
+        parser.add_argument("--block-size", type=int, default=None, help="Rows per similarity block")
+        parser.add_argument("--max-cluster-size", type=int, default=None, help="Max memories merged per LLM call")
+        parser.add_argument("--concurrency", type=int, default=None, help="Parallel merge/write workers")
+        parser.add_argument("--dry-run", action="store_true", help="Report clusters without calling the LLM or writing")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+
+    def handle(self, *args, **options):
+        if options["threshold"] is not None and not 0 < options["threshold"] <= 1:
+            raise CommandError("--threshold must be in (0, 1]")
+        report = consolidate(
+            user_id=None if options["all_users"] else options["user"],
+            threshold=options["threshold"],
+            block_size=options["block_size"],
+            max_cluster_size=options["max_cluster_size"],
+            dry_run=options["dry_run"],
+            concurrency=options["concurrency"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        clustered = sum(c["size"] for c in report["clusters"])
+        self.stdout.write(
+            f"Scanned {report['memories_scanned']} memories; {len(report['clusters'])} clusters "
+            f"covering {clustered} memories (threshold={report['threshold']})"
+        )
+        for n, cluster in enumerate(report["clusters"], start=1):
+            self.stdout.write(f"\nCluster {n} ({cluster['size']} memories)")
+            for member in cluster["members"]:
+                self.stdout.write(f"  - {member['id']}: {(member['content'] or '')[:120]}")
+            if cluster.get("merged_id"):
+                self.stdout.write(f"  => {cluster['merged_id']}: {cluster['merged_content'][:160]}")
+        if report["dry_run"]:
+            self.stdout.write(f"\nDry run: would merge {len(report['clusters'])} clusters and tombstone {clustered} memories")
+        else:
+            self.stdout.write(f"\nMerged {report['merged']} clusters, tombstoned {report['tombstoned']} memories")
+        for err in report["errors"]:
+            self.stderr.write(f"  error: {err}")
@@ -0,0 +1,36 @@
+"""Export memories and summaries as NDJSON.
+
+Usage:
+  python manage.py export_memories --user <userId> --output alice.ndjson
+  python manage.py export_memories --include memory > all-memories.ndjson
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from memories.transfer import RECORD_TYPES, iter_export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream memories/summaries to NDJSON (embeddings packed as base64 float32)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only export this userId (default: everything)")
+        parser.add_argument("--include", default=",".join(RECORD_TYPES), help="Comma separated: memory,summary")
+        parser.add_argument("--output", "-o", help="Output file (default: stdout)")
+        parser.add_argument("--page-size", type=int, default=None, help="Cosmos page size")
+
+    def handle(self, *args, **options):
+        include = tuple(t.strip() for t in options["include"].split(",") if t.strip())
+        unknown = [t for t in include if t not in RECORD_TYPES]
+        if unknown:
+            raise CommandError(f"Invalid --include value(s): {', '.join(unknown)}")
+        lines = iter_export_lines(options["user"], include, options["page_size"])
+        if options["output"]:
+            with open(options["output"], "wb") as fh:
+                for line in lines:
+                    fh.write(line)
+        else:
+            for line in lines:
+                sys.stdout.buffer.write(line)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,41 @@
+"""Flush buffered Graphiti candidates (see memories/episode_buffer.py).
+
+Usage:
+  python manage.py flush_episode_buffers                  # buffers past EPISODE_BUFFER_MAX_AGE_SECONDS
+  python manage.py flush_episode_buffers --all            # every non-empty buffer
+  python manage.py flush_episode_buffers --interval 60    # keep sweeping every 60 seconds
+
+Stale inflight batches left behind by a crashed flush are recovered on every sweep.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from memories import episode_buffer, graphiti_loop
+
+
+class Command(BaseCommand):
+    help = "Flush due episode buffers into Graphiti and recover interrupted flushes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Flush every non-empty buffer regardless of age")
+        parser.add_argument("--interval", type=float, default=None, help="Sweep every N seconds until interrupted")
+        parser.add_argument("--json", action="store_true", help="Print each sweep's report as JSON")
+
+    def handle(self, *args, **options):
+        if options["interval"] is not None and options["interval"] <= 0:
+            raise CommandError("--interval must be > 0")
+        while True:
+            report = graphiti_loop.run(episode_buffer.flush_due(force=options["all"]), timeout=0)
+            if options["json"]:
+                self.stdout.write(json.dumps(report, ensure_ascii=False))
+            else:
+                self.stdout.write(f"{report['buffers']} due buffer(s), flushed {len(report['flushed'])} episode(s)")
+                for name in report["flushed"]:
+                    self.stdout.write(f"  - {name}")
+            for err in report["errors"]:
+                self.stderr.write(f"  error: {err}")
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
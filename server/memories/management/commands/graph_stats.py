@@ -0,0 +1,54 @@
+"""Report Neo4j graph statistics for the Graphiti store.
+
+Usage:
+  python manage.py graph_stats
+  python manage.py graph_stats --top 20
+  python manage.py graph_stats --json
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from memories import graph_stats, graphiti_loop
+
+
+class Command(BaseCommand):
+    help = "Report node/relationship counts, degree distribution and missing indexes of the Graphiti graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10, help="Highest-degree nodes to list per label")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+
+    def handle(self, *args, **options):
+        if options["top"] < 0:
+            raise CommandError("--top must be >= 0")
+        try:
+            report = graphiti_loop.run(graph_stats.collect(top=options["top"]), timeout=0)
+        except Exception as e:
+            raise CommandError(f"Could not collect graph statistics: {e}")
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+            return
+
+        self.stdout.write(f"Nodes ({sum(report['nodes'].values())}):")
+        for label, count in sorted(report["nodes"].items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  {label:<24} {count}")
+        self.stdout.write(f"\nRelationships ({sum(report['edges'].values())}):")
+        for rel_type, count in sorted(report["edges"].items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  {rel_type:<24} {count}")
+
+        for label, degrees in report["degrees"].items():
+            self.stdout.write(
+                f"\n{label} degree: avg={degrees['avg']} p50={degrees['p50']} p90={degrees['p90']} "
+                f"p99={degrees['p99']} max={degrees['max']}"
+            )
+            self.stdout.write("  " + "  ".join(f"{bucket}: {count}" for bucket, count in degrees["buckets"].items()))
+            for hub in degrees["top"]:
+                self.stdout.write(f"  - {hub['degree']:>6}  {hub['name'] or hub['uuid']} (group {hub['group_id']})")
+
+        indexes = report["indexes"]
+        self.stdout.write(f"\nIndexes: {indexes['total']} present, {len(indexes['missing'])} missing")
+        for ix in indexes["missing"]:
+            self.stdout.write(f"  missing: {ix['entity']}({', '.join(ix['properties'])})")
+        for ix in indexes["not_online"]:
+            self.stderr.write(f"  not online: {ix['name']} ({ix['state']})")
@@ -0,0 +1,42 @@
+"""Import memories and summaries from an NDJSON export.
+
+Usage:
+  python manage.py import_memories --input alice.ndjson
+  python manage.py import_memories --input alice.ndjson --user alice-copy --skip-existing
+  cat alice.ndjson | python manage.py import_memories
+"""
+import sys
+
+from django.core.management.base import BaseCommand
+
+from memories.transfer import import_lines
+
+
+class Command(BaseCommand):
+    help = "Import NDJSON produced by export_memories (reuses packed embeddings; no re-embedding)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--input", "-i", help="Input file (default: stdin)")
+        parser.add_argument("--user", help="Import as a copy owned by this userId (new ids; the source user's documents are untouched)")
+        parser.add_argument("--skip-existing", action="store_true", help="Do not overwrite existing documents")
+        parser.add_argument("--batch-size", type=int, default=None, help="Documents written per chunk")
+        parser.add_argument("--concurrency", type=int, default=None, help="Parallel writers")
+
+    def handle(self, *args, **options):
+        kwargs = dict(
+            user_id_override=options["user"],
+            batch_size=options["batch_size"],
+            skip_existing=options["skip_existing"],
+            concurrency=options["concurrency"],
+        )
+        if options["input"]:
+            with open(options["input"], "rb") as fh:
+                stats = import_lines(fh, **kwargs)
+        else:
+            stats = import_lines(sys.stdin.buffer, **kwargs)
+        self.stdout.write(
+            f"Imported {stats['memories']} memories and {stats['summaries']} summaries "
+            f"(skipped={stats['skipped']}, reembedded={stats['reembedded']}, errors={stats['error_count']})"
+        )
+        for err in stats["errors"]:
+            self.stderr.write(f"  error: {err}")
@@ -0,0 +1,54 @@
+"""Move Graphiti episodes from the shared default group into per-user groups (see memories/graph_regroup.py).
+
+Usage:
+  python manage.py regroup_graphiti_episodes --dry-run            # report what would move
+  python manage.py regroup_graphiti_episodes                      # episodes, then entities and facts
+  python manage.py regroup_graphiti_episodes --default-group legacy --batch-size 500
+
+Safe to re-run: only rows still in --from-group are read, so an interrupted run resumes.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from memories import graph_groups, graph_regroup, graphiti_loop
+
+
+class Command(BaseCommand):
+    help = "Re-tag Graphiti episodes, entities and facts with per-user group ids"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-group", default="", help="Group to move data out of (default: Graphiti's default group)")
+        parser.add_argument("--default-group", default=None, help="Group for episodes no memory traces back to a user")
+        parser.add_argument("--batch-size", type=int, default=200, help="Rows read and written per query")
+        parser.add_argument("--dry-run", action="store_true", help="Only report the episode moves")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if graph_groups.group_for_user("probe") is None:
+            raise CommandError("GRAPHITI_GROUP_ID_TEMPLATE is empty; per-user groups are disabled")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be >= 1")
+        report = graphiti_loop.run(graph_regroup.regroup(
+            from_group=options["from_group"],
+            batch_size=options["batch_size"],
+            default_group=options["default_group"],
+            dry_run=options["dry_run"],
+        ), timeout=0)
+        if options["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        prefix = "Would move" if report["dry_run"] else "Moved"
+        ep = report["episodes"]
+        self.stdout.write(
+            f"{prefix} {ep['regrouped']}/{ep['scanned']} episode(s) into {len(report['groups'])} group(s); "
+            f"{ep['unresolved']} unresolved, {ep['conflicting']} matching several users"
+        )
+        if not report["dry_run"]:
+            self.stdout.write(
+                f"Moved {report['entities']['regrouped']}/{report['entities']['scanned']} entities "
+                f"({report['entities']['shared']} shared across groups stay), "
+                f"{report['edges']['regrouped']}/{report['edges']['scanned']} facts"
+            )
+        for group_id, count in sorted(report["groups"].items(), key=lambda item: -item[1])[:20]:
+            self.stdout.write(f"  - {group_id}: {count} episode(s)")
@@ -0,0 +1,60 @@
+"""Run the memories change-feed projector as a standalone worker.
+
+Usage:
+  python manage.py run_change_feed
+  python manage.py run_change_feed --sinks graphiti --batch-size 200
+  python manage.py run_change_feed --once --from-beginning
+
+The continuation token and ownership lease are stored in COSMOS_LEASES_CONTAINER under
+the processor name, so restarting the worker resumes from the last checkpoint. The vector,
+lexical and cache sinks only update this worker's memory; web processes keep their own copies
+with CHANGE_FEED_IN_PROCESS=1.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from memories import metrics
+from memories.change_feed import ChangeFeedProjector, CosmosLeaseStore, build_sinks
+
+
+class Command(BaseCommand):
+    help = "Tail the memories container change feed and project changes into derived indexes/caches/Graphiti"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sinks", default=getattr(settings, "CHANGE_FEED_SINKS", "graphiti"),
+                            help="Comma separated sinks: vector, lexical, cache, graphiti")
+        parser.add_argument("--processor-name", default=getattr(settings, "CHANGE_FEED_PROCESSOR_NAME", "memories-projector"),
+                            help="Lease/checkpoint document id")
+        parser.add_argument("--batch-size", type=int, default=None, help="Max items per change-feed page")
+        parser.add_argument("--poll-interval", type=float, default=None, help="Seconds between polls")
+        parser.add_argument("--from-beginning", action="store_true",
+                            help="Start from the beginning of the feed when no checkpoint exists")
+        parser.add_argument("--once", action="store_true", help="Drain available changes once and exit")
+
+    def handle(self, *args, **options):
+        try:
+            sinks = build_sinks(options["sinks"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        lease_store = CosmosLeaseStore(options["processor_name"])
+        projector = ChangeFeedProjector(
+            sinks,
+            checkpoint_store=lease_store,
+            processor_name=options["processor_name"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            start_from_beginning=options["from_beginning"],
+        )
+        if not options["once"]:
+            projector.run_forever()
+            return
+        if not lease_store.acquire():
+            raise CommandError(f"Lease '{options['processor_name']}' is held by another worker")
+        try:
+            applied = projector.run_once()
+        finally:
+            lease_store.release()
+            for sink in sinks:
+                sink.close()
+        lag = metrics.snapshot()["gauges"].get(f"change_feed.lag_seconds{{processor={options['processor_name']}}}", {})
+        self.stdout.write(f"Applied {applied} changes (lag_seconds={lag.get('value', 0.0):.1f})")
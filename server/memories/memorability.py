@@ -0,0 +1,140 @@
+"""Cheap memorability gate run before any LLM call in process_memory.
+
+Most chat turns ("thanks!", "ok", "can you rephrase that") carry nothing worth remembering,
+yet each one would otherwise pay for summary -> candidate -> embed -> search -> decide.
+The gate combines, in order of cost:
+
+  1. content check                (no letters)
+  2. stop-phrase list             (exact match after normalization)
+  3. regex heuristics             (requests about the assistant's previous answer)
+  4. self-fact fast accept        (declarative first-person facts: "I'm vegan.", "I live in Oslo",
+                                   "my son is 4" -> memorable, no model call; runs before the
+                                   length floor so short facts survive)
+  5. other first-person messages  ("I'm not sure", "I don't know") -> ambiguous, left to stage 7
+  6. length floor                 (too short)
+  7. optional small-model classification for whatever is still ambiguous
+
+Every decision is counted in memories.metrics (`memorability.decisions{outcome,reason}`).
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from . import metrics
+
+DEFAULT_STOP_PHRASES = (
+    "ok", "okay", "k", "kk", "thanks", "thank you", "thanks a lot", "thank you so much", "thx", "ty",
+    "cool", "nice", "great", "awesome", "perfect", "got it", "sounds good", "sure", "yes", "no", "yep",
+    "nope", "hmm", "hi", "hello", "hey", "bye", "goodbye", "lol", "haha", "continue", "go on", "next",
+    "please continue", "makes sense", "i see", "alright", "all right", "good", "done", "same",
+)
+
+_META_REQUEST_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"^(can|could|would) you (please )?(re-?phrase|rewrite|reword|shorten|summari[sz]e|simplify|expand|explain) (that|this|it)\b",
+        r"^(please )?(re-?phrase|rewrite|reword|shorten|simplify|translate|expand on|elaborate on) (that|this|it)\b",
+        r"^(make|keep) (it|that|this) (shorter|longer|simpler|more formal|more casual|concise)\b",
+        r"^(try|do) (it |that )?again\b",
+        r"^(what|huh)\?*$",
+        r"^(say|tell me) (that|it) again\b",
+        r"^(more|another) (example|one|options?)\b",
+    )
+]
+
+# First person as the subject; object pronouns ("tell me", "help us") are requests, not facts
+_PERSONAL_SIGNAL = re.compile(r"\b(i|i'm|im|i've|i'd|i'll|my|mine|we|we're|our)\b", re.IGNORECASE)
+# Declarative self-facts ("I'm vegan", "I live in Oslo", "my son is 4"), matched on the normalized
+# message; hedges and small talk after the verb ("I'm not sure", "I have a question") are excluded
+_SELF_FACT = re.compile(
+    r"^(i am|i'm|im|i have|i've|i live|i work|i was born|i grew up|i own|i like|i love|i hate|i prefer|"
+    r"my \w+ (is|are|was)|my \w+'s|we live|we have|we own|our \w+ (is|are|was)|our \w+'s) "
+    r"(?!(not|sure|fine|good|ok|okay|sorry|done|back|here|glad|confused|lost|kidding|joking|just|"
+    r"going|gonna|trying|wondering|thinking|looking|a question|no idea|to)\b)\w",
+    re.IGNORECASE,
+)
+_NORMALIZE = re.compile(r"[^\w\s']+")
+
+
+@dataclass
+class GateDecision:
+    memorable: bool
+    reason: str
+    stage: str  # "length" | "stop_phrase" | "heuristic" | "classifier" | "disabled"
+
+
+def _normalize(message: str) -> str:
+    return " ".join(_NORMALIZE.sub(" ", message.lower()).split())
+
+
+def _stop_phrases() -> frozenset:
+    configured = getattr(settings, "MEMORABILITY_STOP_PHRASES", None)
+    phrases = configured if configured else DEFAULT_STOP_PHRASES
+    return frozenset(_normalize(p) for p in phrases)
+
+
+def assess_heuristics(message: str) -> GateDecision | None:
+    """Run the model-free checks. Returns a decision, or None when the message is ambiguous."""
+    text = (message or "").strip()
+    min_chars = getattr(settings, "MEMORABILITY_MIN_CHARS", 12)
+    normalized = _normalize(text)
+
+    if not re.search(r"[^\W\d_]", text):
+        return GateDecision(False, "no_letters", "length")
+    if normalized in _stop_phrases():
+        return GateDecision(False, "stop_phrase", "stop_phrase")
+    for pattern in _META_REQUEST_PATTERNS:
+        if pattern.search(normalized):
+            return GateDecision(False, "meta_request", "heuristic")
+    # Before the length floor: "I'm vegan." is short but exactly what should be remembered
+    if _SELF_FACT.search(normalized):
+        return GateDecision(True, "self_fact", "heuristic")
+    if _PERSONAL_SIGNAL.search(normalized):
+        return None  # first person but not a plain fact: the classifier decides
+    if len(text) < min_chars:
+        return GateDecision(False, "too_short", "length")
+    return None
+
+
+CLASSIFIER_PROMPT = (
+    "Does the following chat message contain durable information about the user "
+    "(facts, preferences, plans, relationships, decisions) worth remembering for future conversations?\n"
+    "Answer with exactly one word: YES or NO.\n\n"
+    "Message:\n"
+)
+
+
+async def assess_memorability(message: str, classify=None) -> GateDecision:
+    """Decide whether `message` should go through the full memory pipeline.
+
+    Args:
+        message: the incoming user message.
+        classify: optional async callable(prompt) -> str used for the small-model classification
+            stage (only when MEMORABILITY_CLASSIFIER_ENABLED and heuristics are inconclusive).
+    """
+    if not getattr(settings, "MEMORABILITY_GATE_ENABLED", True):
+        decision = GateDecision(True, "gate_disabled", "disabled")
+    else:
+        decision = assess_heuristics(message)
+        if decision is None:
+            decision = GateDecision(True, "ambiguous", "heuristic")
+            if classify is not None and getattr(settings, "MEMORABILITY_CLASSIFIER_ENABLED", False):
+                try:
+                    answer = (await classify(CLASSIFIER_PROMPT + message)).strip().upper()
+                    if answer.startswith("NO"):
+                        decision = GateDecision(False, "classifier_no", "classifier")
+                    else:
+                        decision = GateDecision(True, "classifier_yes", "classifier")
+                except Exception as e:
+                    # Fail open: a classifier outage must not drop memories
+                    print(f"[memorability] Classifier failed, treating as memorable: {e}")
+                    decision = GateDecision(True, "classifier_error", "classifier")
+    metrics.incr(
+        "memorability.decisions",
+        outcome="pass" if decision.memorable else "skip",
+        reason=decision.reason,
+    )
+    return decision
@@ -0,0 +1,97 @@
+"""Lightweight in-process metrics registry.
+
+Counters, gauges and latency observations are kept in memory per process and can be
+read back via `snapshot()` (exposed at /api/memories/metrics/). This is intentionally
+dependency-free; forward the snapshot to Azure Monitor / Prometheus if needed.
+
+Usage:
+    from . import metrics
+    metrics.incr("process_memory.skipped", reason="stop_phrase")
+    metrics.set_gauge("change_feed.lag_seconds", 3.2, processor="memories")
+    metrics.observe("llm.latency_ms", 412.0, tier="small")
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+
+# Bounded window of raw observations kept per series for percentile reporting
+_OBSERVATION_WINDOW = 512
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, dict] = {}
+_observations: dict[str, deque] = {}
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    parts = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{parts}}}"
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    """Increment a counter (created on first use)."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge to the latest value and remember when it was set."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = {"value": value, "updated_at": time.time()}
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record a single observation (e.g. latency in ms) for percentile reporting."""
+    key = _key(name, labels)
+    with _lock:
+        window = _observations.get(key)
+        if window is None:
+            window = _observations[key] = deque(maxlen=_OBSERVATION_WINDOW)
+        window.append(float(value))
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a sequence (0.0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def get_counter(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def snapshot() -> dict:
+    """Return a JSON-serializable copy of all metrics."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = {k: dict(v) for k, v in _gauges.items()}
+        windows = {k: list(v) for k, v in _observations.items()}
+    observations = {
+        k: {
+            "count": len(v),
+            "mean": (sum(v) / len(v)) if v else 0.0,
+            "p50": percentile(v, 50),
+            "p95": percentile(v, 95),
+            "max": max(v) if v else 0.0,
+        }
+        for k, v in windows.items()
+    }
+    return {"counters": counters, "gauges": gauges, "observations": observations}
+
+
+def reset() -> None:
+    """Clear all metrics (used by scripts/benchmarks between runs)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _observations.clear()
@@ -0,0 +1,90 @@
+"""Per-prompt model tiers.
+
+Each prompt built in views.py runs on a tier (PROMPT_MODEL_TIERS[name]):
+
+    small   AZURE_OPENAI_SMALL_DEPLOYMENT, the router's "small" pool - classification and filtering
+    large   AZURE_OPENAI_DEPLOYMENT, the router's "chat" pool - text the memory store keeps
+
+Classification-style prompts (relevance filter, UPDATE vs CONTRADICTS arbitration, memorability
+gate) default to small; summaries, candidate extraction and merges default to large.
+
+Every call is reported with its tier so the split can be tuned from GET /api/memories/metrics/:
+llm.calls{prompt,tier}, llm.latency_ms{prompt,tier} (observation), and from the response usage
+llm.prompt_tokens{prompt,tier}, llm.cached_tokens{prompt,tier} (provider prompt-cache hits) and
+llm.cached_token_ratio{prompt,tier} (gauge, cumulative cached / prompt tokens).
+"""
+from __future__ import annotations
+
+import threading
+
+from django.conf import settings
+
+from . import metrics
+
+SMALL, LARGE = "small", "large"
+
+DEFAULT_PROMPT_TIERS = {
+    "relevance": SMALL,
+    "decide": SMALL,
+    "memorability": SMALL,
+    "summary": LARGE,
+    "candidate": LARGE,
+    "summary_and_candidates": LARGE,
+    "merge": LARGE,
+    "summary_compaction": LARGE,
+}
+
+
+def tier_for(prompt: str | None) -> str:
+    if not prompt:
+        return LARGE
+    tier = {**DEFAULT_PROMPT_TIERS, **getattr(settings, "PROMPT_MODEL_TIERS", {})}.get(prompt, LARGE)
+    return tier if tier in (SMALL, LARGE) else LARGE
+
+
+def kind_for(prompt: str | None) -> str:
+    """Router pool for the prompt's tier."""
+    return "small" if tier_for(prompt) == SMALL else "chat"
+
+
+def deployment_for(prompt: str | None) -> str:
+    if tier_for(prompt) == SMALL:
+        return getattr(settings, "AZURE_OPENAI_SMALL_DEPLOYMENT", None) or settings.AZURE_OPENAI_DEPLOYMENT
+    return settings.AZURE_OPENAI_DEPLOYMENT
+
+
+def _usage_field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def cached_tokens(usage) -> tuple[int, int]:
+    """(prompt_tokens, cached_tokens) from a chat completion's usage (JSON body or SDK object)."""
+    if usage is None:
+        return 0, 0
+    details = _usage_field(usage, "prompt_tokens_details")
+    cached = _usage_field(details, "cached_tokens") if details is not None else None
+    return int(_usage_field(usage, "prompt_tokens") or 0), int(cached or 0)
+
+
+_token_totals: dict[tuple[str, str], list[int]] = {}
+_totals_lock = threading.Lock()
+
+
+def record(prompt: str | None, latency_ms: float, ok: bool = True, usage=None) -> None:
+    tier = tier_for(prompt)
+    prompt = prompt or "other"
+    metrics.incr("llm.calls", prompt=prompt, tier=tier, outcome="ok" if ok else "error")
+    if ok:
+        metrics.observe("llm.latency_ms", latency_ms, prompt=prompt, tier=tier)
+    prompt_tokens, cached = cached_tokens(usage)
+    if prompt_tokens:
+        metrics.incr("llm.prompt_tokens", prompt_tokens, prompt=prompt, tier=tier)
+        metrics.incr("llm.cached_tokens", cached, prompt=prompt, tier=tier)
+        with _totals_lock:
+            totals = _token_totals.setdefault((prompt, tier), [0, 0])
+            totals[0] += prompt_tokens
+            totals[1] += cached
+            ratio = totals[1] / totals[0]
+        metrics.set_gauge("llm.cached_token_ratio", round(ratio, 4), prompt=prompt, tier=tier)
+    print(f"[model_tiers] prompt={prompt} tier={tier} latency_ms={latency_ms:.0f} ok={ok} "
+          f"prompt_tokens={prompt_tokens} cached_tokens={cached}")
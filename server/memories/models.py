@@ -18,13 +18,15 @@ class Memory:
 
     @classmethod
     def from_cosmos_item(cls, item):
-        return cls(
+        memory = cls(
             id=item.get('id'),
             content=item.get('content'),
             created_at=item.get('created_at'),
             updated_at=item.get('updated_at'),
             embedding=item.get('embedding')
         )
+        memory.etag = item.get('_etag')
+        return memory
 
     def to_cosmos_item(self):
         return {
@@ -0,0 +1,459 @@
+"""Latency-aware routing across a pool of Azure OpenAI deployments.
+
+Every chat / embedding call (views.py over httpx, AzureOpenAIManager and the Graphiti clients
+over the openai SDK) goes through one DeploymentRouter. Deployments are grouped by kind
+("chat", "small", "embedding"); each keeps an EWMA of latency and error rate plus a window
+of recent latencies. A request goes to the deployment with the lowest
+
+    ewma_latency * (1 + in_flight) / weight / (1 - error_rate)^2
+
+(untried deployments first), plus the time its rate limiter would make the request wait.
+Connection errors, timeouts, 404, 408 and 5xx count against the deployment and the request fails
+over to the next best one (ROUTER_MAX_ATTEMPTS). A deployment with ROUTER_COOLDOWN_ERRORS
+consecutive errors is skipped for ROUTER_COOLDOWN_SECONDS.
+
+Rate limits (memories/rate_limiter.py): every attempt first reserves its estimated tokens on the
+deployment's TPM / RPM buckets and waits if they are empty. A 429 is not a health signal: it
+blocks the deployment for its Retry-After and the request is queued again on the best deployment
+(up to RATE_LIMIT_MAX_RETRIES times) instead of failing.
+
+Hedging (ROUTER_HEDGING_ENABLED): when a request to the primary has not finished after the
+primary's p95 latency (once ROUTER_HEDGE_MIN_SAMPLES are known, never below
+ROUTER_HEDGE_MIN_DELAY_MS), a duplicate goes to the second best deployment and the first
+successful response wins; the other is cancelled and its rate-limit reservation returned.
+
+Pool (AZURE_OPENAI_POOL, JSON list). Without it the pool is built from AZURE_OPENAI_*:
+
+    [{"name": "eus-4o", "kind": "chat", "endpoint": "https://...", "deployment": "gpt-4o",
+      "api_key": "...", "api_version": "2024-08-01-preview", "weight": 1, "tpm": 150000, "rpm": 900}, ...]
+
+Metrics: router.requests{deployment,outcome}, router.latency_ms{deployment},
+router.ewma_ms{deployment} (gauge), router.failovers{kind}, router.hedges{outcome},
+router.throttled_retries{kind}.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import httpx
+from django.conf import settings
+
+from . import metrics
+from .rate_limiter import RateLimiter, estimate_tokens
+
+
+class DeploymentError(RuntimeError):
+    """A request failed on every deployment tried; `status_code` is the last HTTP status (or None)."""
+
+    def __init__(self, message: str, status_code: int | None = None, response_text: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text
+
+
+def _status_of(exc: BaseException) -> int | None:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return getattr(exc, "status_code", None)
+
+
+def _counts_against_deployment(exc: BaseException) -> bool:
+    status = _status_of(exc)
+    return status is None or status in (404, 408) or status >= 500
+
+
+def _is_throttled(exc: BaseException) -> bool:
+    return _status_of(exc) == 429
+
+
+@dataclass
+class Deployment:
+    name: str
+    kind: str
+    endpoint: str
+    deployment: str
+    api_key: str
+    api_version: str
+    weight: float = 1.0
+    tpm: float | None = None
+    rpm: float | None = None
+    ewma_ms: float | None = None
+    error_rate: float = 0.0
+    in_flight: int = 0
+    consecutive_errors: int = 0
+    cooldown_until: float = 0.0
+    samples: deque = field(default_factory=lambda: deque(maxlen=getattr(settings, "ROUTER_LATENCY_WINDOW", 200)))
+
+    def url(self, operation: str) -> str:
+        return f"{self.endpoint}/openai/deployments/{self.deployment}/{operation}?api-version={self.api_version}"
+
+    def score(self) -> float:
+        if self.ewma_ms is None:
+            # Explore untried deployments first; one that has only ever failed goes last
+            return -1.0 if self.error_rate == 0 else float("inf")
+        health = max(1.0 - self.error_rate, 0.05) ** 2
+        return self.ewma_ms * (1 + self.in_flight) / max(self.weight, 1e-6) / health
+
+    def p95_ms(self) -> float | None:
+        if len(self.samples) < getattr(settings, "ROUTER_HEDGE_MIN_SAMPLES", 20):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "deployment": self.deployment,
+            "ewma_ms": None if self.ewma_ms is None else round(self.ewma_ms, 1),
+            "p95_ms": self.p95_ms(),
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "cooling_down": self.cooldown_until > time.time(),
+        }
+
+
+def _default_pool() -> list[dict]:
+    endpoint = (settings.AZURE_OPENAI_ENDPOINT or "").rstrip("/")
+    llm_endpoint = (getattr(settings, "AZURE_OPENAI_LLM_ENDPOINT", None) or endpoint).rstrip("/")
+    embedding_endpoint = (getattr(settings, "AZURE_OPENAI_EMBEDDING_ENDPOINT", None) or endpoint).rstrip("/")
+    pool = [{"name": "chat", "kind": "chat", "endpoint": llm_endpoint, "deployment": settings.AZURE_OPENAI_DEPLOYMENT}]
+    small = getattr(settings, "AZURE_OPENAI_SMALL_DEPLOYMENT", None)
+    if small and small != settings.AZURE_OPENAI_DEPLOYMENT:
+        pool.append({"name": "small", "kind": "small", "endpoint": llm_endpoint, "deployment": small})
+    if settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT:
+        pool.append({"name": "embedding", "kind": "embedding", "endpoint": embedding_endpoint,
+                     "deployment": settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT})
+    return pool
+
+
+class DeploymentRouter:
+    def __init__(self, pool: list[dict] | None = None):
+        pool = pool or getattr(settings, "AZURE_OPENAI_POOL", None) or _default_pool()
+        self.deployments = [
+            Deployment(
+                name=entry.get("name") or f"{entry['kind']}-{i}",
+                kind=entry.get("kind", "chat"),
+                endpoint=(entry.get("endpoint") or settings.AZURE_OPENAI_ENDPOINT or "").rstrip("/"),
+                deployment=entry["deployment"],
+                api_key=entry.get("api_key") or settings.AZURE_OPENAI_KEY,
+                api_version=entry.get("api_version") or settings.AZURE_OPENAI_VERSION,
+                weight=float(entry.get("weight", 1.0)),
+                tpm=entry.get("tpm"),
+                rpm=entry.get("rpm"),
+            )
+            for i, entry in enumerate(pool)
+            if entry.get("deployment")
+        ]
+        self._lock = threading.Lock()
+        self.limiter = RateLimiter()
+        self._sync_clients: dict[str, object] = {}
+        self._async_clients: dict[str, object] = {}
+        self._executor = ThreadPoolExecutor(max_workers=getattr(settings, "ROUTER_SYNC_WORKERS", 8))
+
+    # -- selection -----------------------------------------------------------------------
+    def pool(self, kind: str) -> list[Deployment]:
+        members = [d for d in self.deployments if d.kind == kind]
+        if not members and kind == "small":
+            members = [d for d in self.deployments if d.kind == "chat"]
+        if not members:
+            raise DeploymentError(f"No Azure OpenAI deployments configured for kind '{kind}'")
+        return members
+
+    def kind_for_model(self, model: str | None, default: str = "chat") -> str:
+        """Map a deployment name used by a caller to its pool kind."""
+        for d in self.deployments:
+            if model and d.deployment == model:
+                return d.kind
+        return default
+
+    def pick(self, kind: str, exclude=(), tokens: int = 0) -> Deployment | None:
+        now = time.time()
+        with self._lock:
+            candidates = [d for d in self.pool(kind) if d.name not in exclude]
+            healthy = [d for d in candidates if d.cooldown_until <= now] or candidates
+            if not healthy:
+                return None
+            if len(healthy) > 1 and random.random() < getattr(settings, "ROUTER_EXPLORE_RATE", 0.05):
+                return random.choice(healthy)
+            return min(healthy, key=lambda d: d.score() + 1000 * self.limiter.expected_wait(d, tokens))
+
+    def record(self, dep: Deployment, latency_ms: float, ok: bool) -> None:
+        alpha = getattr(settings, "ROUTER_EWMA_ALPHA", 0.2)
+        with self._lock:
+            dep.error_rate = (1 - alpha) * dep.error_rate + alpha * (0.0 if ok else 1.0)
+            if ok:
+                dep.ewma_ms = latency_ms if dep.ewma_ms is None else (1 - alpha) * dep.ewma_ms + alpha * latency_ms
+                dep.samples.append(latency_ms)
+                dep.consecutive_errors = 0
+            else:
+                dep.consecutive_errors += 1
+                if dep.consecutive_errors >= getattr(settings, "ROUTER_COOLDOWN_ERRORS", 3):
+                    dep.cooldown_until = time.time() + getattr(settings, "ROUTER_COOLDOWN_SECONDS", 30)
+        metrics.incr("router.requests", deployment=dep.name, outcome="ok" if ok else "error")
+        if ok:
+            metrics.observe("router.latency_ms", latency_ms, deployment=dep.name)
+            metrics.set_gauge("router.ewma_ms", dep.ewma_ms, deployment=dep.name)
+
+    def hedge_delay(self, dep: Deployment, hedge: bool | None) -> float | None:
+        """Seconds to wait before hedging a request to `dep`, or None for no hedge."""
+        if hedge is False or (hedge is None and not getattr(settings, "ROUTER_HEDGING_ENABLED", False)):
+            return None
+        if len(self.pool(dep.kind)) < 2:
+            return None
+        p95 = dep.p95_ms()
+        if p95 is None:
+            return None
+        return max(p95, getattr(settings, "ROUTER_HEDGE_MIN_DELAY_MS", 200)) / 1000.0
+
+    def snapshot(self) -> list[dict]:
+        return [{**d.stats(), **self.limiter.stats(d)} for d in self.deployments]
+
+    def _retry_throttled(self, kind: str, e: BaseException, throttled: int, exclude: set) -> bool:
+        """After a 429: True to queue the request again, with every deployment eligible."""
+        if not _is_throttled(e) or throttled > getattr(settings, "RATE_LIMIT_MAX_RETRIES", 5):
+            return False
+        # The limiter now holds each throttled deployment back until its Retry-After has passed
+        exclude.clear()
+        metrics.incr("router.throttled_retries", kind=kind)
+        print(f"[openai_router] {kind} request throttled ({e}); queueing retry {throttled}")
+        return True
+
+    # -- clients -------------------------------------------------------------------------
+    def sync_client(self, dep: Deployment):
+        client = self._sync_clients.get(dep.name)
+        if client is None:
+            from openai import AzureOpenAI
+            client = AzureOpenAI(azure_endpoint=dep.endpoint, api_key=dep.api_key, api_version=dep.api_version,
+                                 max_retries=getattr(settings, "ROUTER_SDK_MAX_RETRIES", 0))
+            self._sync_clients[dep.name] = client
+        return client
+
+    def async_client(self, dep: Deployment):
+        client = self._async_clients.get(dep.name)
+        if client is None:
+            from openai import AsyncAzureOpenAI
+            client = AsyncAzureOpenAI(azure_endpoint=dep.endpoint, api_key=dep.api_key, api_version=dep.api_version,
+                                      max_retries=getattr(settings, "ROUTER_SDK_MAX_RETRIES", 0))
+            self._async_clients[dep.name] = client
+        return client
+
+    # -- async execution -----------------------------------------------------------------
+    def _failed(self, dep: Deployment, e: BaseException, start: float) -> None:
+        if _is_throttled(e):
+            self.limiter.throttle(dep, e)
+        else:
+            self.record(dep, (time.perf_counter() - start) * 1000, ok=not _counts_against_deployment(e))
+
+    async def _attempt(self, dep: Deployment, fn, tokens: int):
+        try:
+            await self.limiter.acquire(dep, tokens)
+        except asyncio.CancelledError:
+            self.limiter.release(dep, tokens)  # cancelled while queued: never sent
+            raise
+        start = time.perf_counter()
+        dep.in_flight += 1
+        try:
+            result = await fn(dep)
+        except asyncio.CancelledError:
+            # Lost a hedge race (or the caller went away): says nothing about the deployment, and
+            # without a response there is nothing to settle, so the token reservation is returned
+            self.limiter.release(dep, tokens, sent=True)
+            raise
+        except Exception as e:
+            self._failed(dep, e, start)
+            if not _is_throttled(e):
+                # A 429 already drained the bucket; other failures return their unused estimate
+                self.limiter.release(dep, tokens, sent=True)
+            raise
+        finally:
+            dep.in_flight -= 1
+        self.record(dep, (time.perf_counter() - start) * 1000, ok=True)
+        self.limiter.settle(dep, tokens, result)
+        return result
+
+    async def _hedged(self, kind: str, fn, hedge: bool | None, exclude: set, tokens: int):
+        primary = self.pick(kind, exclude, tokens)
+        exclude.add(primary.name)
+        first = asyncio.ensure_future(self._attempt(primary, fn, tokens))
+        tasks = [first]
+        try:
+            delay = self.hedge_delay(primary, hedge)
+            if delay is None:
+                return await first
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            secondary = None if done else self.pick(kind, exclude, tokens)
+            if secondary is None:
+                return await first
+            exclude.add(secondary.name)
+            metrics.incr("router.hedges", outcome="fired")
+            second = asyncio.ensure_future(self._attempt(secondary, fn, tokens))
+            tasks.append(second)
+            pending, error = {first, second}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        metrics.incr("router.hedges", outcome="hedge_won" if task is second else "primary_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser of a race, or both attempts when this call is cancelled or fails
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call_async(self, kind: str, fn, hedge: bool | None = None, tokens: int = 0):
+        """Run `await fn(deployment)` on the best deployment of `kind` with hedging and failover.
+
+        `tokens` is the request's estimated token cost, reserved on the deployment's rate limiter.
+        """
+        exclude: set = set()
+        attempts = min(getattr(settings, "ROUTER_MAX_ATTEMPTS", 2), len(self.pool(kind)))
+        failures = throttled = 0
+        while True:
+            try:
+                return await self._hedged(kind, fn, hedge, exclude, tokens)
+            except Exception as e:
+                if _is_throttled(e):
+                    throttled += 1
+                    if self._retry_throttled(kind, e, throttled, exclude):
+                        continue
+                    raise
+                failures += 1
+                if not _counts_against_deployment(e) or failures >= attempts or len(exclude) >= len(self.pool(kind)):
+                    raise
+                metrics.incr("router.failovers", kind=kind)
+                print(f"[openai_router] {kind} request failed ({e}); failing over")
+
+    async def post(self, kind: str, operation: str, payload: dict, hedge: bool | None = None,
+                   timeout: float = 30) -> dict:
+        """POST `payload` to `<deployment>/<operation>` (e.g. "chat/completions") and return the JSON body."""
+        async def _send(dep: Deployment):
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                resp = await client.post(dep.url(operation), json=payload,
+                                         headers={"Content-Type": "application/json", "api-key": dep.api_key})
+                resp.raise_for_status()
+                return resp.json()
+
+        try:
+            return await self.call_async(kind, _send, hedge, tokens=estimate_tokens(payload))
+        except httpx.HTTPStatusError as he:
+            raise DeploymentError(f"{operation} request failed {he.response.status_code}: {he.response.text}",
+                                  he.response.status_code, he.response.text) from he
+
+    # -- sync execution ------------------------------------------------------------------
+    def _attempt_sync(self, dep: Deployment, fn, tokens: int):
+        self.limiter.acquire_sync(dep, tokens)
+        start = time.perf_counter()
+        dep.in_flight += 1
+        try:
+            result = fn(dep)
+        except Exception as e:
+            self._failed(dep, e, start)
+            if not _is_throttled(e):
+                self.limiter.release(dep, tokens, sent=True)
+            raise
+        finally:
+            dep.in_flight -= 1
+        self.record(dep, (time.perf_counter() - start) * 1000, ok=True)
+        self.limiter.settle(dep, tokens, result)
+        return result
+
+    def _hedged_sync(self, kind: str, fn, hedge: bool | None, exclude: set, tokens: int):
+        primary = self.pick(kind, exclude, tokens)
+        exclude.add(primary.name)
+        delay = self.hedge_delay(primary, hedge)
+        if delay is None:
+            return self._attempt_sync(primary, fn, tokens)
+        first = self._executor.submit(self._attempt_sync, primary, fn, tokens)
+        done, _ = wait({first}, timeout=delay)
+        secondary = None if done else self.pick(kind, exclude, tokens)
+        if secondary is None:
+            return first.result()
+        exclude.add(secondary.name)
+        metrics.incr("router.hedges", outcome="fired")
+        second = self._executor.submit(self._attempt_sync, secondary, fn, tokens)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # A running thread cannot be cancelled; its result is discarded
+                    metrics.incr("router.hedges", outcome="hedge_won" if future is second else "primary_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call_sync(self, kind: str, fn, hedge: bool | None = None, tokens: int = 0):
+        """Blocking counterpart of call_async for the openai SDK's sync client."""
+        exclude: set = set()
+        attempts = min(getattr(settings, "ROUTER_MAX_ATTEMPTS", 2), len(self.pool(kind)))
+        failures = throttled = 0
+        while True:
+            try:
+                return self._hedged_sync(kind, fn, hedge, exclude, tokens)
+            except Exception as e:
+                if _is_throttled(e):
+                    throttled += 1
+                    if self._retry_throttled(kind, e, throttled, exclude):
+                        continue
+                    raise
+                failures += 1
+                if not _counts_against_deployment(e) or failures >= attempts or len(exclude) >= len(self.pool(kind)):
+                    raise
+                metrics.incr("router.failovers", kind=kind)
+                print(f"[openai_router] {kind} request failed ({e}); failing over")
+
+
+class _RoutedCall:
+    def __init__(self, router: DeploymentRouter, kind: str, path: tuple):
+        self._router, self._kind, self._path = router, kind, path
+
+    def __getattr__(self, name):
+        return _RoutedCall(self._router, self._kind, self._path + (name,))
+
+    async def __call__(self, *args, **kwargs):
+        kind = self._router.kind_for_model(kwargs.get("model"), self._kind)
+
+        async def _invoke(dep: Deployment):
+            target = self._router.async_client(dep)
+            for name in self._path:
+                target = getattr(target, name)
+            return await target(*args, **{**kwargs, "model": dep.deployment})
+
+        return await self._router.call_async(kind, _invoke, tokens=estimate_tokens(kwargs))
+
+
+class RoutedAsyncOpenAI:
+    """Drop-in for AsyncAzureOpenAI in Graphiti: `client.chat.completions.create(model=...)` is routed.
+
+    `model` selects the pool (a deployment name from the pool maps to its kind, anything else to
+    `kind`) and is rewritten to the chosen deployment's name.
+    """
+
+    def __init__(self, router: DeploymentRouter, kind: str = "chat"):
+        self._router, self._kind = router, kind
+
+    def __getattr__(self, name):
+        return _RoutedCall(self._router, self._kind, (name,))
+
+
+_router: DeploymentRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> DeploymentRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = DeploymentRouter()
+    return _router
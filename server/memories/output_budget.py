@@ -0,0 +1,153 @@
+"""Learned output-token budgets for Graphiti's structured completions.
+
+Graphiti asks for the same few response models over and over (ExtractedEntities, ExtractedEdges,
+NodeResolutions, ...), each with a characteristic output size, but requests a fixed max_tokens for
+all of them. Reserving that much on every call inflates rate-limiter reservations (memories/
+rate_limiter.py charges max_tokens up front) and lets a runaway generation burn the whole budget.
+
+For every response model this keeps a window of observed completion sizes and, once
+GRAPHITI_OUTPUT_BUDGET_MIN_SAMPLES calls have been seen, budgets
+
+    max_tokens = clamp(p{GRAPHITI_OUTPUT_BUDGET_PERCENTILE}(completion_tokens) * GRAPHITI_OUTPUT_BUDGET_HEADROOM,
+                       GRAPHITI_OUTPUT_BUDGET_MIN_TOKENS, cap)
+
+where cap is the caller's request clamped to GRAPHITI_LLM_MAX_TOKENS. A call that overflows its
+learned budget is retried at the cap by PatchedAzureOpenAILLMClient and its real size joins the
+window, so the budget grows to fit.
+
+Metrics: graphiti_llm.calls{model,outcome}, graphiti_llm.prompt_tokens{model},
+graphiti_llm.completion_tokens{model}, graphiti_llm.latency_ms{model} (observation),
+graphiti_llm.overflows{model}. Per-model percentiles and current budgets are in `stats()`
+(GET /api/memories/metrics/ -> "graphiti_llm"). `track_calls()` counts the completions made by
+one piece of work (e.g. one episode ingestion).
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import math
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+
+_WINDOW = 512
+
+
+class _ModelStats:
+    def __init__(self):
+        self.completion_tokens: deque[int] = deque(maxlen=_WINDOW)
+        self.calls = 0
+        self.overflows = 0
+        self.prompt_tokens_total = 0
+        self.completion_tokens_total = 0
+        self.latency_ms_total = 0.0
+
+
+_models: dict[str, _ModelStats] = {}
+_lock = threading.Lock()
+
+# Completions made by the work running in the current task (None outside track_calls)
+_call_counter: contextvars.ContextVar[list | None] = contextvars.ContextVar("graphiti_llm_calls", default=None)
+
+
+@contextlib.contextmanager
+def track_calls():
+    """Yield a list that gets one entry per structured completion made inside the block."""
+    counter: list[int] = []
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+
+
+def _stats_for(model: str) -> _ModelStats:
+    entry = _models.get(model)
+    if entry is None:
+        entry = _models[model] = _ModelStats()
+    return entry
+
+
+def _learned(window, cap: int) -> int | None:
+    if len(window) < getattr(settings, "GRAPHITI_OUTPUT_BUDGET_MIN_SAMPLES", 20):
+        return None
+    observed = metrics.percentile(window, getattr(settings, "GRAPHITI_OUTPUT_BUDGET_PERCENTILE", 99))
+    budget = math.ceil(observed * getattr(settings, "GRAPHITI_OUTPUT_BUDGET_HEADROOM", 1.5))
+    return max(getattr(settings, "GRAPHITI_OUTPUT_BUDGET_MIN_TOKENS", 256), min(budget, cap))
+
+
+def max_tokens_cap(requested: int) -> int:
+    """`requested` clamped to GRAPHITI_LLM_MAX_TOKENS (0 = no clamp)."""
+    cap = getattr(settings, "GRAPHITI_LLM_MAX_TOKENS", 4096)
+    return min(requested, cap) if cap > 0 else requested
+
+
+def budget_for(model: str, cap: int) -> int:
+    """max_tokens for the next `model` completion; `cap` until enough outputs have been observed."""
+    if not getattr(settings, "GRAPHITI_OUTPUT_BUDGET_ENABLED", True):
+        return cap
+    with _lock:
+        window = list(_stats_for(model).completion_tokens)
+    learned = _learned(window, cap)
+    return cap if learned is None else min(learned, cap)
+
+
+def _usage_field(usage, name: str) -> int:
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value or 0)
+
+
+def record(model: str, usage, latency_ms: float, outcome: str = "ok") -> None:
+    """Record one completion (`usage` from the response, may be None)."""
+    prompt_tokens = _usage_field(usage, "prompt_tokens") if usage is not None else 0
+    completion_tokens = _usage_field(usage, "completion_tokens") if usage is not None else 0
+    with _lock:
+        entry = _stats_for(model)
+        entry.calls += 1
+        entry.prompt_tokens_total += prompt_tokens
+        entry.completion_tokens_total += completion_tokens
+        entry.latency_ms_total += latency_ms
+        # Only complete outputs describe the size the model needs
+        if outcome == "ok" and completion_tokens:
+            entry.completion_tokens.append(completion_tokens)
+    counter = _call_counter.get()
+    if counter is not None:
+        counter.append(1)
+    metrics.incr("graphiti_llm.calls", model=model, outcome=outcome)
+    metrics.incr("graphiti_llm.prompt_tokens", prompt_tokens, model=model)
+    metrics.incr("graphiti_llm.completion_tokens", completion_tokens, model=model)
+    metrics.observe("graphiti_llm.latency_ms", latency_ms, model=model)
+
+
+def record_overflow(model: str, budget: int) -> None:
+    with _lock:
+        _stats_for(model).overflows += 1
+    metrics.incr("graphiti_llm.overflows", model=model)
+    print(f"[output_budget] {model} output exceeded its {budget}-token budget; retrying at the cap")
+
+
+def stats() -> dict:
+    """Per response model: calls, overflows, averages, completion percentiles and current budget."""
+    with _lock:
+        snapshot = {
+            model: (list(e.completion_tokens), e.calls, e.overflows, e.prompt_tokens_total,
+                    e.completion_tokens_total, e.latency_ms_total)
+            for model, e in _models.items()
+        }
+    report = {}
+    for model, (window, calls, overflows, prompt_total, completion_total, latency_total) in snapshot.items():
+        report[model] = {
+            "calls": calls,
+            "overflows": overflows,
+            "avg_prompt_tokens": round(prompt_total / calls) if calls else 0,
+            "avg_completion_tokens": round(completion_total / calls) if calls else 0,
+            "avg_latency_ms": round(latency_total / calls, 1) if calls else 0.0,
+            "completion_p50": metrics.percentile(window, 50),
+            "completion_p95": metrics.percentile(window, 95),
+            "completion_p99": metrics.percentile(window, 99),
+            "budget": _learned(window, max_tokens_cap(1 << 30)),
+        }
+    return report
@@ -0,0 +1,176 @@
+"""Token-aware prompt budgeting.
+
+Each prompt built in views.py gets a token budget (PROMPT_TOKEN_BUDGETS[name]) and an output
+cap (PROMPT_MAX_OUTPUT_TOKENS[name]). A PromptBudget is filled in priority order:
+
+    budget = PromptBudget("relevance")
+    budget.fixed(instructions, query)                  # always included, counted first
+    kept = budget.fit_ranked(memory_snippets, max_item_tokens=200)   # drops lowest-ranked first
+    summary = budget.fit(previous_summary)             # truncated on a token boundary
+    budget.finish()                                    # records prompt size and tokens saved
+
+Tokens are counted with tiktoken (PROMPT_TOKENIZER_ENCODING, default o200k_base for the gpt-4o
+family). If tiktoken is unavailable a ~4 characters/token approximation is used instead.
+
+Metrics: prompt_budget.prompt_tokens{prompt} (observation), prompt_budget.tokens_saved{prompt},
+prompt_budget.items_dropped{prompt}.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import metrics
+
+try:  # optional dependency; fall back to a character heuristic
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on environment
+    tiktoken = None
+
+_CHARS_PER_TOKEN = 4
+
+DEFAULT_TOKEN_BUDGETS = {
+    "summary": 1500,
+    "candidate": 1200,
+    "summary_and_candidates": 1800,
+    "decide": 600,
+    "merge": 800,
+    "relevance": 2500,
+    "summary_compaction": 2000,
+}
+
+DEFAULT_MAX_OUTPUT_TOKENS = {
+    "summary": 256,
+    "candidate": 256,
+    "summary_and_candidates": 512,
+    "decide": 16,
+    "merge": 256,
+    "relevance": 200,
+    "summary_compaction": 600,
+}
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    name = getattr(settings, "PROMPT_TOKENIZER_ENCODING", "o200k_base")
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"[prompt_budget] Tokenizer '{name}' unavailable, using character estimate: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _encoding()
+    if enc is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Truncate `text` to at most `max_tokens` tokens on a token boundary.
+
+    keep="head" keeps the beginning, keep="tail" keeps the end.
+    """
+    if not text or max_tokens <= 0:
+        return ""
+    enc = _encoding()
+    if enc is None:
+        limit = max_tokens * _CHARS_PER_TOKEN
+        if len(text) <= limit:
+            return text
+        return text[:limit] if keep == "head" else text[-limit:]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    kept = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+    # Dropping a partial multi-byte sequence at the cut avoids replacement characters
+    return enc.decode(kept, errors="ignore")
+
+
+def get_budget(name: str) -> int:
+    configured = getattr(settings, "PROMPT_TOKEN_BUDGETS", None) or {}
+    return int(configured.get(name, DEFAULT_TOKEN_BUDGETS.get(name, 2000)))
+
+
+def get_max_output_tokens(name: str) -> int:
+    configured = getattr(settings, "PROMPT_MAX_OUTPUT_TOKENS", None) or {}
+    return int(configured.get(name, DEFAULT_MAX_OUTPUT_TOKENS.get(name, 256)))
+
+
+class PromptBudget:
+    """Accumulates the token usage of one prompt while its variable parts are fitted."""
+
+    def __init__(self, name: str, budget: int | None = None):
+        self.name = name
+        self.budget = budget if budget is not None else get_budget(name)
+        self.used = 0
+        self.saved = 0
+        self.dropped = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.budget - self.used)
+
+    def fixed(self, *texts: str) -> "PromptBudget":
+        """Count parts that are always sent in full (instructions, the user's query)."""
+        self.used += sum(count_tokens(t) for t in texts)
+        return self
+
+    def clip(self, text: str, max_tokens: int, keep: str = "head") -> str:
+        """Truncate text to `max_tokens` without consuming budget (e.g. before JSON encoding)."""
+        text = text or ""
+        n = count_tokens(text)
+        if n <= max_tokens:
+            return text
+        self.saved += n - max_tokens
+        return truncate_tokens(text, max_tokens, keep=keep)
+
+    def fit(self, text: str, max_tokens: int | None = None, keep: str = "head") -> str:
+        """Fit a section into the remaining budget (optionally capped), truncating if needed."""
+        text = text or ""
+        limit = self.remaining if max_tokens is None else min(max_tokens, self.remaining)
+        n = count_tokens(text)
+        if n <= limit:
+            self.used += n
+            return text
+        self.saved += n - limit
+        self.used += limit
+        return truncate_tokens(text, limit, keep=keep)
+
+    def fit_ranked(self, items: list[str], max_item_tokens: int | None = None,
+                   separator_tokens: int = 1) -> list[tuple[int, str]]:
+        """Keep items (ordered best-first) while they fit; drops the lowest-ranked ones first.
+
+        Each item is first truncated to `max_item_tokens`. Returns [(original_index, text)].
+        """
+        kept = []
+        for idx, item in enumerate(items):
+            text = item or ""
+            n = count_tokens(text)
+            if max_item_tokens is not None and n > max_item_tokens:
+                text = truncate_tokens(text, max_item_tokens)
+                self.saved += n - max_item_tokens
+                n = max_item_tokens
+            if n + separator_tokens > self.remaining:
+                # Everything from here on is lower ranked; drop it
+                self.dropped += len(items) - idx
+                self.saved += n + sum(count_tokens(t or "") for t in items[idx + 1:])
+                break
+            self.used += n + separator_tokens
+            kept.append((idx, text))
+        return kept
+
+    def finish(self) -> "PromptBudget":
+        metrics.observe("prompt_budget.prompt_tokens", self.used, prompt=self.name)
+        if self.saved:
+            metrics.incr("prompt_budget.tokens_saved", self.saved, prompt=self.name)
+        if self.dropped:
+            metrics.incr("prompt_budget.items_dropped", self.dropped, prompt=self.name)
+            print(f"[prompt_budget] {self.name}: dropped {self.dropped} lowest-ranked item(s) to fit {self.budget} tokens")
+        return self
@@ -0,0 +1,216 @@
+"""Process-wide TPM / RPM rate limiting for Azure OpenAI deployments.
+
+Every request routed by memories/openai_router.py first reserves capacity on its deployment:
+
+  * a tokens-per-minute bucket charged with an estimate (prompt tokens + max_tokens), settled
+    against the response's `usage.total_tokens` afterwards
+  * a requests-per-minute bucket charged one per request
+  * a block window set from `Retry-After` / `retry-after-ms` when the deployment answers 429
+    (exponential backoff from RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS when the header is missing)
+
+Reservations never fail: they return how long the caller must wait, so bursts queue instead of
+turning into 429s. A wait longer than RATE_LIMIT_MAX_WAIT_SECONDS raises RateLimitTimeout,
+which the router treats like a throttled deployment and retries elsewhere.
+
+Limits come from the pool entry (`"tpm"`, `"rpm"`) or RATE_LIMIT_TPM / RATE_LIMIT_RPM; 0 means
+unlimited (only Retry-After is enforced).
+
+Metrics: rate_limiter.wait_ms{deployment} (observation), rate_limiter.throttled{deployment}.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .prompt_budget import count_tokens
+
+
+class RateLimitTimeout(RuntimeError):
+    status_code = 429
+
+
+class TokenBucket:
+    """Continuous refill bucket; `reserve` may take it negative and returns the wait that implies."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole bucket still goes through once the bucket is full
+        amount = min(amount, self.capacity)
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def peek(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        shortfall = min(amount, self.capacity) - self.level
+        return max(0.0, shortfall / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level - delta)
+
+
+class DeploymentLimiter:
+    def __init__(self, name: str, tpm: float, rpm: float):
+        self.name = name
+        self.tokens = TokenBucket(tpm)
+        self.requests = TokenBucket(rpm)
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            return max(self.tokens.reserve(tokens, now), self.requests.reserve(1, now), self.blocked_until - now)
+
+    def expected_wait(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            return max(self.tokens.peek(tokens, now), self.requests.peek(1, now), self.blocked_until - now)
+
+    def settle(self, estimated: int, actual: int | None) -> None:
+        if actual is not None:
+            with self._lock:
+                self.tokens.adjust(actual - estimated)
+                self.consecutive_throttles = 0
+
+    def release(self, tokens: int, sent: bool = False) -> None:
+        """Return a reservation that will not be settled; a `sent` request keeps its RPM slot."""
+        with self._lock:
+            self.tokens.adjust(-tokens)
+            if not sent:
+                self.requests.adjust(-1)
+
+    def throttle(self, retry_after: float | None) -> float:
+        with self._lock:
+            self.consecutive_throttles += 1
+            if retry_after is None:
+                base = getattr(settings, "RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS", 2.0)
+                retry_after = min(base * 2 ** (self.consecutive_throttles - 1), 60.0)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            # The service says we are over quota: drain the buckets so queued requests wait too
+            self.tokens.level = min(self.tokens.level, 0.0)
+        metrics.incr("rate_limiter.throttled", deployment=self.name)
+        return retry_after
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Read Retry-After (seconds) or retry-after-ms from an httpx / openai SDK error response."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Prompt tokens + requested completion tokens for a chat or embeddings payload."""
+    text = []
+    for message in payload.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            text.append(content)
+    inputs = payload.get("input")
+    if isinstance(inputs, str):
+        text.append(inputs)
+    elif isinstance(inputs, list):
+        text.extend(i for i in inputs if isinstance(i, str))
+    # ~4 tokens of framing per chat message
+    prompt = sum(count_tokens(t) for t in text) + 4 * len(payload.get("messages") or [])
+    return prompt + int(payload.get("max_tokens") or payload.get("max_completion_tokens") or 0)
+
+
+def usage_tokens(result) -> int | None:
+    usage = result.get("usage") if isinstance(result, dict) else getattr(result, "usage", None)
+    if usage is None:
+        return None
+    total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+    return int(total) if total is not None else None
+
+
+class RateLimiter:
+    def __init__(self):
+        self._limiters: dict[str, DeploymentLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_deployment(self, dep) -> DeploymentLimiter:
+        limiter = self._limiters.get(dep.name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(dep.name)
+                if limiter is None:
+                    limiter = DeploymentLimiter(
+                        dep.name,
+                        dep.tpm if dep.tpm is not None else getattr(settings, "RATE_LIMIT_TPM", 0),
+                        dep.rpm if dep.rpm is not None else getattr(settings, "RATE_LIMIT_RPM", 0),
+                    )
+                    self._limiters[dep.name] = limiter
+        return limiter
+
+    def _wait_for(self, dep, tokens: int) -> float:
+        if not getattr(settings, "RATE_LIMIT_ENABLED", True):
+            return 0.0
+        wait_seconds = self.for_deployment(dep).reserve(tokens)
+        if wait_seconds > getattr(settings, "RATE_LIMIT_MAX_WAIT_SECONDS", 60):
+            # Give the reservation back; the router will try another deployment or retry later
+            self.for_deployment(dep).release(tokens)
+            raise RateLimitTimeout(f"{dep.name}: rate limit wait {wait_seconds:.1f}s exceeds maximum")
+        if wait_seconds > 0:
+            metrics.observe("rate_limiter.wait_ms", wait_seconds * 1000, deployment=dep.name)
+        return wait_seconds
+
+    async def acquire(self, dep, tokens: int) -> None:
+        wait_seconds = self._wait_for(dep, tokens)
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+
+    def acquire_sync(self, dep, tokens: int) -> None:
+        wait_seconds = self._wait_for(dep, tokens)
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+    def expected_wait(self, dep, tokens: int) -> float:
+        if not getattr(settings, "RATE_LIMIT_ENABLED", True):
+            return 0.0
+        return self.for_deployment(dep).expected_wait(tokens)
+
+    def settle(self, dep, estimated: int, result) -> None:
+        self.for_deployment(dep).settle(estimated, usage_tokens(result))
+
+    def release(self, dep, tokens: int, sent: bool = False) -> None:
+        if getattr(settings, "RATE_LIMIT_ENABLED", True):
+            self.for_deployment(dep).release(tokens, sent)
+
+    def throttle(self, dep, exc: BaseException) -> float:
+        return self.for_deployment(dep).throttle(retry_after_seconds(exc))
+
+    def stats(self, dep) -> dict:
+        limiter = self.for_deployment(dep)
+        return {
+            "tpm_limit": limiter.tokens.capacity or None,
+            "rpm_limit": limiter.requests.capacity or None,
+            "throttled_for_s": round(max(0.0, limiter.blocked_until - time.monotonic()), 1),
+        }
@@ -0,0 +1,118 @@
+"""In-memory stand-ins for Cosmos containers used by the unit tests.
+
+FakeContainer implements the slice of azure.cosmos.ContainerProxy the service uses (item CRUD,
+patch, transactional batches) with Cosmos semantics: every write returns a new `_etag`, writes
+conditioned on a stale ETag fail with 412, creating an existing id fails with 409 and a batch
+is all-or-nothing. Raised errors are the real azure.cosmos exception types.
+"""
+from __future__ import annotations
+
+import copy
+import uuid
+
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosHttpResponseError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
+
+from memories.cosmos_db import BaseCosmosDBManager
+
+
+class FakeContainer:
+    def __init__(self, id: str = "memories", docs=()):
+        self.id = id
+        self.items: dict[str, dict] = {}
+        self.calls: list[tuple[str, str]] = []  # (operation, id) in call order
+        for doc in docs:
+            self._store(doc)
+
+    # -- helpers -------------------------------------------------------------------------
+    def _store(self, body: dict) -> dict:
+        doc = copy.deepcopy(body)
+        doc["_etag"] = uuid.uuid4().hex
+        self.items[doc["id"]] = doc
+        return copy.deepcopy(doc)
+
+    def _existing(self, id: str) -> dict:
+        if id not in self.items:
+            raise CosmosResourceNotFoundError(status_code=404, message=f"{id} not found")
+        return self.items[id]
+
+    def _check_etag(self, id: str, etag) -> None:
+        if etag is not None and self._existing(id)["_etag"] != etag:
+            raise CosmosAccessConditionFailedError(status_code=412, message=f"{id}: precondition failed")
+
+    # -- item API ------------------------------------------------------------------------
+    def read_item(self, item, partition_key=None):
+        self.calls.append(("read", item))
+        return copy.deepcopy(self._existing(item))
+
+    def create_item(self, body):
+        self.calls.append(("create", body["id"]))
+        if body["id"] in self.items:
+            raise CosmosResourceExistsError(status_code=409, message=f"{body['id']} exists")
+        return self._store(body)
+
+    def upsert_item(self, body):
+        self.calls.append(("upsert", body["id"]))
+        return self._store(body)
+
+    def replace_item(self, item, body, etag=None, match_condition=None):
+        self.calls.append(("replace", item))
+        self._check_etag(item, etag)
+        return self._store(body)
+
+    def patch_item(self, item, partition_key, patch_operations, etag=None, match_condition=None):
+        self.calls.append(("patch", item))
+        self._check_etag(item, etag)
+        doc = copy.deepcopy(self.items[item])
+        for operation in patch_operations:
+            doc[operation["path"].lstrip("/")] = operation["value"]
+        return self._store(doc)
+
+    def delete_item(self, item, partition_key=None, etag=None, match_condition=None):
+        self.calls.append(("delete", item))
+        self._check_etag(item, etag)
+        del self.items[item]
+
+    def execute_item_batch(self, batch_operations, partition_key):
+        self.calls.append(("batch", partition_key))
+        snapshot = copy.deepcopy(self.items)
+        try:
+            for operation in batch_operations:
+                name, args = operation[0], operation[1]
+                kwargs = operation[2] if len(operation) > 2 else {}
+                etag = kwargs.get("if_match_etag")
+                if name == "create":
+                    if args[0]["id"] in self.items:
+                        raise CosmosResourceExistsError(status_code=409, message=f"{args[0]['id']} exists")
+                    self._store(args[0])
+                elif name == "upsert":
+                    self._store(args[0])
+                elif name == "replace":
+                    self._check_etag(args[0], etag)
+                    self._store(args[1])
+                elif name == "patch":
+                    self._check_etag(args[0], etag)
+                    doc = copy.deepcopy(self._existing(args[0]))
+                    for patch in args[1]:
+                        doc[patch["path"].lstrip("/")] = patch["value"]
+                    self._store(doc)
+                elif name == "delete":
+                    self._check_etag(args[0], etag)
+                    self._existing(args[0])
+                    del self.items[args[0]]
+                else:
+                    raise CosmosHttpResponseError(status_code=400, message=f"unsupported batch op {name}")
+        except Exception:
+            self.items = snapshot  # transactional: nothing from a failed batch is kept
+            raise
+
+
+class FakeDB(BaseCosmosDBManager):
+    """A *DBManager over a FakeContainer (skips the Cosmos client)."""
+
+    def __init__(self, container: FakeContainer | None = None):
+        self.container = container or FakeContainer()
@@ -0,0 +1,27 @@
+from memories import consolidation
+from memories.tests.fakes import FakeContainer, FakeDB
+
+
+def _memory(id, embedding, content):
+    return {"id": id, "userId": "u1", "conversationId": "c1", "content": content, "embedding": embedding,
+            "created_at": f"2026-01-0{id[-1]}T00:00:00", "graphiti_synced": True}
+
+
+def test_merged_memory_is_not_reingested_into_graphiti(monkeypatch):
+    docs = [_memory("m1", [1.0, 0.0], "Lives in Oslo"), _memory("m2", [0.99, 0.01], "Lives in Oslo, Norway"),
+            _memory("m3", [0.0, 1.0], "Likes tea")]
+    db = FakeDB(FakeContainer(docs=docs))
+    monkeypatch.setattr(consolidation, "load_user_memories", lambda db, user_id: [dict(d) for d in docs])
+    monkeypatch.setattr(consolidation, "merge_cluster_text", lambda members: "Lives in Oslo, Norway")
+    monkeypatch.setattr(consolidation.azure_openai, "generate_embeddings", lambda text: [1.0, 0.0])
+
+    report = consolidation.consolidate("u1", threshold=0.9, db=db)
+
+    assert report["errors"] == []
+    assert (report["merged"], report["tombstoned"]) == (1, 2)
+    merged_id = report["clusters"][0]["merged_id"]
+    merged = db.container.items[merged_id]
+    assert merged["graphiti_synced"] is True
+    assert merged["merged_from"] == ["m1", "m2"]
+    assert db.container.items["m1"]["merged_into"] == merged_id
+    assert "deleted" not in db.container.items["m3"]
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from django.test import override_settings
+
+from memories.decisions import (
+    ADD, AMBIGUOUS, NOOP, assign_actions, dedupe_candidates, score_matrix, threshold_decisions,
+)
+
+THRESHOLD_ADD, THRESHOLD_NOOP = 0.45, 0.85
+
+
+def memory(id):
+    return SimpleNamespace(id=id)
+
+
+@pytest.mark.parametrize("best, expected", [
+    (0.0, ADD),
+    (0.4499, ADD),
+    (0.45, AMBIGUOUS),       # the ADD threshold is exclusive
+    (0.6, AMBIGUOUS),
+    (0.8499, AMBIGUOUS),
+    (0.85, NOOP),            # the NO-OP threshold is inclusive
+    (0.99, NOOP),
+])
+def test_threshold_boundaries(best, expected):
+    codes, best_column, best_score = threshold_decisions(np.array([[best, best - 0.5]]), THRESHOLD_ADD, THRESHOLD_NOOP)
+    assert codes[0] == expected
+    assert best_column[0] == 0
+    assert best_score[0] == pytest.approx(best)
+
+
+@override_settings(MEMORY_DECISION_THRESHOLD_ADD=0.45, MEMORY_DECISION_THRESHOLD_NOOP=0.85)
+def test_thresholds_default_to_settings():
+    codes, _, _ = threshold_decisions(np.array([[0.44], [0.5], [0.9]]))
+    assert list(codes) == [ADD, AMBIGUOUS, NOOP]
+
+
+def test_no_neighbours_means_add():
+    codes, best_column, best_score = threshold_decisions(np.zeros((2, 0)))
+    assert list(codes) == [ADD, ADD]
+    assert list(best_column) == [-1, -1]
+    assert np.isneginf(best_score).all()
+
+
+def test_candidate_without_hits_in_shared_matrix_is_add():
+    scores, neighbours = score_matrix([[(memory("m1"), 0.9)], []])
+    codes, best_column, _ = threshold_decisions(scores, THRESHOLD_ADD, THRESHOLD_NOOP)
+    assert list(codes) == [NOOP, ADD]
+    assert list(best_column) == [0, -1]
+
+
+def test_score_matrix_merges_shared_neighbours():
+    scores, neighbours = score_matrix([
+        [(memory("m1"), 0.9), (memory("m2"), 0.5)],
+        [(memory("m2"), 0.7), (memory("m2"), 0.6)],
+    ])
+    assert [n.id for n in neighbours] == ["m1", "m2"]
+    assert scores[0].tolist() == [0.9, 0.5]
+    assert scores[1, 0] == -np.inf
+    assert scores[1, 1] == 0.7  # best score of a neighbour returned twice
+
+
+@override_settings(CANDIDATE_DEDUP_THRESHOLD=0.95)
+def test_dedupe_drops_later_near_duplicates():
+    embeddings = [[1.0, 0.0], [0.999, 0.01], [0.0, 1.0], [1.0, 0.0]]
+    assert dedupe_candidates(embeddings) == [0, 2]
+
+
+@pytest.mark.parametrize("codes, arbitrated, expected", [
+    # Independent decisions against different targets
+    ([ADD, NOOP, AMBIGUOUS], {2: "DELETE"}, [("ADD", None), ("NO-OP", "m1"), ("DELETE", "m2")]),
+    # Two UPDATEs of one memory are kept (merged into it later)
+    ([AMBIGUOUS, AMBIGUOUS], {0: "UPDATE", 1: "UPDATE"}, [("UPDATE", "m1"), ("UPDATE", "m1")]),
+    # A DELETE after an UPDATE of the same memory conflicts -> ADD
+    ([AMBIGUOUS, AMBIGUOUS], {0: "UPDATE", 1: "DELETE"}, [("UPDATE", "m1"), ("ADD", None)]),
+    # An UPDATE after a DELETE of the same memory conflicts -> ADD
+    ([AMBIGUOUS, AMBIGUOUS], {0: "DELETE", 1: "UPDATE"}, [("DELETE", "m1"), ("ADD", None)]),
+    # Two DELETEs of the same memory: only the first replaces it
+    ([AMBIGUOUS, AMBIGUOUS], {0: "DELETE", 1: "DELETE"}, [("DELETE", "m1"), ("ADD", None)]),
+    # A NO-OP on a claimed memory stays a NO-OP (no duplicate is stored)
+    ([AMBIGUOUS, NOOP], {0: "UPDATE"}, [("UPDATE", "m1"), ("NO-OP", "m1")]),
+    ([AMBIGUOUS, NOOP], {0: "DELETE"}, [("DELETE", "m1"), ("NO-OP", "m1")]),
+    # A NO-OP does not claim: a later UPDATE still applies
+    ([NOOP, AMBIGUOUS], {1: "UPDATE"}, [("NO-OP", "m1"), ("UPDATE", "m1")]),
+])
+def test_two_candidates_claiming_the_same_target(codes, arbitrated, expected):
+    best_column = np.zeros(len(codes), dtype=int)
+    if codes[0] == ADD:
+        best_column = np.array([-1, 0, 1])
+    assert assign_actions(codes, best_column, ["m1", "m2"], arbitrated) == expected
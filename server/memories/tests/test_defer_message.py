@@ -0,0 +1,41 @@
+from memories.tests.fakes import FakeContainer, FakeDB
+from memories.views import _defer_message
+
+
+class RacingDB(FakeDB):
+    """Another request writes the summary doc right after each of the first `races` reads."""
+
+    def __init__(self, container, races: int, message: str = "concurrent message"):
+        super().__init__(container)
+        self.races = races
+        self.message = message
+
+    def get_item(self, id):
+        doc = super().get_item(id)
+        if self.races:
+            self.races -= 1
+            self.container.upsert_item({**doc, "pendingMessages": doc.get("pendingMessages", []) + [self.message]})
+        return doc
+
+
+def test_creates_the_summary_doc_when_missing():
+    db = FakeDB(FakeContainer("summaries"))
+    assert _defer_message(db, "c1", "u1", "hello there friend")
+    doc = db.container.items["c1"]
+    assert doc["pendingMessages"] == ["hello there friend"]
+    assert doc["userId"] == "u1"
+    assert doc["messagesSinceSummary"] == 1
+
+
+def test_concurrent_defer_is_not_lost():
+    container = FakeContainer("summaries", [{"id": "c1", "conversationId": "c1", "pendingMessages": ["first"]}])
+    db = RacingDB(container, races=1)
+    assert _defer_message(db, "c1", "u1", "second")
+    assert container.items["c1"]["pendingMessages"] == ["first", "concurrent message", "second"]
+
+
+def test_gives_up_after_repeated_conflicts():
+    container = FakeContainer("summaries", [{"id": "c1", "conversationId": "c1"}])
+    db = RacingDB(container, races=100)
+    assert _defer_message(db, "c1", "u1", "mine") is False
+    assert "mine" not in container.items["c1"]["pendingMessages"]
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+from django.test import override_settings
+
+from memories import episode_buffer, metrics, views
+from memories.tests.fakes import FakeContainer, FakeDB
+
+KEY = "conversation:c1"
+DOC_ID = episode_buffer.DOC_PREFIX + KEY
+
+
+class Graph:
+    """Stubbed Graphiti: records ingested episodes, optionally failing the next `fail` calls."""
+
+    def __init__(self, fail: int = 0):
+        self.fail = fail
+        self.episodes: list[dict] = []
+
+    async def ingest(self, content, source_desc=None, name=None, reference_time=None, group_id=None):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("graph unavailable")
+        self.episodes.append({"content": content, "name": name, "group_id": group_id})
+        return name, None
+
+    async def exists(self, name, since):
+        return any(episode["name"] == name for episode in self.episodes)
+
+
+@pytest.fixture
+def db():
+    return FakeDB(FakeContainer("leases"))
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = Graph()
+    monkeypatch.setattr(views, "ingest_graphiti_episode", graph.ingest)
+    monkeypatch.setattr(episode_buffer, "_episode_exists", graph.exists)
+    return graph
+
+
+def flush(db, **kwargs):
+    return asyncio.run(episode_buffer.flush(KEY, db=db, **kwargs))
+
+
+def buffer_doc(db):
+    return db.container.items[DOC_ID]
+
+
+@override_settings(EPISODE_BUFFER_MAX_ITEMS=3)
+def test_add_reports_due_at_the_item_threshold(db):
+    assert episode_buffer.add(KEY, "u1", "c1", ["likes tea", "  "], db=db) == {"pending": 1, "due": False}
+    assert episode_buffer.add(KEY, "u1", "c1", ["lives in Oslo", "has a cat"], db=db) == {"pending": 3, "due": True}
+
+
+def test_flush_skips_buffers_that_are_not_due(db, graph):
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    assert flush(db) is None
+    assert graph.episodes == []
+    assert buffer_doc(db)["inflight"] is None
+
+
+@override_settings(GRAPHITI_GROUP_ID_TEMPLATE="{user_id}")
+def test_flush_ingests_one_episode_and_clears_the_batch(db, graph):
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea", "lives in Oslo"], db=db)
+    name = flush(db, force=True)
+    assert graph.episodes == [{"content": "likes tea\nlives in Oslo", "name": name, "group_id": "u1"}]
+    doc = buffer_doc(db)
+    assert doc["inflight"] is None and doc["items"] == []
+    assert (doc["flushedEpisodes"], doc["flushedItems"]) == (1, 2)
+
+
+def test_claim_moves_items_inflight_before_ingesting(db, graph):
+    graph.fail = 1
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    with pytest.raises(RuntimeError):
+        flush(db, force=True)
+    doc = buffer_doc(db)
+    assert doc["items"] == []
+    assert [item["text"] for item in doc["inflight"]["items"]] == ["likes tea"]
+    assert doc["inflight"]["attempts"] == 1
+
+
+@override_settings(EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS=900)
+def test_fresh_inflight_batch_is_not_reclaimed(db, graph):
+    graph.fail = 1
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    with pytest.raises(RuntimeError):
+        flush(db, force=True)
+    assert flush(db, force=True) is None  # another flush is (or recently was) working on it
+    assert graph.episodes == []
+
+
+@override_settings(EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS=0)
+def test_stale_inflight_batch_is_reclaimed_under_the_same_name(db, graph):
+    graph.fail = 1
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    with pytest.raises(RuntimeError):
+        flush(db, force=True)
+    first_name = buffer_doc(db)["inflight"]["name"]
+    episode_buffer.add(KEY, "u1", "c1", ["lives in Oslo"], db=db)  # arrives while the batch is inflight
+
+    assert flush(db) == first_name
+    assert graph.episodes[0]["content"] == "likes tea"
+    doc = buffer_doc(db)
+    assert doc["inflight"] is None
+    assert [item["text"] for item in doc["items"]] == ["lives in Oslo"]  # left for the next batch
+
+
+@override_settings(EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS=0)
+def test_batch_that_reached_the_graph_is_only_cleared(db, graph, monkeypatch):
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    real_update = episode_buffer._update
+    calls = {"n": 0}
+
+    def crash_before_complete(db_, doc_id, mutate):
+        calls["n"] += 1
+        if calls["n"] == 2:  # the process dies after ingesting, before clearing inflight
+            raise SystemExit("crash")
+        return real_update(db_, doc_id, mutate)
+
+    monkeypatch.setattr(episode_buffer, "_update", crash_before_complete)
+    with pytest.raises(SystemExit):
+        flush(db, force=True)
+    monkeypatch.setattr(episode_buffer, "_update", real_update)
+    assert len(graph.episodes) == 1
+
+    before = metrics.get_counter("episode_buffer.flushes", outcome="recovered")
+    assert flush(db) == graph.episodes[0]["name"]
+    assert len(graph.episodes) == 1  # not ingested twice
+    assert metrics.get_counter("episode_buffer.flushes", outcome="recovered") == before + 1
+    doc = buffer_doc(db)
+    assert doc["inflight"] is None and doc["flushedEpisodes"] == 1
+
+
+@override_settings(EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS=0, EPISODE_BUFFER_MAX_ATTEMPTS=3)
+def test_batch_is_parked_after_max_attempts(db, graph):
+    graph.fail = 3
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            flush(db, force=True)
+        assert buffer_doc(db)["inflight"] is not None
+    with pytest.raises(RuntimeError):
+        flush(db, force=True)
+    doc = buffer_doc(db)
+    assert doc["inflight"] is None
+    assert len(doc["failedBatches"]) == 1
+    assert doc["failedBatches"][0]["attempts"] == 3
+    assert [item["text"] for item in doc["failedBatches"][0]["items"]] == ["likes tea"]
+    assert flush(db, force=True) is None  # nothing left to retry
+    assert graph.episodes == []
+
+
+def test_update_rereads_after_losing_an_etag_race(db):
+    episode_buffer.add(KEY, "u1", "c1", ["likes tea"], db=db)
+    raced = {"done": False}
+
+    def mutate(doc):
+        if not raced["done"]:
+            raced["done"] = True
+            db.container.upsert_item({**doc, "chars": 999})  # a concurrent writer
+        doc["items"].append({"text": "mine", "at": doc["items"][0]["at"]})
+        return doc
+
+    episode_buffer._update(db, DOC_ID, mutate)
+    doc = buffer_doc(db)
+    assert doc["chars"] == 999
+    assert [item["text"] for item in doc["items"]] == ["likes tea", "mine"]
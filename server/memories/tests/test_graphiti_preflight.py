@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+from django.test import override_settings
+
+from memories import graphiti_client, metrics
+from memories.openai_router import DeploymentRouter
+
+
+def _router():
+    return DeploymentRouter([
+        {"name": "eus", "kind": "chat", "endpoint": "https://eus.example.com", "deployment": "gpt"},
+        {"name": "swe", "kind": "chat", "endpoint": "https://swe.example.com", "deployment": "gpt"},
+    ])
+
+
+def test_each_pool_deployment_is_checked_and_remembered(tmp_path, monkeypatch):
+    path = tmp_path / "preflight.json"
+    monkeypatch.setattr(graphiti_client, "_preflight_state", {})
+    pinged = []
+
+    async def run():
+        for dep in _router().deployments:
+            async def check(dep=dep):
+                pinged.append(dep.name)
+                return "ok"
+            await graphiti_client._cached_preflight(graphiti_client._preflight_key(dep), check)
+
+    hits_before = metrics.get_counter("llm_cache.hits", tier="memory")
+    with override_settings(GRAPHITI_PREFLIGHT_CACHE_PATH=str(path), GRAPHITI_PREFLIGHT_TTL_SECONDS=3600):
+        asyncio.run(run())
+        asyncio.run(run())
+        assert pinged == ["eus", "swe"]  # second round is served from the store
+        assert len(json.loads(path.read_text())) == 2
+
+        # A fresh process (empty in-memory state) reuses the file
+        monkeypatch.setattr(graphiti_client, "_preflight_state", {})
+        asyncio.run(run())
+        assert pinged == ["eus", "swe"]
+    assert metrics.get_counter("llm_cache.hits", tier="memory") == hits_before
+
+
+def test_failed_check_is_not_remembered(tmp_path, monkeypatch):
+    monkeypatch.setattr(graphiti_client, "_preflight_state", {})
+    dep = _router().deployments[0]
+    outcomes = []
+
+    async def check():
+        outcomes.append("error")
+        return "error"
+
+    with override_settings(GRAPHITI_PREFLIGHT_CACHE_PATH=str(tmp_path / "p.json")):
+        for _ in range(2):
+            asyncio.run(graphiti_client._cached_preflight(graphiti_client._preflight_key(dep), check))
+    assert outcomes == ["error", "error"]
@@ -0,0 +1,28 @@
+import pytest
+
+from memories.local_index import LocalVectorIndex
+
+
+@pytest.mark.parametrize("embedding", [[0.0, 0.0, 0.0], [], None])
+def test_unindexable_upsert_removes_the_previous_row(embedding):
+    index = LocalVectorIndex(initial_capacity=2)
+    index.upsert("a", [1.0, 0.0, 0.0], {"content": "old a"})
+    index.upsert("b", [0.0, 1.0, 0.0], {"content": "b"})
+
+    index.upsert("a", embedding, {"content": "new a"})
+
+    assert len(index) == 1
+    assert [hit[0] for hit in index.search([1.0, 0.0, 0.0], top_k=5)] == ["b"]
+
+
+def test_upsert_replaces_the_row_in_place():
+    index = LocalVectorIndex(initial_capacity=1)
+    index.upsert("a", [1.0, 0.0], {"content": "old"})
+    index.upsert("b", [0.0, 1.0], {"content": "b"})  # grows the matrix
+    index.upsert("a", [0.0, 2.0], {"content": "new"})
+
+    assert len(index) == 2
+    hits = index.search([0.0, 1.0], top_k=2)
+    assert {hit[0] for hit in hits} == {"a", "b"}
+    assert hits[0][1] == pytest.approx(1.0)
+    assert dict((hit[0], hit[2]["content"]) for hit in hits)["a"] == "new"
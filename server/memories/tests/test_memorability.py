@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from django.test import override_settings
+
+from memories.memorability import assess_heuristics, assess_memorability
+
+
+@pytest.mark.parametrize("message", [
+    "I'm vegan.",
+    "I am allergic to peanuts",
+    "I live in Bengaluru",
+    "I have two cats",
+    "I've got a daughter named Mia",
+    "I prefer window seats",
+    "My son is 4",
+    "My wife's name is Ana",
+    "We live near the lake",
+    "Our dog is a beagle",
+])
+def test_declarative_self_facts_are_fast_accepted(message):
+    decision = assess_heuristics(message)
+    assert decision is not None and decision.memorable
+    assert decision.reason == "self_fact"
+
+
+@pytest.mark.parametrize("message", [
+    "I'm not sure",
+    "I don't know",
+    "I have a question about this",
+    "I'm just wondering",
+    "I'm going to lunch",
+    "I think so, maybe later",
+    "my bad",
+])
+def test_other_first_person_messages_go_to_the_classifier(message):
+    assert assess_heuristics(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "Tell me a joke",
+    "Can you help me with this?",
+    "Give me a summary of the meeting",
+    "Thanks, that helps us a lot",
+])
+def test_object_pronouns_are_not_a_personal_signal(message):
+    decision = assess_heuristics(message)
+    assert decision is None or not decision.memorable
+
+
+@pytest.mark.parametrize("message, reason", [
+    ("ok", "stop_phrase"),
+    ("Thanks!", "stop_phrase"),
+    ("12345", "no_letters"),
+    ("why?", "too_short"),
+    ("rewrite that", "meta_request"),
+    ("can you shorten it please", "meta_request"),
+])
+def test_chit_chat_is_skipped(message, reason):
+    decision = assess_heuristics(message)
+    assert decision is not None and not decision.memorable
+    assert decision.reason == reason
+
+
+@override_settings(MEMORABILITY_CLASSIFIER_ENABLED=True)
+def test_classifier_decides_first_person_non_facts():
+    async def classify(prompt):
+        assert prompt.endswith("I don't know")
+        return "NO"
+
+    decision = asyncio.run(assess_memorability("I don't know", classify=classify))
+    assert (decision.memorable, decision.reason) == (False, "classifier_no")
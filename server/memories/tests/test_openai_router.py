@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from django.test import override_settings
+
+from memories.openai_router import DeploymentRouter
+
+TPM = 60000
+TOKENS = 1000
+
+
+def _router():
+    router = DeploymentRouter([
+        {"name": "eus", "kind": "chat", "endpoint": "https://eus.example.com", "deployment": "gpt", "tpm": TPM},
+        {"name": "swe", "kind": "chat", "endpoint": "https://swe.example.com", "deployment": "gpt", "tpm": TPM},
+    ])
+    # Enough history for a p95; "eus" looks faster, so it is always the primary
+    for dep, ms in zip(router.deployments, (10.0, 50.0)):
+        dep.samples.extend([ms] * 20)
+        dep.ewma_ms = ms
+    return router
+
+
+def _level(router, name):
+    dep = next(d for d in router.deployments if d.name == name)
+    return router.limiter.for_deployment(dep).tokens.level
+
+
+@override_settings(ROUTER_HEDGING_ENABLED=True, ROUTER_HEDGE_MIN_DELAY_MS=10, ROUTER_EXPLORE_RATE=0)
+def test_hedge_loser_returns_its_reservation():
+    router = _router()
+    cancelled = []
+
+    async def send(dep):
+        if dep.name == "eus":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(dep.name)
+                raise
+        return {"usage": {"total_tokens": 300}}
+
+    result = asyncio.run(router.call_async("chat", send, tokens=TOKENS))
+
+    assert result == {"usage": {"total_tokens": 300}}
+    assert cancelled == ["eus"]
+    # The loser is back to (almost) full; the winner is charged its actual usage only
+    assert _level(router, "eus") == pytest.approx(TPM, abs=5)
+    assert _level(router, "swe") == pytest.approx(TPM - 300, abs=5)
+    assert all(d.in_flight == 0 for d in router.deployments)
+
+
+@override_settings(ROUTER_HEDGING_ENABLED=True, ROUTER_HEDGE_MIN_DELAY_MS=10, ROUTER_EXPLORE_RATE=0)
+def test_cancelling_a_hedged_call_cancels_both_attempts():
+    router = _router()
+    started, cancelled = [], []
+
+    async def send(dep):
+        started.append(dep.name)
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(dep.name)
+            raise
+
+    async def run():
+        call = asyncio.ensure_future(router.call_async("chat", send, tokens=TOKENS))
+        while len(started) < 2:
+            await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert sorted(cancelled) == ["eus", "swe"]
+    assert _level(router, "eus") == pytest.approx(TPM, abs=5)
+    assert _level(router, "swe") == pytest.approx(TPM, abs=5)
+    assert all(d.in_flight == 0 for d in router.deployments)
+
+
+@override_settings(ROUTER_EXPLORE_RATE=0)
+def test_failed_request_returns_its_reservation():
+    router = _router()
+
+    async def send(dep):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(router.call_async("chat", send, hedge=False, tokens=TOKENS))
+
+    assert _level(router, "eus") == pytest.approx(TPM, abs=5)
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+from memories import transfer
+
+
+class _PagedContainer:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def query_items(self, query, parameters, enable_cross_partition_query, max_item_count):
+        self.queries.append((query, parameters))
+        docs = self.docs
+
+        class _Result:
+            def by_page(self):
+                return iter([docs[i:i + max_item_count] for i in range(0, len(docs), max_item_count)])
+        return _Result()
+
+
+def test_export_walks_every_page_and_packs_embeddings(monkeypatch):
+    memories = _PagedContainer([
+        {"id": f"m{i}", "userId": "u1", "content": f"fact {i}", "embedding": [0.5, 1.0], "_etag": "x"}
+        for i in range(5)
+    ])
+    summaries = _PagedContainer([{"id": "c1", "userId": "u1", "summary": "talked"}])
+    monkeypatch.setattr(transfer, "MemoriesDBManager", lambda: SimpleNamespace(container=memories))
+    monkeypatch.setattr(transfer, "SummariesDBManager", lambda: SimpleNamespace(container=summaries))
+
+    records = list(transfer.iter_export_records("u1", page_size=2))
+
+    assert [r["id"] for r in records] == ["m0", "m1", "m2", "m3", "m4", "c1"]
+    assert [r["type"] for r in records] == ["memory"] * 5 + ["summary"]
+    assert "_etag" not in records[0] and "embedding" not in records[0]
+    assert transfer.unpack_embedding(records[0]["embedding_b64"]) == [0.5, 1.0]
+    assert memories.queries[0][1] == [{"name": "@user_id", "value": "u1"}]
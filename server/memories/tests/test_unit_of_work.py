@@ -0,0 +1,121 @@
+import pytest
+
+from memories.tests.fakes import FakeContainer, FakeDB
+from memories.unit_of_work import UnitOfWork, UnitOfWorkError
+
+
+@pytest.fixture
+def db():
+    return FakeDB(FakeContainer("memories", [
+        {"id": "m1", "content": "User likes tea"},
+        {"id": "m2", "content": "User lives in Oslo"},
+    ]))
+
+
+def test_get_reads_each_document_once(db):
+    uow = UnitOfWork()
+    first = uow.get(db, "m1")
+    second = uow.get(db, "m1")
+    assert first is second
+    assert db.container.calls == [("read", "m1")]
+    assert (uow.reads, uow.cache_hits) == (1, 1)
+
+
+def test_seeded_documents_skip_the_read(db):
+    uow = UnitOfWork()
+    uow.seed(db, [{"id": "m2", "content": "User lives in Oslo", "_etag": db.container.items["m2"]["_etag"]}])
+    assert uow.get(db, "m2")["content"] == "User lives in Oslo"
+    assert db.container.calls == []
+    assert uow.reads == 0
+
+
+def test_missing_document_is_cached_as_none(db):
+    uow = UnitOfWork()
+    assert uow.get(db, "nope") is None
+    assert uow.get(db, "nope") is None
+    assert db.container.calls == [("read", "nope")]
+
+
+def test_write_on_read_document_is_conditioned_on_its_etag(db):
+    uow = UnitOfWork()
+    doc = uow.get(db, "m1")
+    uow.upsert(db, {**doc, "content": "User likes green tea"})
+    assert uow.commit() == [("memories", "m1", "replace")]
+    assert db.container.items["m1"]["content"] == "User likes green tea"
+
+
+def test_concurrent_change_turns_412_into_conflict(db):
+    uow = UnitOfWork()
+    doc = uow.get(db, "m1")
+    db.container.upsert_item({"id": "m1", "content": "changed by another request"})
+    uow.upsert(db, {**doc, "content": "User likes green tea"})
+    with pytest.raises(UnitOfWorkError) as excinfo:
+        uow.commit()
+    assert excinfo.value.conflict is True
+    assert excinfo.value.committed == []
+    assert db.container.items["m1"]["content"] == "changed by another request"
+
+
+def test_patch_on_stale_seeded_doc_is_a_conflict(db):
+    uow = UnitOfWork()
+    uow.seed(db, [{"id": "m1", "content": "User likes tea", "_etag": "stale"}])
+    uow.patch(db, "m1", {"content": "User likes coffee"})
+    with pytest.raises(UnitOfWorkError) as excinfo:
+        uow.commit()
+    assert excinfo.value.conflict is True
+
+
+def test_non_conflict_failure_is_not_flagged_as_conflict(db):
+    uow = UnitOfWork()
+    uow.delete(db, "nope")  # 404, not a lost race
+    with pytest.raises(UnitOfWorkError) as excinfo:
+        uow.commit()
+    assert excinfo.value.conflict is False
+
+
+def test_replacement_is_created_before_the_delete(db):
+    uow = UnitOfWork()
+    uow.get(db, "m2")
+    uow.create(db, {"id": "m3", "content": "User lives in Bergen"})
+    uow.delete(db, "m2")
+    committed = uow.commit()
+    assert committed == [("memories", "m3", "create"), ("memories", "m2", "delete")]
+    writes = [call for call in db.container.calls if call[0] != "read"]
+    assert writes == [("create", "m3"), ("delete", "m2")]
+    assert set(db.container.items) == {"m1", "m3"}
+
+
+def test_failed_delete_keeps_the_replacement(db):
+    uow = UnitOfWork()
+    uow.get(db, "m2")
+    db.container.upsert_item({"id": "m2", "content": "edited concurrently"})
+    uow.create(db, {"id": "m3", "content": "User lives in Bergen"})
+    uow.delete(db, "m2")
+    with pytest.raises(UnitOfWorkError) as excinfo:
+        uow.commit()
+    assert excinfo.value.conflict is True
+    assert excinfo.value.committed == [("memories", "m3", "create")]
+    assert set(db.container.items) == {"m1", "m2", "m3"}
+
+
+def test_several_writes_on_one_document_form_a_batch(db):
+    uow = UnitOfWork()
+    uow.get(db, "m1")
+    uow.patch(db, "m1", {"content": "User likes coffee"})
+    uow.patch(db, "m1", {"updated_at": "2026-01-01T00:00:00"})
+    uow.commit()
+    assert ("batch", "m1") in db.container.calls
+    assert db.container.items["m1"]["content"] == "User likes coffee"
+    assert db.container.items["m1"]["updated_at"] == "2026-01-01T00:00:00"
+
+
+def test_failed_batch_leaves_the_document_untouched(db):
+    uow = UnitOfWork()
+    uow.get(db, "m1")
+    db.container.upsert_item({"id": "m1", "content": "edited concurrently"})
+    uow.patch(db, "m1", {"content": "User likes coffee"})
+    uow.delete(db, "m1")
+    with pytest.raises(UnitOfWorkError) as excinfo:
+        uow.commit()
+    assert excinfo.value.conflict is True
+    assert db.container.items["m1"]["content"] == "edited concurrently"
@@ -0,0 +1,232 @@
+"""Streaming NDJSON export / import of memories and conversation summaries.
+
+Format: one JSON object per line with a `type` discriminator.
+
+    {"type": "memory", "id": "...", "content": "...", "userId": "...", "embedding_b64": "<base64 float32 LE>", ...}
+    {"type": "summary", "id": "<conversationId>", "summary": "...", "lastNMessages": [...], ...}
+
+Embeddings are packed as base64 little-endian float32 (~4x smaller than JSON floats) and
+restored on import, so importing never re-embeds unless a record arrives without one.
+
+Both directions run in constant memory: export walks the containers one query page at a time,
+import consumes any line iterator and writes in bounded chunks. An interrupted export is not
+resumable; run it again (importing the partial file with skip_existing is harmless).
+
+Importing with a user override copies: records owned by another user get new ids (and their
+conversation / merge references are remapped), so the source user's documents are never
+overwritten. The new ids are derived from (override, old id), so re-running the same import
+with skip_existing resumes instead of duplicating.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .azure_openai import azure_openai
+from .cosmos_db import MemoriesDBManager, SummariesDBManager
+
+# Cosmos system properties that must not be written back on import
+_SYSTEM_FIELDS = ("_rid", "_self", "_etag", "_attachments", "_ts", "_lsn")
+
+RECORD_TYPES = ("memory", "summary")
+
+# Fields holding memory / conversation ids that are remapped when a record is copied to another user
+_ID_FIELDS = ("conversationId", "merged_into")
+_ID_LIST_FIELDS = ("merged_from",)
+_COPY_NAMESPACE = uuid.UUID("5d2f4c1e-8a53-4f0b-9c1d-7e3a6b2f9d40")
+
+
+def pack_embedding(embedding) -> str | None:
+    if not embedding:
+        return None
+    return base64.b64encode(np.asarray(embedding, dtype="<f4").tobytes()).decode("ascii")
+
+
+def unpack_embedding(packed: str | None) -> list[float] | None:
+    if not packed:
+        return None
+    return np.frombuffer(base64.b64decode(packed), dtype="<f4").astype(float).tolist()
+
+
+def _strip_system_fields(doc: dict) -> dict:
+    return {k: v for k, v in doc.items() if k not in _SYSTEM_FIELDS}
+
+
+def iter_pages(container, query: str, parameters: list | None = None, page_size: int = 100):
+    """Yield the items of a cross-partition query one page (at most `page_size` items) at a time."""
+    pager = container.query_items(
+        query=query,
+        parameters=parameters or [],
+        enable_cross_partition_query=True,
+        max_item_count=page_size,
+    ).by_page()
+    for page in pager:
+        yield list(page)
+
+
+def _user_filter(user_id: str | None) -> tuple[str, list]:
+    if not user_id:
+        return "", []
+    return " WHERE c.userId = @user_id", [{"name": "@user_id", "value": user_id}]
+
+
+def iter_export_records(user_id: str | None = None, include=RECORD_TYPES, page_size: int | None = None,
+                        include_deleted: bool = False):
+    """Yield export records (dicts) for a user's memories and summaries."""
+    page_size = page_size or getattr(settings, "TRANSFER_PAGE_SIZE", 200)
+    where, parameters = _user_filter(user_id)
+    if "memory" in include:
+        query = "SELECT * FROM c" + where
+        if not include_deleted:
+            query += (" AND" if where else " WHERE") + " (NOT IS_DEFINED(c.deleted) OR c.deleted = false)"
+        container = MemoriesDBManager().container
+        for items in iter_pages(container, query, parameters, page_size):
+            for doc in items:
+                record = _strip_system_fields(doc)
+                record["embedding_b64"] = pack_embedding(record.pop("embedding", None))
+                record["type"] = "memory"
+                yield record
+    if "summary" in include:
+        container = SummariesDBManager().container
+        for items in iter_pages(container, "SELECT * FROM c" + where, parameters, page_size):
+            for doc in items:
+                record = _strip_system_fields(doc)
+                record["type"] = "summary"
+                yield record
+
+
+def iter_export_lines(user_id: str | None = None, include=RECORD_TYPES, page_size: int | None = None):
+    """Yield NDJSON lines (bytes) suitable for StreamingHttpResponse or a file."""
+    count = 0
+    for record in iter_export_records(user_id, include, page_size):
+        count += 1
+        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    metrics.incr("transfer.exported", count)
+    print(f"[transfer] Exported {count} records user={user_id or '*'}")
+
+
+def copied_id(user_id: str, old_id: str) -> str:
+    """Stable id of `old_id` copied to `user_id` (same input, same id across runs and chunks)."""
+    return str(uuid.uuid5(_COPY_NAMESPACE, f"{user_id}:{old_id}"))
+
+
+def _copy_to_user(doc: dict, user_id: str) -> dict:
+    doc["id"] = copied_id(user_id, doc["id"])
+    for field in _ID_FIELDS:
+        if doc.get(field):
+            doc[field] = copied_id(user_id, doc[field])
+    for field in _ID_LIST_FIELDS:
+        if isinstance(doc.get(field), list):
+            doc[field] = [copied_id(user_id, v) for v in doc[field]]
+    # The copy is not in the new user's Graphiti group yet; let the change feed ingest it
+    doc.pop("graphiti_synced", None)
+    doc["userId"] = user_id
+    return doc
+
+
+def _parse_line(raw, user_id_override: str | None):
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    raw = raw.strip()
+    if not raw:
+        return None
+    record = json.loads(raw)
+    if not isinstance(record, dict) or record.get("type") not in RECORD_TYPES or not record.get("id"):
+        raise ValueError("record must be an object with 'type' (memory|summary) and 'id'")
+    record_type = record.pop("type")
+    doc = _strip_system_fields(record)
+    if user_id_override and doc.get("userId") != user_id_override:
+        doc = _copy_to_user(doc, user_id_override)
+    if record_type == "memory":
+        packed = doc.pop("embedding_b64", None)
+        if packed:
+            doc["embedding"] = unpack_embedding(packed)
+    return record_type, doc
+
+
+def import_lines(lines, user_id_override: str | None = None, batch_size: int | None = None,
+                 skip_existing: bool = False, concurrency: int | None = None) -> dict:
+    """Import NDJSON lines; returns counts of written/skipped/re-embedded records and errors.
+
+    With `user_id_override`, records of other users are copied under new ids (see module docstring).
+
+    Lines are buffered at most `batch_size` at a time and written concurrently, so memory use
+    does not depend on the size of the input.
+    """
+    batch_size = batch_size or getattr(settings, "TRANSFER_IMPORT_BATCH_SIZE", 100)
+    concurrency = concurrency or getattr(settings, "TRANSFER_IMPORT_CONCURRENCY", 8)
+    dbs = {"memory": MemoriesDBManager(), "summary": SummariesDBManager()}
+    stats = {"memories": 0, "summaries": 0, "skipped": 0, "reembedded": 0, "error_count": 0, "errors": []}
+
+    def _record_error(message: str):
+        # Keep only the first errors so a malformed multi-GB file cannot exhaust memory
+        stats["error_count"] += 1
+        if len(stats["errors"]) < 100:
+            stats["errors"].append(message)
+
+    def _write(item):
+        record_type, doc = item
+        db = dbs[record_type]
+        try:
+            if record_type == "memory" and not doc.get("embedding") and doc.get("content") and not doc.get("deleted"):
+                # Only re-embed when the export did not carry an embedding
+                doc["embedding"] = azure_openai.generate_embeddings(doc["content"])
+                if doc["embedding"] is None:
+                    return record_type, "error", f"{doc['id']}: failed to embed"
+                outcome = "reembedded"
+            else:
+                outcome = "written"
+            if skip_existing:
+                from azure.cosmos.exceptions import CosmosResourceExistsError
+                try:
+                    db.create_item(doc)
+                except CosmosResourceExistsError:
+                    return record_type, "skipped", None
+            else:
+                db.upsert_item(doc)
+            return record_type, outcome, None
+        except Exception as e:
+            return record_type, "error", f"{doc.get('id')}: {e}"
+
+    def _flush(pool, pending):
+        for record_type, outcome, error in pool.map(_write, pending):
+            if outcome == "error":
+                _record_error(error)
+                continue
+            if outcome == "skipped":
+                stats["skipped"] += 1
+                continue
+            stats["memories" if record_type == "memory" else "summaries"] += 1
+            if outcome == "reembedded":
+                stats["reembedded"] += 1
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for line_no, raw in enumerate(lines, start=1):
+            try:
+                parsed = _parse_line(raw, user_id_override)
+            except Exception as e:
+                _record_error(f"line {line_no}: {e}")
+                continue
+            if parsed is None:
+                continue
+            pending.append(parsed)
+            if len(pending) >= batch_size:
+                _flush(pool, pending)
+                pending = []
+        if pending:
+            _flush(pool, pending)
+
+    metrics.incr("transfer.imported", stats["memories"] + stats["summaries"])
+    metrics.incr("transfer.reembedded", stats["reembedded"])
+    print(
+        f"[transfer] Imported memories={stats['memories']} summaries={stats['summaries']} "
+        f"skipped={stats['skipped']} reembedded={stats['reembedded']} errors={stats['error_count']}"
+    )
+    return stats
@@ -0,0 +1,158 @@
+"""Request-scoped unit of work for Cosmos documents.
+
+A UnitOfWork is an identity map plus a queue of pending writes:
+
+    uow = UnitOfWork()
+    uow.seed(memories_db, neighbour_docs)          # docs a query already returned, with _etag
+    doc = uow.get(summaries_db, conversation_id)   # read once per request, cached afterwards
+    uow.upsert(summaries_db, doc)                  # queued, conditioned on the ETag read
+    uow.patch(memories_db, memory_id, {"content": ...})
+    uow.commit()
+
+`commit` groups the queued operations by (container, partition key). Groups of two or more
+operations run as one transactional batch; single operations use the plain item API. Every
+write on a document that was read in this unit of work carries `If-Match: <etag>`, so a
+concurrent change makes the write fail instead of being overwritten.
+
+Partition key = id in both containers, so operations on different documents cannot share a
+batch. Groups are committed in queue order and commit stops at the first failure; callers
+queue the non-destructive write first (e.g. create the replacement before deleting the
+contradicted memory) so a partial commit never loses data.
+"""
+from __future__ import annotations
+
+from azure.core import MatchConditions
+
+from . import metrics
+
+
+class UnitOfWorkError(Exception):
+    """Raised by commit(); `committed` lists the (container, id, op) writes that succeeded."""
+
+    def __init__(self, message: str, committed: list, conflict: bool = False):
+        super().__init__(message)
+        self.committed = committed
+        self.conflict = conflict
+
+
+class UnitOfWork:
+    def __init__(self):
+        self._docs: dict[tuple[str, str], dict] = {}
+        self._ops: list[dict] = []
+        self.reads = 0
+        self.cache_hits = 0
+
+    @staticmethod
+    def _key(db, id: str) -> tuple[str, str]:
+        return db.container.id, id
+
+    # -- identity map --------------------------------------------------------------------
+    def seed(self, db, docs) -> None:
+        """Register documents a query already returned so later lookups skip the read."""
+        for doc in docs:
+            if doc and doc.get("id"):
+                self._docs.setdefault(self._key(db, doc["id"]), doc)
+
+    def get(self, db, id: str) -> dict | None:
+        """Return the document, reading it at most once per unit of work (None if missing)."""
+        key = self._key(db, id)
+        if key in self._docs:
+            self.cache_hits += 1
+            return self._docs[key]
+        self.reads += 1
+        try:
+            doc = db.get_item(id)
+        except Exception as e:
+            if getattr(e, "status_code", None) != 404:
+                raise
+            doc = None
+        self._docs[key] = doc
+        return doc
+
+    def etag(self, db, id: str) -> str | None:
+        doc = self._docs.get(self._key(db, id))
+        return doc.get("_etag") if doc else None
+
+    # -- pending writes ------------------------------------------------------------------
+    def _queue(self, db, op: str, id: str, **kwargs) -> None:
+        self._ops.append({"db": db, "op": op, "id": id, "etag": self.etag(db, id), **kwargs})
+
+    def create(self, db, doc: dict) -> None:
+        self._docs[self._key(db, doc["id"])] = doc
+        self._queue(db, "create", doc["id"], body=doc)
+
+    def upsert(self, db, doc: dict) -> None:
+        """Queue a full-document write; replaces (If-Match) when the doc was read here."""
+        self._queue(db, "replace" if self.etag(db, doc["id"]) else "upsert", doc["id"], body=doc)
+        self._docs[self._key(db, doc["id"])] = doc
+
+    def patch(self, db, id: str, fields: dict) -> None:
+        """Queue a partial update; works on seeded docs that only carry projected fields."""
+        operations = [{"op": "set", "path": f"/{name}", "value": value} for name, value in fields.items()]
+        self._queue(db, "patch", id, operations=operations)
+        doc = self._docs.get(self._key(db, id))
+        if doc is not None:
+            doc.update(fields)
+
+    def delete(self, db, id: str) -> None:
+        self._queue(db, "delete", id)
+        self._docs[self._key(db, id)] = None
+
+    # -- commit --------------------------------------------------------------------------
+    @staticmethod
+    def _match(etag):
+        return {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag else {}
+
+    def _run_single(self, op: dict):
+        container, match = op["db"].container, self._match(op["etag"])
+        if op["op"] == "create":
+            return container.create_item(body=op["body"])
+        if op["op"] == "upsert":
+            return container.upsert_item(op["body"])
+        if op["op"] == "replace":
+            return container.replace_item(item=op["id"], body=op["body"], **match)
+        if op["op"] == "patch":
+            return container.patch_item(item=op["id"], partition_key=op["id"],
+                                        patch_operations=op["operations"], **match)
+        return container.delete_item(item=op["id"], partition_key=op["id"], **match)
+
+    @staticmethod
+    def _batch_operation(op: dict, first: bool) -> tuple:
+        # The ETag read before the batch is only valid for its first operation on the document
+        kwargs = {"if_match_etag": op["etag"]} if op["etag"] and first else {}
+        if op["op"] in ("create", "upsert"):
+            return op["op"], (op["body"],)
+        if op["op"] == "replace":
+            return "replace", (op["id"], op["body"]), kwargs
+        if op["op"] == "patch":
+            return "patch", (op["id"], op["operations"]), kwargs
+        return "delete", (op["id"],), kwargs
+
+    def commit(self) -> list:
+        """Apply queued writes; returns (container, id, op) for each. Raises UnitOfWorkError."""
+        groups: dict[tuple[str, str], list[dict]] = {}
+        for op in self._ops:
+            groups.setdefault(self._key(op["db"], op["id"]), []).append(op)
+        committed = []
+        try:
+            for (container_name, partition), ops in groups.items():
+                if len(ops) == 1:
+                    result = self._run_single(ops[0])
+                    if isinstance(result, dict) and result.get("_etag"):
+                        self._docs[(container_name, partition)] = result
+                else:
+                    ops[0]["db"].container.execute_item_batch(
+                        batch_operations=[self._batch_operation(op, i == 0) for i, op in enumerate(ops)], partition_key=partition
+                    )
+                    metrics.incr("unit_of_work.batches")
+                committed.extend((container_name, op["id"], op["op"]) for op in ops)
+        except Exception as e:
+            conflict = getattr(e, "status_code", None) in (409, 412)
+            metrics.incr("unit_of_work.failures", conflict=str(conflict).lower())
+            raise UnitOfWorkError(f"commit failed after {len(committed)} write(s): {e}", committed, conflict) from e
+        finally:
+            self._ops = []
+            metrics.incr("unit_of_work.reads", self.reads)
+            metrics.incr("unit_of_work.cache_hits", self.cache_hits)
+        metrics.incr("unit_of_work.writes", len(committed))
+        return committed
@@ -6,6 +6,11 @@ urlpatterns = [
     path('add-with-graphiti/', views.add_memory_with_graphiti, name='add_memory_with_graphiti'),
     path('retrieve/', views.retrieve_memories, name='retrieve_memories'),
     path('list/', views.list_memories, name='list_memories'),
+    path('export/', views.export_memories, name='export_memories'),
+    path('import/', views.import_memories, name='import_memories'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('graph-search/', views.search_graph, name='search_graph'),
+    path('episodes/', views.list_episodes, name='list_episodes'),
     path('<str:memory_id>/', views.memory_detail, name='memory_detail'),
     path('retrieve-answer/', views.retrieve_answer, name='retrieve_answer'),
     path("process-memory/", views.process_memory,name='process-memory'), 
@@ -1,14 +1,23 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from .models import Memory
 from .cosmos_db import MemoriesDBManager, SummariesDBManager
 from .azure_openai import azure_openai
+from . import (
+    conversation_summary, cypher_profile, decisions, episode_buffer, episodes, graph_expansion, graph_groups,
+    graph_search, graphiti_loop, local_index, metrics, model_tiers, output_budget,
+)
+from .transfer import RECORD_TYPES, iter_export_lines, import_lines
+from .memorability import assess_memorability
+from .llm_cache import get_cache as get_llm_cache, make_key, should_cache
+from .prompt_budget import PromptBudget, count_tokens, get_budget, get_max_output_tokens
+from .unit_of_work import UnitOfWork, UnitOfWorkError
+from .openai_router import DeploymentError, get_router
 from datetime import datetime, timezone
 from django.views.decorators.csrf import csrf_exempt
 import json
 from django.conf import settings
-import httpx
 import uuid
 import re  # Needed for clean_text()
 
@@ -17,10 +26,23 @@ from .graphiti_client import get_graphiti  # lazy async initializer
 from graphiti_core.nodes import EpisodeType  # for source type
 import hashlib  # for stable episode name hash suffix
 import asyncio
+import time
 
 # -----------------------------
 # Helper Functions
 # -----------------------------
+# Prompt layout: every prompt starts with its static instructions (system message, or the head of
+# the user message) and puts variable content after them, most stable first (long-term summary,
+# recent summary, earlier messages, new message). Azure OpenAI caches prompt prefixes of 1024+
+# tokens, so a long conversation re-sends a prefix the service has already processed; hits are
+# reported as llm.cached_tokens (memories/model_tiers.py).
+RELEVANCE_INSTRUCTIONS = (
+    "You are a relevance filter.\n"
+    "Return ONLY a JSON array (no prose) of the 'id' values of memories that might be helpful or relevant to address the user query (context expansion, answering, follow-up).\n"
+    "If none are relevant return []. Do not include duplicates or any explanation."
+)
+
+
 def filter_relevant_memories(query_text: str, memories: list):
     """Use Azure OpenAI to keep only memories relevant to the query.
 
@@ -39,19 +61,26 @@ def filter_relevant_memories(query_text: str, memories: list):
     try:
         import json as _json
         print(f"[filter_relevant_memories] Filtering {len(memories)} memories for query: {query_text[:120]}")
-        candidate_min = [
-            {"id": item.get("id"), "content": (item.get("content") or "")[:800]}
+        # Memories arrive best-first from vector search; the budget drops the lowest-ranked first
+        budget = PromptBudget("relevance")
+        budget.fixed(RELEVANCE_INSTRUCTIONS, "\n\nCandidate memories (JSON array):\n\n\nUser query: ")
+        query_part = budget.fit(query_text, max_tokens=budget.budget // 4)
+        item_cap = getattr(settings, "PROMPT_RELEVANCE_ITEM_MAX_TOKENS", 200)
+        candidate_json = [
+            _json.dumps({"id": item.get("id"), "content": budget.clip(item.get("content") or "", item_cap)}, ensure_ascii=False)
             for item in memories
         ]
+        kept = budget.fit_ranked(candidate_json, separator_tokens=2)
+        budget.finish()
+        # Static instructions first so the provider can reuse the cached prefix across queries
         relevance_prompt = (
-            "You are a relevance filter.\n" \
-            f"User query: {query_text}\n\n" \
-            "Candidate memories (JSON array):\n" \
-            f"{_json.dumps(candidate_min, ensure_ascii=False)}\n\n" \
-            "Return ONLY a JSON array (no prose) of the 'id' values of memories that might be helpful or relevant to address the user query (context expansion, answering, follow-up).\n" \
-            "If none are relevant return []. Do not include duplicates or any explanation."
+            f"{RELEVANCE_INSTRUCTIONS}\n\n"
+            "Candidate memories (JSON array):\n"
+            f"[{', '.join(text for _, text in kept)}]\n\n"
+            f"User query: {query_part}"
         )
-        llm_raw = azure_openai.generate_completion(relevance_prompt, max_tokens=200, temperature=0)
+        llm_raw = azure_openai.generate_completion(relevance_prompt, max_tokens=get_max_output_tokens("relevance"),
+                                                   temperature=0, prompt_name="relevance")
         selected_ids = []
         if llm_raw:
             llm_text = llm_raw.strip()
@@ -117,6 +146,7 @@ def add_memory_with_graphiti(request):
         "id": "M-001" (optional)           # if provided & not existing will be used
         "episode_name": "mem-M-001" (opt)  # optional explicit Graphiti episode name
         "source_description": "manual_seed" (opt)
+        "user_id": "u-123" (opt)           # episode goes to the user's Graphiti group
       }
 
     Response 201 JSON:
@@ -134,6 +164,7 @@ def add_memory_with_graphiti(request):
         provided_id = data.get('id')
         episode_name = data.get('episode_name')
         source_description = data.get('source_description') or 'manual_seed'
+        group_id = graph_groups.group_for_user(data.get('user_id'))
 
         memories_db = MemoriesDBManager()
 
@@ -175,28 +206,25 @@ def add_memory_with_graphiti(request):
         # Create memory (embed via model)
         memory = Memory(content=content, id=provided_id)
         cosmos_item = memory.to_cosmos_item()
+        cosmos_item["graphiti_synced"] = True  # ingested below; the change-feed GraphitiSink skips it
         created_item = memories_db.create_item(cosmos_item)
 
-        # Graphiti ingestion (episode) reuses same content. Run async helper in blocking context.
+        # Graphiti ingestion (episode) reuses same content; runs on the shared Graphiti loop so the
+        # Neo4j driver pool stays warm across requests.
         graphiti_result = {'ingested': False}
         try:
-            import asyncio as _asyncio
-            ep_name, _ = _asyncio.run(ingest_graphiti_episode(content, source_desc=source_description, name=episode_name))
+            ep_name, _ = graphiti_loop.run(ingest_graphiti_episode(
+                content, source_desc=source_description, name=episode_name, group_id=group_id,
+            ))
             graphiti_result = {'ingested': True, 'episode_name': ep_name}
-        except RuntimeError as rt_err:
-            # If already in an event loop (unlikely in default dev server), create nested loop workaround
-            try:
-                import asyncio as _asyncio
-                loop = _asyncio.new_event_loop()
-                try:
-                    ep_name, _ = loop.run_until_complete(ingest_graphiti_episode(content, source_desc=source_description, name=episode_name))
-                    graphiti_result = {'ingested': True, 'episode_name': ep_name}
-                finally:
-                    loop.close()
-            except Exception as ge2:
-                graphiti_result = {'ingested': False, 'error': f"{rt_err}; nested loop failed: {ge2}"}
         except Exception as ge:
             graphiti_result = {'ingested': False, 'error': str(ge)}
+            # Leave it to the change-feed GraphitiSink instead
+            created_item["graphiti_synced"] = False
+            try:
+                created_item = memories_db.upsert_item(created_item)
+            except Exception as ue:
+                print(f"[add_memory_with_graphiti] Failed to clear graphiti_synced: {ue}")
 
         return JsonResponse({'memory': created_item, 'graphiti': graphiti_result}, status=201)
     except Exception as e:
@@ -210,6 +238,9 @@ def retrieve_memories(request):
     Query params:
         q: required text to search for.
         top_k: optional integer limiting number of results.
+        expand: optional 1/true to add the graph neighbourhood of the top hits (see
+            memories/graph_expansion.py); the response is then {"memories", "graph"}.
+        group_id / user_id: optional Graphiti group (or the user whose group) to expand within.
     """
     try:
         memories_db = MemoriesDBManager()
@@ -243,11 +274,6 @@ def retrieve_memories(request):
             print(f"[retrieve_memories] DEMO_MODE returning {len(response)} static memories (no relevance filter)")
             return JsonResponse(response, safe=False)
 
-        embedding = azure_openai.generate_embeddings(query_text)
-        if embedding is None:
-            print("[retrieve_memories] Failed to generate embedding")
-            return JsonResponse({"error": "Failed to generate embedding"}, status=500)
-
         top_k_param = request.query_params.get('top_k')
         top_k = None
         if top_k_param is not None:
@@ -255,14 +281,45 @@ def retrieve_memories(request):
                 top_k = int(top_k_param)
             except ValueError:
                 return JsonResponse({"error": "Invalid 'top_k' parameter"}, status=400)
-        similar = memories_db.search_similar_memories(embedding, top_k=top_k)
-        print(f"[retrieve_memories] Retrieved {len(similar)} similar memories before LLM relevance filter")
-        response = [
-            {**mem.to_cosmos_item(), 'similarity': score}
-            for mem, score in similar
-        ]
+        # Local indexes kept by the in-process change feed (CHANGE_FEED_IN_PROCESS) answer the
+        # query when embedding or Cosmos vector search fails
+        fallback_top_k = top_k if top_k and top_k > 0 else getattr(settings, 'MEMORY_SEARCH_TOP_K_DEFAULT', 5)
+
+        embedding = azure_openai.generate_embeddings(query_text)
+        if embedding is None:
+            response = local_index.fallback_search(query_text, top_k=fallback_top_k)
+            if response is None:
+                print("[retrieve_memories] Failed to generate embedding")
+                return JsonResponse({"error": "Failed to generate embedding"}, status=500)
+            metrics.incr("retrieve.local_fallback", index="lexical")
+            print(f"[retrieve_memories] Embedding failed; {len(response)} memories from the local lexical index")
+        else:
+            try:
+                similar = memories_db.search_similar_memories(embedding, top_k=top_k)
+                response = [
+                    {**mem.to_cosmos_item(), 'similarity': score}
+                    for mem, score in similar
+                ]
+                print(f"[retrieve_memories] Retrieved {len(similar)} similar memories before LLM relevance filter")
+            except Exception as se:
+                response = local_index.fallback_search(query_text, embedding, top_k=fallback_top_k)
+                if response is None:
+                    raise
+                metrics.incr("retrieve.local_fallback", index="vector")
+                print(f"[retrieve_memories] Cosmos vector search failed ({se}); {len(response)} memories from the local vector index")
         response = filter_relevant_memories(query_text, response)
         print(f"[retrieve_memories] Returning {len(response)} memories after relevance filter")
+        if request.query_params.get('expand', '').lower() in ('1', 'true', 'yes'):
+            try:
+                group_id = graph_groups.resolve_group(request.query_params.get('group_id'),
+                                                      request.query_params.get('user_id'))
+                graph = graphiti_loop.run(graph_expansion.expand(response, group_id=group_id))
+                print(f"[retrieve_memories] Graph expansion added {len(graph['facts'])} fact(s) cost={graph['cost']}")
+            except Exception as ge:
+                # Expansion is additive: the vector hits are still returned without it
+                print(f"[retrieve_memories] Graph expansion failed: {ge}")
+                graph = {"error": str(ge)}
+            return JsonResponse({"memories": response, "graph": graph})
         return JsonResponse(response, safe=False)
     except Exception as e:
         print(f"[retrieve_memories] Exception: {e}")
@@ -288,6 +345,7 @@ def list_memories(request):
         query = f"""
         SELECT c.id, c.content, c.created_at, c.updated_at
         FROM c
+        WHERE NOT IS_DEFINED(c.deleted) OR c.deleted = false
         ORDER BY c.created_at DESC
         OFFSET 0 LIMIT {limit}
         """
@@ -335,6 +393,8 @@ def memory_detail(request, memory_id: str):
                 doc["embedding"] = embedding
             doc["content"] = new_content
             doc["updated_at"] = datetime.utcnow().isoformat()
+            # Not ingested inline: let the change-feed GraphitiSink pick the edit up
+            doc["graphiti_synced"] = False
             db.upsert_item(doc)
             return JsonResponse(doc, status=200)
         except Exception as e:
@@ -349,6 +409,124 @@ def memory_detail(request, memory_id: str):
 
     return JsonResponse({"error": "Method not allowed"}, status=405)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def export_memories(request):
+    """Stream a user's memories and summaries as NDJSON (embeddings packed as base64 float32).
+
+    Query params:
+        userId: optional; export only this user's documents (default: everything)
+        include: optional comma separated subset of "memory,summary" (default both)
+    """
+    user_id = request.query_params.get('userId') or request.query_params.get('user_id')
+    include_param = request.query_params.get('include')
+    include = tuple(t.strip() for t in include_param.split(',')) if include_param else RECORD_TYPES
+    unknown = [t for t in include if t not in RECORD_TYPES]
+    if unknown:
+        return JsonResponse({"error": f"Invalid 'include' value(s): {', '.join(unknown)}"}, status=400)
+    print(f"[export_memories] Streaming export user={user_id or '*'} include={include}")
+    response = StreamingHttpResponse(iter_export_lines(user_id, include), content_type='application/x-ndjson')
+    filename = f"memories-{user_id or 'all'}.ndjson"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@csrf_exempt
+def import_memories(request):
+    """Import an NDJSON stream produced by /export/ (request body is read line by line).
+
+    Query params:
+        userId: optional; import a copy owned by this user (new ids, the source documents are untouched)
+        skipExisting: optional "1" to keep documents that already exist instead of overwriting
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    user_id = request.GET.get('userId') or request.GET.get('user_id')
+    skip_existing = request.GET.get('skipExisting') in ('1', 'true', 'True')
+    try:
+        # Iterating the request yields body lines without buffering the whole upload
+        stats = import_lines(request, user_id_override=user_id, skip_existing=skip_existing)
+    except Exception as e:
+        print(f"[import_memories] Exception: {e}")
+        return JsonResponse({"error": str(e)}, status=400)
+    status = 200 if not stats["error_count"] else 207
+    return JsonResponse(stats, status=status)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def metrics_view(request):
+    """Return the in-process metrics snapshot (counters, gauges, latency percentiles) and deployment health."""
+    return JsonResponse({
+        **metrics.snapshot(),
+        "deployments": get_router().snapshot(),
+        "graph_search": graph_search.stats(),
+        "cypher": cypher_profile.stats(),
+        "graphiti_llm": output_budget.stats(),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_graph(request):
+    """Search the Graphiti knowledge graph (cached, see memories/graph_search.py).
+
+    Query params:
+        q: required search text.
+        group_id: optional Graphiti group; omitted searches all groups.
+        user_id: optional user whose group to search (ignored when group_id is given).
+        config: optional search recipe name (default GRAPH_SEARCH_CONFIG).
+        limit: optional number of results per layer (default 10).
+    """
+    query_text = (request.GET.get('q') or '').strip()
+    if not query_text:
+        return JsonResponse({"error": "Query parameter 'q' is required"}, status=400)
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({"error": "'limit' must be an integer"}, status=400)
+    try:
+        result = graphiti_loop.run(graph_search.search_graph(
+            query_text, group_id=graph_groups.resolve_group(request.GET.get('group_id'), request.GET.get('user_id')),
+            config_name=request.GET.get('config'), num_results=limit,
+        ))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        print(f"[search_graph] Exception: {e}")
+        return JsonResponse({"error": str(e)}, status=502)
+    return JsonResponse({"query": query_text, **result})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def list_episodes(request):
+    """List Graphiti episodes newest first, one keyset page at a time (see memories/episodes.py).
+
+    Query params:
+        limit: optional page size (default 50, max 500).
+        cursor: optional `next_cursor` from the previous page.
+        group_id: optional Graphiti group.
+        user_id: optional user whose group to list (ignored when group_id is given).
+        content: optional 1/true to include episode content.
+        content_chars: optional max characters of content per episode.
+    """
+    try:
+        limit = int(request.GET.get('limit', 50))
+        content_chars = int(request.GET['content_chars']) if request.GET.get('content_chars') else None
+    except ValueError:
+        return JsonResponse({"error": "'limit' and 'content_chars' must be integers"}, status=400)
+    include_content = request.GET.get('content', '').lower() in ('1', 'true', 'yes')
+    try:
+        page = graphiti_loop.run(episodes.list_episodes(
+            limit=limit, cursor=request.GET.get('cursor') or None,
+            group_id=graph_groups.resolve_group(request.GET.get('group_id'), request.GET.get('user_id')),
+            include_content=include_content, content_chars=content_chars,
+        ))
+    except episodes.InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        print(f"[list_episodes] Exception: {e}")
+        return JsonResponse({"error": str(e)}, status=502)
+    return JsonResponse(page)
+
 @api_view(['GET'])
 def retrieve_answer(request):
     """Generate mock answers based on question content.
@@ -434,49 +612,125 @@ def generate_conversation_id(user_id: str) -> str:
 async def get_embedding_async(text: str):
     """Generate embedding from Azure OpenAI."""
     print(f"[get_embedding_async] Generating embedding len(text)={len(text)}")
-    base = settings.AZURE_OPENAI_ENDPOINT.rstrip('/') if settings.AZURE_OPENAI_ENDPOINT else ''
-    url = f"{base}/openai/deployments/{settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT}/embeddings?api-version={settings.AZURE_OPENAI_VERSION}"
-    headers = {"Content-Type": "application/json", "api-key": settings.AZURE_OPENAI_KEY}
-    payload = {"input": text}
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post(url, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            return data["data"][0]["embedding"]
-    except httpx.HTTPStatusError as he:
+        data = await get_router().post("embedding", "embeddings", {"input": text})
+        return data["data"][0]["embedding"]
+    except DeploymentError as de:
         # Surface Azure specific error for easier debugging
-        print(f"[get_embedding_async] HTTPStatusError: {he.response.status_code}")
-        raise RuntimeError(f"Embedding request failed {he.response.status_code}: {he.response.text}") from he
+        print(f"[get_embedding_async] HTTPStatusError: {de.status_code}")
+        raise RuntimeError(f"Embedding request failed {de.status_code}: {de.response_text}") from de
     except Exception as e:
         print(f"[get_embedding_async] Exception: {e}")
         raise RuntimeError(f"Embedding request error: {e}") from e
 
 
-async def llm_generate_async(prompt: str, system: str = None, max_tokens: int = 256):
-    """Call Azure OpenAI Chat (gpt-4o-mini)."""
-    print(f"[llm_generate_async] system='{(system or '')[:40]}' prompt_len={len(prompt)} max_tokens={max_tokens}")
-    base = settings.AZURE_OPENAI_ENDPOINT.rstrip('/') if settings.AZURE_OPENAI_ENDPOINT else ''
-    url = f"{base}/openai/deployments/{settings.AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={settings.AZURE_OPENAI_VERSION}"
-    headers = {"Content-Type": "application/json", "api-key": settings.AZURE_OPENAI_KEY}
-    messages = []
-    if system:
-        messages.append({"role": "system", "content": system})
-    messages.append({"role": "user", "content": prompt})
+async def get_embeddings_async(texts: list[str]) -> list:
+    """Generate embeddings for several texts with one Azure OpenAI request (order preserved)."""
+    if not texts:
+        return []
+    print(f"[get_embeddings_async] Generating {len(texts)} embeddings in one request")
+    try:
+        data = (await get_router().post("embedding", "embeddings", {"input": texts}))["data"]
+        return [row["embedding"] for row in sorted(data, key=lambda row: row["index"])]
+    except DeploymentError as de:
+        print(f"[get_embeddings_async] HTTPStatusError: {de.status_code}")
+        raise RuntimeError(f"Embedding request failed {de.status_code}: {de.response_text}") from de
+    except Exception as e:
+        print(f"[get_embeddings_async] Exception: {e}")
+        raise RuntimeError(f"Embedding request error: {e}") from e
+
 
-    payload = {"messages": messages, "max_tokens": max_tokens}
+async def _chat_completion_async(messages: list, max_tokens: int, deployment: str = None,
+                                 prompt_name: str = None, **extra):
+    """POST a chat completion through the deployment router and return the JSON body.
+
+    The pool is the tier of `prompt_name` (PROMPT_MODEL_TIERS); an explicit `deployment` selects
+    the pool it belongs to instead.
+    """
+    router = get_router()
+    kind = router.kind_for_model(deployment) if deployment else model_tiers.kind_for(prompt_name)
+    payload = {"messages": messages, "max_tokens": max_tokens, **extra}
+    start = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post(url, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            return data["choices"][0]["message"]["content"].strip()
-    except httpx.HTTPStatusError as he:
-        print(f"[llm_generate_async] HTTPStatusError: {he.response.status_code}")
-        raise RuntimeError(f"Chat request failed {he.response.status_code}: {he.response.text}") from he
+        data = await router.post(kind, "chat/completions", payload)
+    except DeploymentError as de:
+        model_tiers.record(prompt_name, (time.perf_counter() - start) * 1000, ok=False)
+        print(f"[llm_generate_async] HTTPStatusError: {de.status_code}")
+        raise RuntimeError(f"Chat request failed {de.status_code}: {de.response_text}") from de
     except Exception as e:
+        model_tiers.record(prompt_name, (time.perf_counter() - start) * 1000, ok=False)
         print(f"[llm_generate_async] Exception: {e}")
         raise RuntimeError(f"Chat request error: {e}") from e
+    model_tiers.record(prompt_name, (time.perf_counter() - start) * 1000, usage=data.get("usage"))
+    return data
+
+
+def _build_messages(prompt: str, system: str = None) -> list:
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+async def llm_generate_async(prompt: str, system: str = None, max_tokens: int = 256, deployment: str = None,
+                             temperature: float = None, cache: bool = None, prompt_name: str = None):
+    """Call Azure OpenAI Chat on the model tier of `prompt_name`; `deployment` overrides the tier.
+
+    Deterministic calls (temperature=0, or cache=True) are served from the LLM response cache;
+    pass cache=False to bypass it.
+    """
+    print(f"[llm_generate_async] system='{(system or '')[:40]}' prompt_len={len(prompt)} max_tokens={max_tokens}")
+    messages = _build_messages(prompt, system)
+    extra = {} if temperature is None else {"temperature": temperature}
+    cache_key = None
+    if should_cache(temperature, cache):
+        cache_key = make_key(deployment or model_tiers.deployment_for(prompt_name), messages,
+                             {"max_tokens": max_tokens, **extra})
+        cached = get_llm_cache().get(cache_key)
+        if cached is not None:
+            return cached
+    data = await _chat_completion_async(messages, max_tokens, deployment=deployment, prompt_name=prompt_name, **extra)
+    text = data["choices"][0]["message"]["content"].strip()
+    if cache_key:
+        get_llm_cache().set(cache_key, text)
+    return text
+
+
+async def llm_generate_json_async(prompt: str, schema: dict, schema_name: str, system: str = None,
+                                  max_tokens: int = 512, temperature: float = None, cache: bool = None,
+                                  prompt_name: str = None) -> dict:
+    """Call Azure OpenAI Chat with a strict JSON schema response format and return the parsed object.
+
+    Requires an api-version with structured outputs support (2024-08-01-preview or later).
+    Raises RuntimeError on transport errors and ValueError if the reply is not a JSON object.
+    """
+    print(f"[llm_generate_json_async] schema={schema_name} prompt_len={len(prompt)} max_tokens={max_tokens}")
+    messages = _build_messages(prompt, system)
+    deployment = model_tiers.deployment_for(prompt_name)
+    extra = {
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+        }
+    }
+    if temperature is not None:
+        extra["temperature"] = temperature
+    cache_key = None
+    content = None
+    if should_cache(temperature, cache):
+        cache_key = make_key(deployment, messages, {"max_tokens": max_tokens, **extra})
+        content = get_llm_cache().get(cache_key)
+    if content is None:
+        data = await _chat_completion_async(messages, max_tokens, prompt_name=prompt_name, **extra)
+        content = (data["choices"][0]["message"].get("content") or "").strip()
+    parsed = json.loads(content)
+    if not isinstance(parsed, dict):
+        raise ValueError("structured response is not a JSON object")
+    if cache_key:
+        # Only cache replies that parsed, so a malformed reply is retried next time
+        get_llm_cache().set(cache_key, content)
+    return parsed
 
 
 def clean_text(txt: str) -> str:
@@ -488,6 +742,85 @@ def clean_text(txt: str) -> str:
     return txt.strip()
 
 
+DECIDE_INSTRUCTIONS = """
+Decide ONE action:
+- UPDATE (merge into existing memory)
+- CONTRADICTS_EXISTING (new info contradicts existing, delete old memory)
+"""
+
+ARBITRATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decisions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "pair": {"type": "integer"},
+                    "action": {"type": "string", "enum": ["UPDATE", "CONTRADICTS_EXISTING"]},
+                },
+                "required": ["pair", "action"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["decisions"],
+    "additionalProperties": False,
+}
+
+
+async def _arbitrate_single(candidate_text: str, existing_text: str) -> str:
+    """Ask the LLM whether a candidate UPDATEs or contradicts (DELETE) an existing memory."""
+    budget = PromptBudget("decide")
+    decide_system = f"You are a precise memory manager.\n{DECIDE_INSTRUCTIONS}"
+    budget.fixed(decide_system, "Existing memory:\n\n\nCandidate memory:\n")
+    candidate_part = budget.fit(candidate_text, max_tokens=budget.budget // 2)
+    existing_part = budget.fit(existing_text)
+    budget.finish()
+    decision_prompt = f"Existing memory:\n{existing_part}\n\nCandidate memory:\n{candidate_part}"
+    llm_decision = await llm_generate_async(decision_prompt, system=decide_system,
+                                            max_tokens=get_max_output_tokens("decide"), temperature=0,
+                                            prompt_name="decide")
+    llm_decision = llm_decision.strip().upper()
+    return "DELETE" if llm_decision in ["DELETE", "CONTRADICTS_EXISTING"] else "UPDATE"
+
+
+async def arbitrate_decisions(pairs: list[tuple[str, str]]) -> list[str]:
+    """Resolve ambiguous (candidate, existing memory) pairs to UPDATE / DELETE with one LLM call.
+
+    Falls back to one call per pair if the structured reply is unusable.
+    """
+    if not pairs:
+        return []
+    if len(pairs) > 1 and _structured_pipeline_supported:
+        system = f"You are a precise memory manager.\n{DECIDE_INSTRUCTIONS}\nFor each numbered pair return its action as JSON."
+        budget = PromptBudget("decide", budget=get_budget("decide") * len(pairs))
+        budget.fixed(system)
+        blocks = []
+        for i, (candidate_text, existing_text) in enumerate(pairs):
+            per_pair = budget.remaining // (len(pairs) - i)
+            candidate_part = budget.fit(candidate_text, max_tokens=per_pair // 2)
+            existing_part = budget.fit(existing_text, max_tokens=per_pair - count_tokens(candidate_part))
+            blocks.append(f"Pair {i}:\nExisting memory:\n{existing_part}\nCandidate memory:\n{candidate_part}")
+        budget.finish()
+        prompt = "\n\n".join(blocks)
+        try:
+            parsed = await llm_generate_json_async(
+                prompt, ARBITRATION_SCHEMA, "memory_decisions", system=system,
+                max_tokens=get_max_output_tokens("decide") * len(pairs) + 32, temperature=0,
+                prompt_name="decide",
+            )
+            actions = {d.get("pair"): d.get("action") for d in parsed.get("decisions", []) if isinstance(d, dict)}
+            if all(i in actions for i in range(len(pairs))):
+                metrics.incr("process_memory.arbitration", mode="batched")
+                return ["DELETE" if actions[i] == "CONTRADICTS_EXISTING" else "UPDATE" for i in range(len(pairs))]
+            print(f"[arbitrate_decisions] Incomplete reply ({len(actions)}/{len(pairs)} pairs); falling back")
+        except Exception as e:
+            print(f"[arbitrate_decisions] Batched arbitration failed, falling back: {e}")
+    metrics.incr("process_memory.arbitration", mode="per_pair")
+    return list(await asyncio.gather(*(_arbitrate_single(c, e) for c, e in pairs)))
+
+
 async def decide_action(candidate_text: str, neighbors: list,
                         threshold_add=0.45, threshold_update=0.65,
                         threshold_noop=0.85):
@@ -534,24 +867,7 @@ async def decide_action(candidate_text: str, neighbors: list,
         decision, ref_id = "NO-OP", best_memory.id
     else:
         # Let LLM decide UPDATE or DELETE/CONTRADICTS_EXISTING
-        decision_prompt = f"""
-Existing memory:
-{best_memory.content}
-
-Candidate memory:
-{candidate_text}
-
-Decide ONE action:
-- UPDATE (merge into existing memory)
-- CONTRADICTS_EXISTING (new info contradicts existing, delete old memory)
-"""
-        llm_decision = await llm_generate_async(decision_prompt, system="You are a precise memory manager.")
-        llm_decision = llm_decision.strip().upper()
-
-        if llm_decision in ["DELETE", "CONTRADICTS_EXISTING"]:
-            decision, ref_id = "DELETE", best_memory.id
-        else:
-            decision, ref_id = "UPDATE", best_memory.id
+        decision, ref_id = await _arbitrate_single(candidate_text, best_memory.content or ""), best_memory.id
 
     print(f"Final Decision: {decision} (ref_id={ref_id})")
     print("======================\n")
@@ -566,27 +882,352 @@ def iso_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-async def ingest_graphiti_episode(body: str, source_desc: str = "processed_memory", name: str | None = None):
-    """Ingest a single episode into Graphiti.
+async def ingest_graphiti_episode(body: str, source_desc: str = "processed_memory", name: str | None = None,
+                                  reference_time: datetime | None = None, group_id: str | None = None):
+    """Ingest a single episode into Graphiti (run it on the Graphiti loop, see memories/graphiti_loop.py).
 
     Mirrors the logic in scripts/insert_episode.py so test scripts & runtime are consistent.
     Adds a short content hash to reduce accidental duplicate names when multiple episodes
     are created within the same second (timestamp collisions).
+    Reports graphiti.llm_calls_per_fact{source} (structured LLM calls / non-empty body lines).
+    `group_id` (see memories/graph_groups.py) scopes entity dedupe to that group; None = default group.
     """
     graphiti = await get_graphiti()
     # Short hash based on body (content changes -> different name); safe if body very short.
     hash_part = hashlib.sha1(body.encode("utf-8")).hexdigest()[:8]
     ep_name = name or f"memory-{iso_now()}-{hash_part}"
-    resp = await graphiti.add_episode(
-        name=ep_name,
-        episode_body=body,
-        source=EpisodeType.text,
-        source_description=source_desc,
-        reference_time=datetime.now(timezone.utc),  # explicit tz-aware
-    )
+    with output_budget.track_calls() as llm_calls:
+        resp = await graphiti.add_episode(
+            name=ep_name,
+            episode_body=body,
+            source=EpisodeType.text,
+            source_description=source_desc,
+            reference_time=reference_time or datetime.now(timezone.utc),  # explicit tz-aware
+            group_id=group_id,
+        )
+    facts = sum(1 for line in body.splitlines() if line.strip()) or 1
+    metrics.observe("graphiti.llm_calls_per_fact", len(llm_calls) / facts, source=source_desc)
+    # Cached graph searches over this group no longer match once it has a new episode
+    graph_search.bump_group(getattr(getattr(resp, "episode", None), "group_id", None))
     return ep_name, resp
 
 
+# -----------------------------
+# Summary + candidate extraction
+# -----------------------------
+SUMMARY_AND_CANDIDATES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "candidate_memories": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["summary", "candidate_memories"],
+    "additionalProperties": False,
+}
+
+# Flipped off for the life of the process if the deployment/api-version rejects json_schema,
+# so an unsupported configuration does not pay for a failed call on every message.
+_structured_pipeline_supported = True
+
+
+def _validate_summary_and_candidates(parsed: dict) -> tuple[str | None, list[str]]:
+    """Return (summary or None, non-empty candidate strings) from a structured reply."""
+    summary = parsed.get("summary")
+    summary = summary.strip() if isinstance(summary, str) and summary.strip() else None
+    raw_candidates = parsed.get("candidate_memories")
+    candidates = []
+    if isinstance(raw_candidates, list):
+        candidates = [c.strip() for c in raw_candidates if isinstance(c, str) and c.strip()]
+    return summary, candidates
+
+
+SUMMARY_CONTEXT_HEADERS = (
+    "Long-term summary (context only, do not repeat):\n\n\n"
+    "Previous summary:\n\n\nEarlier messages not yet in the summary:\n\n\nNew message:\n"
+)
+
+
+def _summary_context_sections(budget: PromptBudget, previous_summary: str, message: str,
+                              long_term: str, earlier_messages: str) -> str:
+    """Fit the summary inputs into `budget` and lay them out most stable first.
+
+    Priority: new message, earlier unsummarized messages, recent summary, long-term context.
+    The long-term summary only changes on compaction, so it leads the user message and extends
+    the cacheable prefix; the new message comes last.
+    """
+    message_part = budget.fit(message, max_tokens=budget.budget // 2)
+    earlier_part = budget.fit(earlier_messages, max_tokens=budget.budget // 4, keep="tail")
+    summary_part = budget.fit(previous_summary)
+    long_term_part = budget.fit(long_term)
+    context = f"Long-term summary (context only, do not repeat):\n{long_term_part}\n\n" if long_term_part else ""
+    context += f"Previous summary:\n{summary_part}\n\n"
+    if earlier_part:
+        context += f"Earlier messages not yet in the summary:\n{earlier_part}\n\n"
+    return context + f"New message:\n{message_part}"
+
+
+async def generate_summary(previous_summary: str, message: str, long_term: str = "",
+                           earlier_messages: str = "") -> str:
+    system = ("You are a concise summarizer. Update the previous summary with the earlier messages and "
+              "the new message and reply with the updated summary only.")
+    budget = PromptBudget("summary")
+    budget.fixed(system, SUMMARY_CONTEXT_HEADERS)
+    summary_prompt = _summary_context_sections(budget, previous_summary, message, long_term, earlier_messages)
+    budget.finish()
+    try:
+        return await llm_generate_async(summary_prompt, system=system, max_tokens=get_max_output_tokens("summary"),
+                                        prompt_name="summary")
+    except Exception as e:
+        raise RuntimeError(f"Failed to generate summary: {e}") from e
+
+
+async def generate_candidate_memory(summary: str, message: str) -> str:
+    system = ("You are a memory creator. Based on the conversation summary and the new message, "
+              "write a short candidate memory.")
+    budget = PromptBudget("candidate")
+    budget.fixed(system, "Summary: \nNew message: ")
+    message_part = budget.fit(message, max_tokens=budget.budget // 2)
+    summary_part = budget.fit(summary)
+    budget.finish()
+    memory_prompt = f"Summary: {summary_part}\nNew message: {message_part}"
+    try:
+        return await llm_generate_async(memory_prompt, system=system, max_tokens=get_max_output_tokens("candidate"),
+                                        prompt_name="candidate")
+    except Exception as e:
+        raise RuntimeError(f"Failed to generate candidate memory: {e}") from e
+
+
+CANDIDATES_SCHEMA = {
+    "type": "object",
+    "properties": {"candidate_memories": {"type": "array", "items": {"type": "string"}}},
+    "required": ["candidate_memories"],
+    "additionalProperties": False,
+}
+
+
+async def generate_candidate_memories(summary: str, message: str) -> list[str]:
+    """Extract atomic candidate memories from a message (no summary update).
+
+    Uses one JSON-schema completion when available, otherwise a single free-text candidate.
+    """
+    if _structured_pipeline_supported:
+        system = (
+            "You are a memory creator. Based on the conversation summary and the new message, return a "
+            "JSON object with candidate_memories: short standalone memories worth keeping about the user "
+            "from the new message, one atomic fact each."
+        )
+        budget = PromptBudget("candidate")
+        budget.fixed(system, "Summary: \nNew message: ")
+        message_part = budget.fit(message, max_tokens=budget.budget // 2)
+        summary_part = budget.fit(summary)
+        budget.finish()
+        try:
+            parsed = await llm_generate_json_async(
+                f"Summary: {summary_part}\nNew message: {message_part}",
+                CANDIDATES_SCHEMA, "candidate_memories", system=system,
+                max_tokens=get_max_output_tokens("candidate"),
+                prompt_name="candidate",
+            )
+            _, candidates = _validate_summary_and_candidates(parsed)
+            if candidates:
+                return candidates
+            print("[process_memory] Structured candidate reply empty; falling back")
+        except Exception as e:
+            print(f"[process_memory] Structured candidate call failed, falling back: {e}")
+    return [await generate_candidate_memory(summary, message)]
+
+
+async def generate_summary_and_candidates(previous_summary: str, message: str, long_term: str = "",
+                                          earlier_messages: str = "") -> tuple[str, list[str], str]:
+    """Produce the updated conversation summary and candidate memories for a new message.
+
+    `previous_summary` is the recent summary section being updated; `long_term` is passed as
+    read-only context and `earlier_messages` (already processed for memories) only feed the summary.
+
+    In "structured" mode (PROCESS_MEMORY_PIPELINE_MODE) both come from a single JSON-schema
+    completion. Invalid or failed structured replies fall back to the sequential two-call path,
+    reusing whichever part of the structured reply was valid.
+
+    Returns (new_summary, candidate_memories, mode_used). Raises RuntimeError with a
+    user-facing message when the fallback path fails too.
+    """
+    global _structured_pipeline_supported
+    mode = getattr(settings, "PROCESS_MEMORY_PIPELINE_MODE", "structured")
+    summary, candidates = None, []
+    if mode == "structured" and _structured_pipeline_supported:
+        system = (
+            "You are a concise summarizer and memory creator. Return a JSON object with:\n"
+            "- summary: the previous summary updated with the earlier and new messages (concise)\n"
+            "- candidate_memories: short standalone memories worth keeping about the user from the new message, one atomic fact each"
+        )
+        budget = PromptBudget("summary_and_candidates")
+        budget.fixed(system, SUMMARY_CONTEXT_HEADERS)
+        prompt = _summary_context_sections(budget, previous_summary, message, long_term, earlier_messages)
+        budget.finish()
+        try:
+            parsed = await llm_generate_json_async(
+                prompt,
+                SUMMARY_AND_CANDIDATES_SCHEMA,
+                "summary_and_candidates",
+                system=system,
+                max_tokens=get_max_output_tokens("summary_and_candidates"),
+                prompt_name="summary_and_candidates",
+            )
+            summary, candidates = _validate_summary_and_candidates(parsed)
+            if summary and candidates:
+                metrics.incr("process_memory.pipeline", mode="structured")
+                return summary, candidates, "structured"
+            print(f"[process_memory] Structured reply incomplete (summary={bool(summary)} candidates={len(candidates)}); falling back")
+        except Exception as e:
+            if "response_format" in str(e) or "json_schema" in str(e):
+                _structured_pipeline_supported = False
+                print("[process_memory] Deployment does not support json_schema; using two-call pipeline from now on")
+            print(f"[process_memory] Structured summary/candidate call failed, falling back: {e}")
+        metrics.incr("process_memory.pipeline_fallback")
+
+    if not summary:
+        summary = await generate_summary(previous_summary, message, long_term, earlier_messages)
+    if not candidates:
+        candidates = [await generate_candidate_memory(conversation_summary.compose(long_term, summary), message)]
+    metrics.incr("process_memory.pipeline", mode="two_call")
+    return summary, candidates, "two_call"
+
+
+async def _classify_memorability(prompt: str) -> str:
+    """Small-model YES/NO classification used by the memorability gate."""
+    return await llm_generate_async(
+        prompt,
+        system="You are a strict classifier.",
+        max_tokens=2,
+        temperature=0,
+        prompt_name="memorability",
+    )
+
+
+# Re-read / retry rounds for a deferred message that loses an ETag race
+_DEFER_MAX_ATTEMPTS = 5
+
+
+def _defer_message(summaries_db, conversation_id: str, user_id: str, message: str) -> bool:
+    """Record a gated message on the summary doc so the next full pipeline run folds it in.
+
+    The write goes through a UnitOfWork (If-Match on the ETag read), re-reading and retrying on a
+    conflict so concurrent messages for the same conversation do not overwrite each other.
+    """
+    max_pending = getattr(settings, "MEMORABILITY_MAX_PENDING", 5)
+    for attempt in range(_DEFER_MAX_ATTEMPTS):
+        uow = UnitOfWork()
+        try:
+            doc = uow.get(summaries_db, conversation_id)
+            if doc is None:
+                doc = {"id": conversation_id, "userId": user_id, "conversationId": conversation_id, "summary": ""}
+                write = uow.create
+            else:
+                write = uow.upsert
+            doc["pendingMessages"] = (doc.get("pendingMessages", []) + [message])[-max_pending:]
+            # Deferred messages still count towards the next summary update
+            conversation_summary.record_message(doc, message)
+            doc["updatedAt"] = datetime.utcnow().isoformat()
+            write(summaries_db, doc)
+            uow.commit()
+            return True
+        except UnitOfWorkError as e:
+            if not e.conflict:
+                print(f"[process_memory] Failed to defer message: {e}")
+                return False
+            print(f"[process_memory] Deferred message lost a race (attempt {attempt + 1}); re-reading")
+        except Exception as e:
+            print(f"[process_memory] Failed to defer message: {e}")
+            return False
+    print(f"[process_memory] Failed to defer message: gave up after {_DEFER_MAX_ATTEMPTS} conflicting writes")
+    return False
+
+
+async def _embed_and_search(memories_db, candidate_memories: list[str]) -> tuple[list, list, list]:
+    """Embed candidates in one request, drop near-duplicates and search neighbours concurrently.
+
+    Returns (candidates, embeddings, neighbor_lists). Raises RuntimeError if embedding fails.
+    """
+    candidate_memories = candidate_memories[:getattr(settings, "PROCESS_MEMORY_MAX_CANDIDATES", 5)]
+    try:
+        candidate_embeddings = await get_embeddings_async(candidate_memories)
+        print(f"[process_memory] Embedded {len(candidate_memories)} candidate(s) in one request")
+    except Exception as e:
+        print(f"[process_memory] Embedding generation failed: {e}")
+        raise RuntimeError(f"Failed to embed candidate memory: {e}") from e
+    keep = decisions.dedupe_candidates(candidate_embeddings)
+    candidate_memories = [candidate_memories[i] for i in keep]
+    candidate_embeddings = [candidate_embeddings[i] for i in keep]
+
+    top_k = getattr(settings, "MEMORY_SEARCH_TOP_K_DEFAULT", 5)
+    neighbor_lists = await asyncio.gather(*(
+        asyncio.to_thread(memories_db.search_similar_memories, embedding, top_k=top_k)
+        for embedding in candidate_embeddings
+    ))
+    print(f"[process_memory] Retrieved neighbors per candidate: {[len(n) for n in neighbor_lists]}")
+    return candidate_memories, candidate_embeddings, list(neighbor_lists)
+
+
+async def _speculative_summary_and_candidates(memories_db, long_term: str, recent: str, message: str,
+                                              earlier_messages: str) -> tuple[str, tuple]:
+    """Run the summary update and candidate extraction/embedding/search concurrently.
+
+    Candidates are extracted from the *previous* summary + message. If the updated summary adds
+    material the message does not explain (conversation_summary.summary_drift above
+    SPECULATIVE_MAX_SUMMARY_DRIFT), the candidate branch is recomputed from the new summary.
+    Returns (new_recent_summary, (candidates, embeddings, neighbor_lists)).
+    """
+    async def _candidate_branch(context: str):
+        return await _embed_and_search(memories_db, await generate_candidate_memories(context, message))
+
+    new_recent, prepared = await asyncio.gather(
+        generate_summary(recent, message, long_term, earlier_messages),
+        _candidate_branch(conversation_summary.compose(long_term, recent)),
+    )
+    drift = conversation_summary.summary_drift("\n".join((long_term, recent, earlier_messages)), message, new_recent)
+    if drift > getattr(settings, "SPECULATIVE_MAX_SUMMARY_DRIFT", 0.35):
+        print(f"[process_memory] Speculative candidates discarded (summary drift {drift:.2f}); recomputing")
+        metrics.incr("process_memory.speculation", outcome="recomputed")
+        prepared = await _candidate_branch(conversation_summary.compose(long_term, new_recent))
+    else:
+        metrics.incr("process_memory.speculation", outcome="kept")
+    return new_recent, prepared
+
+
+async def merge_memories(existing_text: str, candidate_text: str) -> str:
+    """Merge a candidate memory into an existing one with a deterministic LLM call."""
+    merge_system = ("You merge memories into better ones. Merge the candidate memory into the existing "
+                    "memory and reply with one improved memory.")
+    budget = PromptBudget("merge")
+    budget.fixed(merge_system, "Existing memory:\n\n\nCandidate memory:\n")
+    candidate_part = budget.fit(candidate_text, max_tokens=budget.budget // 2)
+    existing_part = budget.fit(existing_text)
+    budget.finish()
+    merged_prompt = f"Existing memory:\n{existing_part}\n\nCandidate memory:\n{candidate_part}"
+    return await llm_generate_async(merged_prompt, system=merge_system,
+                                    max_tokens=get_max_output_tokens("merge"), temperature=0, prompt_name="merge")
+
+
+async def _buffer_candidates(user_id: str, conversation_id: str, candidate_memories: list[str]) -> dict:
+    """Append candidates to the conversation's episode buffer and start a flush when it is due."""
+    key = episode_buffer.buffer_key(user_id, conversation_id)
+    try:
+        state = await asyncio.to_thread(episode_buffer.add, key, user_id, conversation_id, candidate_memories)
+    except Exception as e:
+        print(f"[process_memory] Episode buffer append failed: {e}")
+        return {"ingested": False, "buffered": False, "error": str(e)}
+    if state["due"]:
+        # Not awaited: the claimed batch is durable, so a flush interrupted here is recovered later
+        def _report(future):
+            if not future.cancelled() and future.exception() is not None:
+                print(f"[process_memory] Episode buffer flush failed: {future.exception()}")
+
+        graphiti_loop.submit(episode_buffer.flush(key)).add_done_callback(_report)
+    print(f"[process_memory] Buffered {len(candidate_memories)} candidate(s) key={key} pending={state['pending']} "
+          f"flush={state['due']}")
+    return {"ingested": False, "buffered": True, "pending": state["pending"], "flush_started": state["due"]}
+
+
 @csrf_exempt
 async def process_memory(request):
     """Process an incoming chat message into the memory system.
@@ -650,158 +1291,219 @@ async def process_memory(request):
 
         summaries_db = SummariesDBManager()
 
-        # Fetch previous summary (id should match conversation_id for consistency)
-        previous_summary = ""
+        # Memorability gate: skip (or defer) chit-chat before any LLM call
+        gate = await assess_memorability(message, classify=_classify_memorability)
+        if not gate.memorable:
+            deferred = False
+            if getattr(settings, "MEMORABILITY_GATE_MODE", "defer") == "defer":
+                deferred = _defer_message(summaries_db, conversation_id, user_id, message)
+            print(f"[process_memory] Skipped by memorability gate reason={gate.reason} deferred={deferred}")
+            return JsonResponse({
+                "action": "SKIPPED",
+                "status": "Message not memorable; pipeline skipped",
+                "reason": gate.reason,
+                "deferred": deferred,
+            })
+
+        # Fetch previous summary doc (id should match conversation_id for consistency)
+        # Every document is read at most once and all writes are committed together at the end
+        uow = UnitOfWork()
+        summary_doc = None
         try:
-            existing_summary_doc = summaries_db.get_item(conversation_id)
-            if existing_summary_doc:
-                previous_summary = existing_summary_doc.get("summary", "")
-                print(f"[process_memory] Loaded previous summary length={len(previous_summary)}")
+            summary_doc = uow.get(summaries_db, conversation_id)
+            if summary_doc:
+                print(f"[process_memory] Loaded previous summary length={len(summary_doc.get('summary', ''))}")
         except Exception as e:
             print(f"[process_memory] No previous summary found (ok). Details: {e}")
+        if not summary_doc:
+            summary_doc = {"id": conversation_id, "conversationId": conversation_id, "summary": ""}
+        summary_doc["userId"] = user_id
+        pending_messages = summary_doc.get("pendingMessages", [])
 
-        summary_prompt = (
-            f"Previous summary:\n{previous_summary}\n\n"
-            f"New message:\n{message}\n\n"
-            f"Update the summary:"
-        )
-        try:
-            new_summary = await llm_generate_async(summary_prompt, system="You are a concise summarizer.")
-            print("[process_memory] Generated new summary")
-        except Exception as e:
-            print(f"[process_memory] Summary generation failed: {e}")
-            return JsonResponse({"error": f"Failed to generate summary: {e}"}, status=502)
-
-        # Maintain rolling window of last N messages
-        last_n = 5
-        try:
-            existing_summary_doc = summaries_db.get_item(conversation_id)
-        except Exception:
-            existing_summary_doc = None
+        # Messages deferred by the memorability gate are folded into this update
+        pipeline_input = "\n".join(pending_messages + [message]) if pending_messages else message
+        conversation_summary.record_message(summary_doc, message)
+        long_term, recent = conversation_summary.sections(summary_doc)
+        summary_due = conversation_summary.update_due(summary_doc)
 
-        if existing_summary_doc:
-            last_messages = existing_summary_doc.get("lastNMessages", [])
-            last_messages.append(message)
-            last_messages = last_messages[-last_n:]
-        else:
-            last_messages = [message]
-
-        # IMPORTANT: use conversation_id as the partition/id for summary retrieval consistency
-        summary_item = {
-            "id": conversation_id,
-            "userId": user_id,
-            "conversationId": conversation_id,
-            "summary": new_summary,
-            "lastNMessages": last_messages,
-            "updatedAt": datetime.utcnow().isoformat()
-        }
+        memories_db = MemoriesDBManager()
+        prepared = None  # (candidates, embeddings, neighbor_lists) once embedded and searched
         try:
-            summaries_db.upsert_item(summary_item)
-            print(f"[process_memory] Upserted summary doc id={conversation_id}")
+            if summary_due:
+                # Only the bounded recent section is rewritten; the long-term section is context
+                earlier = conversation_summary.unsummarized_messages(summary_doc)
+                earlier = "\n".join(earlier[:-(len(pending_messages) + 1)])
+                if getattr(settings, "PROCESS_MEMORY_PIPELINE_MODE", "structured") == "speculative":
+                    new_recent, prepared = await _speculative_summary_and_candidates(
+                        memories_db, long_term, recent, pipeline_input, earlier
+                    )
+                    candidate_memories, pipeline_mode = prepared[0], "speculative"
+                else:
+                    new_recent, candidate_memories, pipeline_mode = await generate_summary_and_candidates(
+                        recent, pipeline_input, long_term=long_term, earlier_messages=earlier
+                    )
+                conversation_summary.apply_update(summary_doc, new_recent)
+            else:
+                candidate_memories = await generate_candidate_memories(conversation_summary.compose(long_term, recent), pipeline_input)
+                pipeline_mode = "candidate_only"
+            print(f"[process_memory] Generated {len(candidate_memories)} candidate(s) summary_updated={summary_due} mode={pipeline_mode}")
         except Exception as e:
-            print(f"[process_memory] Failed to upsert summary: {e}")
+            print(f"[process_memory] Summary/candidate generation failed: {e}")
+            return JsonResponse({"error": str(e)}, status=502)
 
-        # Candidate memory generation
-        memory_prompt = (
-            f"Based on:\nSummary: {new_summary}\nNew message: {message}\n\n"
-            f"Write a short candidate memory:"
-        )
-        try:
-            candidate_memory = await llm_generate_async(memory_prompt, system="You are a memory creator.")
-            print("[process_memory] Generated candidate memory")
-        except Exception as e:
-            print(f"[process_memory] Candidate memory generation failed: {e}")
-            return JsonResponse({"error": f"Failed to generate candidate memory: {e}"}, status=502)
+        if summary_due and conversation_summary.needs_compaction(summary_doc):
+            try:
+                await conversation_summary.compact(
+                    summary_doc,
+                    lambda prompt, max_tokens: llm_generate_async(
+                        prompt, system="You are a concise summarizer.", max_tokens=max_tokens, temperature=0,
+                        prompt_name="summary_compaction",
+                    ),
+                )
+            except Exception as e:
+                # The recent section stays as is and compaction is retried on the next update
+                print(f"[process_memory] Summary compaction failed: {e}")
+
+        summary_doc["pendingMessages"] = []
+        summary_doc["updatedAt"] = datetime.utcnow().isoformat()
 
         try:
-            candidate_embedding = await get_embedding_async(candidate_memory)
-            print("[process_memory] Generated embedding for candidate memory")
+            candidate_memories, candidate_embeddings, neighbor_lists = prepared or await _embed_and_search(
+                memories_db, candidate_memories
+            )
         except Exception as e:
-            print(f"[process_memory] Embedding generation failed: {e}")
-            return JsonResponse({"error": f"Failed to embed candidate memory: {e}"}, status=502)
-
-        memories_db = MemoriesDBManager()
-        neighbors = memories_db.search_similar_memories(candidate_embedding, top_k=5)
-        print(f"[process_memory] Retrieved {len(neighbors)} neighbors for candidate memory")
-
-        action, target_id = await decide_action(candidate_memory, neighbors)
-        result = {"action": action, "candidate_memory": candidate_memory}
+            return JsonResponse({"error": str(e)}, status=502)
+        candidate_memory = candidate_memories[0]
+        scores, neighbours = decisions.score_matrix(neighbor_lists)
+        # Neighbours carry content and ETag, so UPDATE/DELETE below need no extra reads
+        uow.seed(memories_db, [
+            {"id": m.id, "content": m.content, "_etag": getattr(m, "etag", None)} for m in neighbours
+        ])
+
+        # Threshold decisions for all candidates at once; only ambiguous ones reach the LLM
+        codes, best_column, best_score = decisions.threshold_decisions(scores)
+        ambiguous = [i for i, code in enumerate(codes) if code == decisions.AMBIGUOUS]
+        arbitrated = dict(zip(ambiguous, await arbitrate_decisions([
+            (clean_text(candidate_memories[i]), neighbours[best_column[i]].content or "") for i in ambiguous
+        ])))
+
+        outcomes = []
+        actions = decisions.assign_actions(codes, best_column, [n.id for n in neighbours], arbitrated)
+        for i, (candidate, (action, target_id)) in enumerate(zip(candidate_memories, actions)):
+            score = float(best_score[i]) if best_column[i] >= 0 else None
+            outcomes.append({"candidate": candidate, "action": action, "target_id": target_id, "score": score})
+            print(f"[process_memory] Decision candidate={i} action={action} target={target_id} score={score}")
+
+        # process_memory ingests its own candidates (inline or via the episode buffer), so the
+        # documents it writes are flagged for the change-feed GraphitiSink to skip
+        graphiti_enabled = getattr(settings, "GRAPHITI_INGEST_ENABLED", True)
 
-        if action == "ADD":
-            item = {
+        def _new_memory(content, embedding):
+            return {
                 "id": str(uuid.uuid4()),
                 "userId": user_id,
                 "conversationId": conversation_id,
-                "content": candidate_memory,
-                "embedding": candidate_embedding,
-                "created_at": datetime.utcnow().isoformat()
+                "content": content,
+                "embedding": embedding,
+                "created_at": datetime.utcnow().isoformat(),
+                "graphiti_synced": graphiti_enabled,
             }
-            try:
-                memories_db.create_item(item)
-                result["status"] = "Added new memory"
-                print(f"[process_memory] Added new memory id={item['id']}")
-            except Exception as e:
-                result["status"] = f"Failed to add memory: {e}"
-                print(f"[process_memory] Create memory failed: {e}")
 
-        elif action == "UPDATE" and target_id:
+        # Several candidates updating the same memory are merged into it with one call
+        update_groups = {}
+        for i, outcome in enumerate(outcomes):
+            if outcome["action"] == "UPDATE":
+                update_groups.setdefault(outcome["target_id"], []).append(i)
+        update_status = {}
+        if update_groups:
+            targets = list(update_groups)
+            merged = await asyncio.gather(*(
+                merge_memories(uow.get(memories_db, target)["content"],
+                               "\n".join(candidate_memories[i] for i in update_groups[target]))
+                for target in targets
+            ), return_exceptions=True)
+            ok = [(t, m) for t, m in zip(targets, merged) if not isinstance(m, Exception)]
+            for target, error in ((t, m) for t, m in zip(targets, merged) if isinstance(m, Exception)):
+                update_status[target] = f"Failed to update memory: {error}"
             try:
-                doc = memories_db.get_item(target_id)
-                print("\n>>> MEMORY TO BE UPDATED <<<")
-                print(f"ID: {doc.get('id')}")
-                print(f"Content: {doc.get('content')}")
-                print(">>> =======================\n")
-                merged_prompt = (
-                    f"Existing memory:\n{doc['content']}\n\n"
-                    f"Candidate memory:\n{candidate_memory}\n\n"
-                    f"Merge them into one improved memory:"
-                )
-                merged_text = await llm_generate_async(merged_prompt, system="You merge memories into better ones.")
-                try:
-                    new_emb = await get_embedding_async(merged_text)
-                except Exception as e:
-                    print(f"[process_memory] Re-embedding merged memory failed: {e}")
-                    return JsonResponse({"error": f"Failed to re-embed merged memory: {e}"}, status=502)
-                doc["content"] = merged_text
-                doc["embedding"] = new_emb
-                memories_db.upsert_item(doc)
-                result["status"] = f"Updated memory {target_id}"
-                print(f"[process_memory] Updated memory id={target_id}")
+                merged_embeddings = await get_embeddings_async([m for _, m in ok])
             except Exception as e:
-                result["status"] = f"Failed to update memory: {e}"
-                print(f"[process_memory] Update failed for id={target_id}: {e}")
+                print(f"[process_memory] Re-embedding merged memories failed: {e}")
+                return JsonResponse({"error": f"Failed to re-embed merged memory: {e}"}, status=502)
+            for (target, merged_text), embedding in zip(ok, merged_embeddings):
+                print(f"\n>>> MEMORY TO BE UPDATED <<<\nID: {target}\nContent: {uow.get(memories_db, target)['content']}\n")
+                # Patch only the changed fields; conditioned on the ETag from the vector search
+                uow.patch(memories_db, target, {
+                    "content": merged_text,
+                    "embedding": embedding,
+                    "updated_at": datetime.utcnow().isoformat(),
+                    "graphiti_synced": graphiti_enabled,
+                })
+                update_status[target] = f"Updated memory {target}"
+
+        for i, outcome in enumerate(outcomes):
+            action, target_id = outcome["action"], outcome["target_id"]
+            if action == "ADD":
+                item = _new_memory(candidate_memories[i], candidate_embeddings[i])
+                uow.create(memories_db, item)
+                outcome["status"] = "Added new memory"
+                outcome["memory_id"] = item["id"]
+            elif action == "UPDATE":
+                outcome["status"] = update_status[target_id]
+            elif action == "DELETE":
+                print(f"\n>>> MEMORY TO BE DELETED <<<\nID: {target_id}\nContent: {uow.get(memories_db, target_id)['content']}\n")
+                replacement = _new_memory(candidate_memories[i], candidate_embeddings[i])
+                # Replacement first: if the conditional delete then fails nothing is lost
+                uow.create(memories_db, replacement)
+                uow.delete(memories_db, target_id)
+                outcome["status"] = f"Deleted {target_id} and replaced with candidate memory"
+                outcome["memory_id"] = replacement["id"]
+            else:
+                outcome["status"] = "No operation performed"
+
+        result = {
+            "action": outcomes[0]["action"],
+            "status": outcomes[0]["status"],
+            "candidate_memory": candidate_memory,
+            "candidate_memories": candidate_memories,
+            "results": outcomes,
+            "pipeline_mode": pipeline_mode,
+        }
 
-        elif action == "DELETE" and target_id:
-            try:
-                doc_to_delete = memories_db.get_item(target_id)
-                print("\n>>> MEMORY TO BE DELETED <<<")
-                print(f"ID: {doc_to_delete.get('id')}")
-                print(f"Content: {doc_to_delete.get('content')}")
-                print(">>> =======================\n")
-                memories_db.delete_item(target_id)
-                replacement = {
-                    "id": str(uuid.uuid4()),
-                    "userId": user_id,
-                    "conversationId": conversation_id,
-                    "content": candidate_memory,
-                    "embedding": candidate_embedding,
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                memories_db.create_item(replacement)
-                result["status"] = f"Deleted {target_id} and replaced with candidate memory"
-            except Exception as e:
-                result["status"] = f"Failed to delete memory: {e}"
-                print(f"[process_memory] Delete failed for id={target_id}: {e}")
-        else:
-            result["status"] = "No operation performed"
+        uow.upsert(summaries_db, summary_doc)
+        try:
+            committed = uow.commit()
+            print(f"[process_memory] Committed {len(committed)} write(s) reads={uow.reads} cache_hits={uow.cache_hits}")
+        except UnitOfWorkError as e:
+            print(f"[process_memory] Commit failed: {e} committed={e.committed}")
+            # Nothing per candidate can be reported as done, and unpersisted candidates must not
+            # reach Graphiti; a conflict (409/412) means a concurrent writer won and can be retried
+            return JsonResponse({
+                "error": f"Failed to commit changes: {e}",
+                "conflict": e.conflict,
+                "committed": [
+                    {"container": container, "id": doc_id, "op": op} for container, doc_id, op in e.committed
+                ],
+                "candidate_memories": candidate_memories,
+                "decisions": [
+                    {key: outcome[key] for key in ("candidate", "action", "target_id", "score")}
+                    for outcome in outcomes
+                ],
+                "pipeline_mode": pipeline_mode,
+            }, status=409 if e.conflict else 500)
 
-        result["new_summary"] = new_summary
+        result["new_summary"] = summary_doc.get("summary", "")
+        result["summary_updated"] = summary_due
 
         # Optional Graphiti ingestion (toggle via settings.GRAPHITI_INGEST_ENABLED = False to disable)
-        graphiti_enabled = getattr(settings, "GRAPHITI_INGEST_ENABLED", True)
-        if graphiti_enabled:
+        if graphiti_enabled and getattr(settings, "EPISODE_BUFFER_ENABLED", False):
+            result["graphiti"] = await _buffer_candidates(user_id, conversation_id, candidate_memories)
+        elif graphiti_enabled:
             try:
-                ep_name, _ = await ingest_graphiti_episode(candidate_memory, source_desc="processed_memory")
+                ep_name, _ = await graphiti_loop.run_async(
+                    ingest_graphiti_episode("\n".join(candidate_memories), source_desc="processed_memory",
+                                            group_id=graph_groups.group_for_user(user_id))
+                )
                 result["graphiti"] = {"ingested": True, "episode_name": ep_name}
                 print(f"[process_memory] Graphiti ingestion succeeded episode={ep_name}")
             except Exception as ge:
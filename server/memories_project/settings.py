@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -138,10 +140,38 @@ COSMOS_DB_KEY = os.getenv('COSMOS_DB_KEY')
 COSMOS_DB_NAME = os.getenv('COSMOS_DB_NAME', 'memories_db')
 COSMOS_MEMORIES_CONTAINER = os.getenv("COSMOS_MEMORIES_CONTAINER", "memories2")
 COSMOS_SUMMARIES_CONTAINER = os.getenv("COSMOS_SUMMARIES_CONTAINER", "summaries")
+COSMOS_LEASES_CONTAINER = os.getenv("COSMOS_LEASES_CONTAINER", "leases")
 
 # Memory search configuration
 MEMORY_SEARCH_TOP_K_DEFAULT = int(os.getenv('MEMORY_SEARCH_TOP_K_DEFAULT', '5'))
 
+# Change feed projector (see memories/change_feed.py)
+# CHANGE_FEED_IN_PROCESS starts a background thread in each web process that keeps the
+# local vector/lexical indexes current (retrieve_memories falls back to them when Cosmos vector
+# search or embedding fails); `manage.py run_change_feed` is the standalone (Graphiti) worker.
+CHANGE_FEED_IN_PROCESS = os.getenv('CHANGE_FEED_IN_PROCESS', '0') in ['1', 'true', 'True', 'YES', 'yes']
+CHANGE_FEED_IN_PROCESS_SINKS = os.getenv('CHANGE_FEED_IN_PROCESS_SINKS', 'vector,lexical')
+CHANGE_FEED_SINKS = os.getenv('CHANGE_FEED_SINKS', 'graphiti')
+CHANGE_FEED_PROCESSOR_NAME = os.getenv('CHANGE_FEED_PROCESSOR_NAME', 'memories-projector')
+CHANGE_FEED_BATCH_SIZE = int(os.getenv('CHANGE_FEED_BATCH_SIZE', '100'))
+CHANGE_FEED_POLL_INTERVAL_SECONDS = float(os.getenv('CHANGE_FEED_POLL_INTERVAL_SECONDS', '5'))
+CHANGE_FEED_LEASE_TTL_SECONDS = int(os.getenv('CHANGE_FEED_LEASE_TTL_SECONDS', '60'))
+# 'LatestVersion' (default) or 'AllVersionsAndDeletes' (must be enabled on the Cosmos account)
+CHANGE_FEED_MODE = os.getenv('CHANGE_FEED_MODE', 'LatestVersion')
+
+# Offline consolidation of near-duplicate memories (manage.py consolidate_memories)
+CONSOLIDATION_SIMILARITY_THRESHOLD = float(os.getenv('CONSOLIDATION_SIMILARITY_THRESHOLD', '0.9'))
+CONSOLIDATION_BLOCK_SIZE = int(os.getenv('CONSOLIDATION_BLOCK_SIZE', '1024'))
+CONSOLIDATION_MAX_CLUSTER_SIZE = int(os.getenv('CONSOLIDATION_MAX_CLUSTER_SIZE', '8'))
+CONSOLIDATION_CONCURRENCY = int(os.getenv('CONSOLIDATION_CONCURRENCY', '8'))
+# Seconds before tombstones are purged by Cosmos TTL (0 = keep; requires TTL enabled on the container)
+CONSOLIDATION_TOMBSTONE_TTL_SECONDS = int(os.getenv('CONSOLIDATION_TOMBSTONE_TTL_SECONDS', '0'))
+
+# NDJSON export/import (memories/transfer.py)
+TRANSFER_PAGE_SIZE = int(os.getenv('TRANSFER_PAGE_SIZE', '200'))
+TRANSFER_IMPORT_BATCH_SIZE = int(os.getenv('TRANSFER_IMPORT_BATCH_SIZE', '100'))
+TRANSFER_IMPORT_CONCURRENCY = int(os.getenv('TRANSFER_IMPORT_CONCURRENCY', '8'))
+
 # Demo mode configuration
 # When enabled, certain endpoints return static demo data instead of performing
 # live vector searches (see retrieve_memories view). Useful for demos without
@@ -156,7 +186,140 @@ if AZURE_OPENAI_ENDPOINT:
 AZURE_OPENAI_KEY = os.getenv('AZURE_OPENAI_KEY')
 AZURE_OPENAI_VERSION = os.getenv('AZURE_OPENAI_VERSION', '2023-05-15')
 AZURE_OPENAI_DEPLOYMENT = os.getenv('AZURE_OPENAI_DEPLOYMENT')
+# Small / cheaper chat deployment (also used by graphiti_client); falls back to the main deployment
+AZURE_OPENAI_SMALL_DEPLOYMENT = os.getenv('AZURE_OPENAI_SMALL_DEPLOYMENT') or AZURE_OPENAI_DEPLOYMENT
 AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv('AZURE_OPENAI_EMBEDDING_DEPLOYMENT')
+# Optional separate endpoints for chat vs embedding deployments (fall back to AZURE_OPENAI_ENDPOINT)
+AZURE_OPENAI_LLM_ENDPOINT = os.getenv('AZURE_OPENAI_LLM_ENDPOINT')
+AZURE_OPENAI_EMBEDDING_ENDPOINT = os.getenv('AZURE_OPENAI_EMBEDDING_ENDPOINT')
+
+# Graphiti startup (memories/graphiti_client.py): reuse a successful Azure OpenAI preflight for this long
+# (0 = check on every start) and backfill Episodic.entity_edges in batches of this size
+GRAPHITI_PREFLIGHT_TTL_SECONDS = int(os.getenv('GRAPHITI_PREFLIGHT_TTL_SECONDS', '3600'))
+# Small JSON file remembering successful preflights across restarts/workers ('' = this process only)
+GRAPHITI_PREFLIGHT_CACHE_PATH = os.getenv(
+    'GRAPHITI_PREFLIGHT_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'memories_graphiti_preflight.json')
+)
+GRAPHITI_BACKFILL_BATCH_SIZE = int(os.getenv('GRAPHITI_BACKFILL_BATCH_SIZE', '1000'))
+# Max seconds a sync caller waits for a Graphiti call on the shared Graphiti loop (0 = no limit)
+GRAPHITI_CALL_TIMEOUT_SECONDS = float(os.getenv('GRAPHITI_CALL_TIMEOUT_SECONDS', '300'))
+# Graphiti structured completions (memories/azure_llm_client_patch.py): max_tokens cap (0 = none), and per
+# response model a budget of the PERCENTILE output size x HEADROOM once MIN_SAMPLES outputs have been seen
+GRAPHITI_LLM_MAX_TOKENS = int(os.getenv('GRAPHITI_LLM_MAX_TOKENS', '4096'))
+GRAPHITI_OUTPUT_BUDGET_ENABLED = os.getenv('GRAPHITI_OUTPUT_BUDGET_ENABLED', '1') in ['1', 'true', 'True', 'YES', 'yes']
+GRAPHITI_OUTPUT_BUDGET_PERCENTILE = float(os.getenv('GRAPHITI_OUTPUT_BUDGET_PERCENTILE', '99'))
+GRAPHITI_OUTPUT_BUDGET_HEADROOM = float(os.getenv('GRAPHITI_OUTPUT_BUDGET_HEADROOM', '1.5'))
+GRAPHITI_OUTPUT_BUDGET_MIN_SAMPLES = int(os.getenv('GRAPHITI_OUTPUT_BUDGET_MIN_SAMPLES', '20'))
+GRAPHITI_OUTPUT_BUDGET_MIN_TOKENS = int(os.getenv('GRAPHITI_OUTPUT_BUDGET_MIN_TOKENS', '256'))
+# Buffered Graphiti ingestion (memories/episode_buffer.py): process_memory appends candidates to a durable
+# buffer per conversation (or per user) and ingests them as one episode when a threshold is reached
+EPISODE_BUFFER_ENABLED = os.getenv('EPISODE_BUFFER_ENABLED', '0') in ['1', 'true', 'True', 'YES', 'yes']
+EPISODE_BUFFER_SCOPE = os.getenv('EPISODE_BUFFER_SCOPE', 'conversation')  # conversation | user
+EPISODE_BUFFER_CONTAINER = os.getenv('EPISODE_BUFFER_CONTAINER') or COSMOS_LEASES_CONTAINER
+EPISODE_BUFFER_MAX_ITEMS = int(os.getenv('EPISODE_BUFFER_MAX_ITEMS', '20'))
+EPISODE_BUFFER_MAX_CHARS = int(os.getenv('EPISODE_BUFFER_MAX_CHARS', '4000'))
+EPISODE_BUFFER_MAX_AGE_SECONDS = float(os.getenv('EPISODE_BUFFER_MAX_AGE_SECONDS', '600'))
+EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS = float(os.getenv('EPISODE_BUFFER_INFLIGHT_TIMEOUT_SECONDS', '900'))
+EPISODE_BUFFER_MAX_ATTEMPTS = int(os.getenv('EPISODE_BUFFER_MAX_ATTEMPTS', '5'))
+# Graph search cache (memories/graph_search.py); entries are also invalidated per group on episode ingest
+GRAPH_SEARCH_CONFIG = os.getenv('GRAPH_SEARCH_CONFIG', 'COMBINED_HYBRID_SEARCH_CROSS_ENCODER')
+GRAPH_SEARCH_CACHE_ENABLED = os.getenv('GRAPH_SEARCH_CACHE_ENABLED', '1') in ['1', 'true', 'True', 'YES', 'yes']
+GRAPH_SEARCH_CACHE_TTL_SECONDS = int(os.getenv('GRAPH_SEARCH_CACHE_TTL_SECONDS', '300'))
+GRAPH_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('GRAPH_SEARCH_CACHE_MAX_ENTRIES', '512'))
+# Graphiti group_id per user (memories/graph_groups.py); "{user_id}" is replaced with the user id, empty = one
+# shared graph. Re-tag episodes ingested before grouping with `python manage.py regroup_graphiti_episodes`
+GRAPHITI_GROUP_ID_TEMPLATE = os.getenv('GRAPHITI_GROUP_ID_TEMPLATE', '{user_id}')
+# Graph expansion of vector hits (memories/graph_expansion.py, GET /api/memories/retrieve/?expand=1): caps on
+# hits expanded, episodes per hit, entities per episode, facts per entity and facts returned
+GRAPH_EXPANSION_MAX_HITS = int(os.getenv('GRAPH_EXPANSION_MAX_HITS', '3'))
+GRAPH_EXPANSION_EPISODES_PER_HIT = int(os.getenv('GRAPH_EXPANSION_EPISODES_PER_HIT', '2'))
+GRAPH_EXPANSION_ENTITIES_PER_EPISODE = int(os.getenv('GRAPH_EXPANSION_ENTITIES_PER_EPISODE', '5'))
+GRAPH_EXPANSION_FANOUT = int(os.getenv('GRAPH_EXPANSION_FANOUT', '5'))
+GRAPH_EXPANSION_MAX_FACTS = int(os.getenv('GRAPH_EXPANSION_MAX_FACTS', '20'))
+# Cypher instrumentation (memories/cypher_profile.py): time queries per fingerprint, run PROFILE on this
+# fraction of them (0 = never) and log any query slower than CYPHER_SLOW_QUERY_MS
+CYPHER_PROFILING_ENABLED = os.getenv('CYPHER_PROFILING_ENABLED', '1') in ['1', 'true', 'True', 'YES', 'yes']
+CYPHER_PROFILE_SAMPLE_RATE = float(os.getenv('CYPHER_PROFILE_SAMPLE_RATE', '0'))
+CYPHER_SLOW_QUERY_MS = float(os.getenv('CYPHER_SLOW_QUERY_MS', '1000'))
+
+# Deployment routing (memories/openai_router.py)
+# JSON list of {"name", "kind": chat|small|embedding, "endpoint", "deployment", "api_key", "api_version", "weight", "tpm", "rpm"};
+# empty = one deployment per kind from the AZURE_OPENAI_* settings above
+AZURE_OPENAI_POOL = json.loads(os.getenv('AZURE_OPENAI_POOL', '[]') or '[]')
+ROUTER_EWMA_ALPHA = float(os.getenv('ROUTER_EWMA_ALPHA', '0.2'))
+ROUTER_EXPLORE_RATE = float(os.getenv('ROUTER_EXPLORE_RATE', '0.05'))
+ROUTER_MAX_ATTEMPTS = int(os.getenv('ROUTER_MAX_ATTEMPTS', '2'))
+ROUTER_COOLDOWN_ERRORS = int(os.getenv('ROUTER_COOLDOWN_ERRORS', '3'))
+ROUTER_COOLDOWN_SECONDS = float(os.getenv('ROUTER_COOLDOWN_SECONDS', '30'))
+# SDK-level retries stay off by default: 429s are queued by the rate limiter and other errors fail over
+ROUTER_SDK_MAX_RETRIES = int(os.getenv('ROUTER_SDK_MAX_RETRIES', '0'))
+# Hedging: duplicate a request to the second best deployment after the primary's p95 latency
+ROUTER_HEDGING_ENABLED = os.getenv('ROUTER_HEDGING_ENABLED', '0') in ['1', 'true', 'True', 'YES', 'yes']
+ROUTER_HEDGE_MIN_SAMPLES = int(os.getenv('ROUTER_HEDGE_MIN_SAMPLES', '20'))
+ROUTER_HEDGE_MIN_DELAY_MS = float(os.getenv('ROUTER_HEDGE_MIN_DELAY_MS', '200'))
+ROUTER_LATENCY_WINDOW = int(os.getenv('ROUTER_LATENCY_WINDOW', '200'))
+
+# Rate limiting (memories/rate_limiter.py): per-deployment tokens / requests per minute, 0 = unlimited.
+# Pool entries may set their own "tpm" / "rpm"; Retry-After from 429 responses is always honoured.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') in ['1', 'true', 'True', 'YES', 'yes']
+RATE_LIMIT_TPM = int(os.getenv('RATE_LIMIT_TPM', '0'))
+RATE_LIMIT_RPM = int(os.getenv('RATE_LIMIT_RPM', '0'))
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT_SECONDS', '60'))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '5'))
+RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv('RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS', '2'))
+
+# process_memory pipeline
+# 'structured': one JSON-schema completion returns {summary, candidate_memories} (needs an
+#               api-version with structured outputs, e.g. 2024-08-01-preview); falls back automatically
+# 'two_call':   sequential summary call followed by candidate-memory call
+# 'speculative': summary call runs in parallel with candidate extraction, embedding and neighbour
+#               search from the previous summary; candidates are recomputed only if the new summary
+#               drifts more than SPECULATIVE_MAX_SUMMARY_DRIFT (share of words not in old summary + message)
+PROCESS_MEMORY_PIPELINE_MODE = os.getenv('PROCESS_MEMORY_PIPELINE_MODE', 'structured')
+SPECULATIVE_MAX_SUMMARY_DRIFT = float(os.getenv('SPECULATIVE_MAX_SUMMARY_DRIFT', '0.35'))
+# Multi-candidate decisions (memories/decisions.py)
+PROCESS_MEMORY_MAX_CANDIDATES = int(os.getenv('PROCESS_MEMORY_MAX_CANDIDATES', '5'))
+CANDIDATE_DEDUP_THRESHOLD = float(os.getenv('CANDIDATE_DEDUP_THRESHOLD', '0.95'))
+MEMORY_DECISION_THRESHOLD_ADD = float(os.getenv('MEMORY_DECISION_THRESHOLD_ADD', '0.45'))
+MEMORY_DECISION_THRESHOLD_NOOP = float(os.getenv('MEMORY_DECISION_THRESHOLD_NOOP', '0.85'))
+
+# Deterministic LLM response cache (memories/llm_cache.py); temperature-0 calls only
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') in ['1', 'true', 'True', 'YES', 'yes']
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', '86400'))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '2048'))
+# Opt-in SQLite file for the persistent tier shared across processes (e.g. a writable state volume);
+# empty (default) keeps only the per-process memory tier and never writes into the source tree
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', '')
+LLM_CACHE_PERSISTENT_MAX_ENTRIES = int(os.getenv('LLM_CACHE_PERSISTENT_MAX_ENTRIES', '50000'))
+
+# Memorability gate (memories/memorability.py): cheap pre-filter before any LLM call
+MEMORABILITY_GATE_ENABLED = os.getenv('MEMORABILITY_GATE_ENABLED', '1') in ['1', 'true', 'True', 'YES', 'yes']
+# 'defer' keeps skipped messages on the summary doc and folds them into the next full run; 'skip' drops them
+MEMORABILITY_GATE_MODE = os.getenv('MEMORABILITY_GATE_MODE', 'defer')
+MEMORABILITY_MIN_CHARS = int(os.getenv('MEMORABILITY_MIN_CHARS', '12'))
+MEMORABILITY_MAX_PENDING = int(os.getenv('MEMORABILITY_MAX_PENDING', '5'))
+# Comma separated override of the built-in stop-phrase list (empty = defaults)
+MEMORABILITY_STOP_PHRASES = [p.strip() for p in os.getenv('MEMORABILITY_STOP_PHRASES', '').split(',') if p.strip()]
+# Ask the small deployment YES/NO for messages the heuristics cannot decide
+MEMORABILITY_CLASSIFIER_ENABLED = os.getenv('MEMORABILITY_CLASSIFIER_ENABLED', '0') in ['1', 'true', 'True', 'YES', 'yes']
+
+# Token-aware prompt budgeting (memories/prompt_budget.py)
+# Overrides as comma separated name=tokens pairs, e.g. "relevance=3000,summary=1200"; unset names use built-in defaults
+PROMPT_TOKEN_BUDGETS = {k.strip(): int(v) for k, v in (p.split('=', 1) for p in os.getenv('PROMPT_TOKEN_BUDGETS', '').split(',') if '=' in p)}
+PROMPT_MAX_OUTPUT_TOKENS = {k.strip(): int(v) for k, v in (p.split('=', 1) for p in os.getenv('PROMPT_MAX_OUTPUT_TOKENS', '').split(',') if '=' in p)}
+PROMPT_RELEVANCE_ITEM_MAX_TOKENS = int(os.getenv('PROMPT_RELEVANCE_ITEM_MAX_TOKENS', '200'))
+PROMPT_TOKENIZER_ENCODING = os.getenv('PROMPT_TOKENIZER_ENCODING', 'o200k_base')
+
+# Per-prompt model tiers (memories/model_tiers.py): 'small' = AZURE_OPENAI_SMALL_DEPLOYMENT, 'large' = AZURE_OPENAI_DEPLOYMENT.
+# Comma separated name=tier overrides, e.g. "candidate=small,decide=large"; unset names use built-in defaults
+PROMPT_MODEL_TIERS = {k.strip(): v.strip() for k, v in (p.split('=', 1) for p in os.getenv('PROMPT_MODEL_TIERS', '').split(',') if '=' in p)}
+
+# Hierarchical conversation summaries (memories/conversation_summary.py)
+# Update the recent section every N messages; other messages only produce candidate memories
+SUMMARY_UPDATE_EVERY_N = int(os.getenv('SUMMARY_UPDATE_EVERY_N', '3'))
+SUMMARY_RECENT_MAX_TOKENS = int(os.getenv('SUMMARY_RECENT_MAX_TOKENS', '400'))
+SUMMARY_LONG_TERM_MAX_TOKENS = int(os.getenv('SUMMARY_LONG_TERM_MAX_TOKENS', '600'))
+SUMMARY_LAST_N_MESSAGES = int(os.getenv('SUMMARY_LAST_N_MESSAGES', '5'))
 
 # Database configuration
 # SQLite for authentication and Django admin
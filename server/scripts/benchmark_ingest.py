@@ -0,0 +1,221 @@
+"""Benchmark Graphiti episode ingestion offline.
+
+Drives `ingest_graphiti_episode` (and so `Graphiti.add_episode`) against the stand-ins in
+memories/graphiti_standins.py: a scripted LLM with configurable latency, a hash embedder, a
+word-overlap reranker and graphiti-core's embedded Kuzu graph (in memory unless --graph-path is
+given). No Azure OpenAI or Neo4j access is needed; install the graph with
+`pip install "graphiti-core[kuzu]"`.
+
+Episodes are generated deterministically from --seed: each holds --facts-per-episode sentences
+relating people, organizations and places, so one-fact episodes (process_memory today) can be
+compared with batched ones (EPISODE_BUFFER_ENABLED).
+
+Reports episodes/sec, facts/sec, LLM calls per episode and per fact (by response model), embedder
+and reranker calls, and p50/p95 latency per add_episode stage.
+
+Usage:
+  python scripts/benchmark_ingest.py --episodes 50
+  python scripts/benchmark_ingest.py --episodes 20 --facts-per-episode 10 --llm-latency-ms 400 --jitter 0.3
+  python scripts/benchmark_ingest.py --episodes 100 --concurrency 4 --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import time
+import warnings
+from collections import defaultdict
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "memories_project.settings")
+# Offline run: the memories app builds (but never calls) an Azure client at import time
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://offline.invalid")
+os.environ.setdefault("AZURE_OPENAI_KEY", "offline")
+os.environ.setdefault("GRAPHITI_TELEMETRY_ENABLED", "false")
+
+import django  # noqa: E402
+
+django.setup()
+
+import graphiti_core.graphiti as graphiti_module  # type: ignore  # noqa: E402
+from graphiti_core import Graphiti  # type: ignore  # noqa: E402
+
+from memories import graphiti_client, graphiti_loop, metrics  # type: ignore  # noqa: E402
+from memories.graphiti_standins import (  # type: ignore  # noqa: E402
+    HashEmbedder,
+    OverlapCrossEncoder,
+    ScriptedLLMClient,
+    offline_driver,
+)
+from memories.views import ingest_graphiti_episode  # type: ignore  # noqa: E402
+
+PEOPLE = ["Alice Martin", "Bob Chen", "Carla Diaz", "David Okafor", "Elena Petrova", "Farid Haddad",
+          "Grace Kim", "Hiro Tanaka", "Ines Moreau", "Jonas Berg"]
+ORGANIZATIONS = ["Contoso", "Fabrikam", "Northwind", "Tailspin", "Litware", "Adatum"]
+PLACES = ["Seattle", "Lisbon", "Nairobi", "Osaka", "Toronto", "Berlin"]
+TOPICS = ["Kubernetes", "Graph Databases", "Rust", "Marathon Training", "Jazz Piano", "Sourdough Baking"]
+TEMPLATES = [
+    "{person} works at {org} in {place}.",
+    "{person} moved to {place} to lead the {topic} team at {org}.",
+    "{person} enjoys {topic} and meets {other} every week.",
+    "{person} and {other} presented {topic} at the {org} conference in {place}.",
+]
+
+# add_episode stages timed by wrapping the functions / methods it calls
+MODULE_STAGES = ("extract_nodes", "resolve_extracted_nodes", "extract_attributes_from_nodes")
+METHOD_STAGES = ("retrieve_episodes", "_extract_and_resolve_edges", "_process_episode_data")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Offline Graphiti ingestion benchmark")
+    p.add_argument("--episodes", type=int, default=20, help="Episodes to ingest")
+    p.add_argument("--facts-per-episode", type=int, default=1, help="Sentences per episode")
+    p.add_argument("--concurrency", type=int, default=1, help="Episodes ingested concurrently")
+    p.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency per LLM call")
+    p.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated latency per embedding call")
+    p.add_argument("--jitter", type=float, default=0.0, help="LLM latency jitter as a fraction (0.3 = +/-30%%)")
+    p.add_argument("--seed", type=int, default=7, help="Seed for episode text and latency jitter")
+    p.add_argument("--graph-path", default=":memory:", help="Kuzu database path (default in memory)")
+    p.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return p.parse_args()
+
+
+def make_episodes(count: int, facts: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    episodes = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(facts):
+            person, other = rng.sample(PEOPLE, 2)
+            sentences.append(rng.choice(TEMPLATES).format(
+                person=person, other=other, org=rng.choice(ORGANIZATIONS),
+                place=rng.choice(PLACES), topic=rng.choice(TOPICS),
+            ))
+        episodes.append("\n".join(sentences))
+    return episodes
+
+
+def _timed(fn, stage: str, timings: dict):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            timings[stage].append((time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+def instrument_stages(graphiti: Graphiti, timings: dict) -> None:
+    for name in MODULE_STAGES:
+        setattr(graphiti_module, name, _timed(getattr(graphiti_module, name), name, timings))
+    for name in METHOD_STAGES:
+        setattr(graphiti, name, _timed(getattr(graphiti, name), name, timings))
+
+
+async def build_graphiti(args: argparse.Namespace) -> tuple[Graphiti, ScriptedLLMClient, HashEmbedder, OverlapCrossEncoder]:
+    llm = ScriptedLLMClient(latency_ms=args.llm_latency_ms, jitter=args.jitter, seed=args.seed)
+    embedder = HashEmbedder(latency_ms=args.embed_latency_ms)
+    reranker = OverlapCrossEncoder()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)  # Kuzu backend deprecation notice
+        driver = offline_driver(args.graph_path)
+    graphiti = Graphiti(graph_driver=driver, llm_client=llm, embedder=embedder, cross_encoder=reranker)
+    await graphiti.build_indices_and_constraints()
+    await graphiti_client.set_graphiti(graphiti)
+    return graphiti, llm, embedder, reranker
+
+
+async def run(args: argparse.Namespace) -> dict:
+    graphiti, llm, embedder, reranker = await build_graphiti(args)
+    timings: dict[str, list[float]] = defaultdict(list)
+    instrument_stages(graphiti, timings)
+    bodies = make_episodes(args.episodes, args.facts_per_episode, args.seed)
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    nodes = edges = 0
+
+    async def ingest(i: int, body: str):
+        nonlocal nodes, edges
+        async with semaphore:
+            started = time.perf_counter()
+            _, resp = await ingest_graphiti_episode(body, source_desc="benchmark", name=f"bench-{i:05d}")
+            timings["add_episode"].append((time.perf_counter() - started) * 1000)
+            nodes += len(resp.nodes)
+            edges += len(resp.edges)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ingest(i, body) for i, body in enumerate(bodies)))
+    elapsed = time.perf_counter() - started
+    await graphiti_client.close_graphiti()
+
+    facts = args.episodes * args.facts_per_episode
+    llm_calls = sum(llm.calls.values())
+    return {
+        "episodes": args.episodes,
+        "facts_per_episode": args.facts_per_episode,
+        "concurrency": args.concurrency,
+        "llm_latency_ms": args.llm_latency_ms,
+        "elapsed_s": round(elapsed, 3),
+        "episodes_per_s": round(args.episodes / elapsed, 3) if elapsed else None,
+        "facts_per_s": round(facts / elapsed, 3) if elapsed else None,
+        "llm_calls": llm_calls,
+        "llm_calls_per_episode": round(llm_calls / args.episodes, 2) if args.episodes else 0,
+        "llm_calls_per_fact": round(llm_calls / facts, 2) if facts else 0,
+        "llm_calls_by_model": dict(llm.calls.most_common()),
+        "embedder_calls": embedder.calls,
+        "reranker_calls": reranker.calls,
+        "nodes_returned": nodes,
+        "edges_returned": edges,
+        "stages_ms": {
+            stage: {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 1),
+                "p50": round(metrics.percentile(values, 50), 1),
+                "p95": round(metrics.percentile(values, 95), 1),
+            }
+            for stage, values in timings.items() if values
+        },
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['episodes']} episodes x {report['facts_per_episode']} fact(s), concurrency {report['concurrency']}, "
+        f"LLM latency {report['llm_latency_ms']:.0f} ms",
+        f"  elapsed          {report['elapsed_s']} s",
+        f"  episodes/sec     {report['episodes_per_s']}",
+        f"  facts/sec        {report['facts_per_s']}",
+        f"  LLM calls        {report['llm_calls']} ({report['llm_calls_per_episode']}/episode, "
+        f"{report['llm_calls_per_fact']}/fact)",
+        f"  embedder calls   {report['embedder_calls']}",
+        f"  reranker calls   {report['reranker_calls']}",
+        f"  nodes / edges    {report['nodes_returned']} / {report['edges_returned']}",
+        "",
+        "LLM calls by response model:",
+    ]
+    lines += [f"  {model:<28} {count}" for model, count in report["llm_calls_by_model"].items()]
+    lines += ["", f"{'stage':<30} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9}"]
+    for stage, s in report["stages_ms"].items():
+        lines.append(f"{stage:<30} {s['count']:>6} {s['mean']:>9} {s['p50']:>9} {s['p95']:>9}")
+    return "\n".join(lines)
+
+
+def main():
+    args = parse_args()
+    if args.episodes < 1 or args.facts_per_episode < 1:
+        print("--episodes and --facts-per-episode must be >= 1", file=sys.stderr)
+        sys.exit(1)
+    report = graphiti_loop.run(run(args), timeout=0)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -13,7 +13,6 @@ Exit codes:
 """
 from __future__ import annotations
 
-import asyncio
 import os
 import sys
 import time
@@ -27,8 +26,11 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
+# graphiti_client reads router / cache configuration from Django settings
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "memories_project.settings")
 
 from memories.graphiti_client import get_graphiti  # type: ignore
+from memories import graphiti_loop  # type: ignore
 from graphiti_core.nodes import EpisodeType  # type: ignore
 from graphiti_core.llm_client.config import LLMConfig  # type: ignore
 
@@ -112,7 +114,7 @@ def main():
         load_dotenv(".env")
     started = time.time()
     try:
-        status, code, results = asyncio.run(run_checks())
+        status, code, results = graphiti_loop.run(run_checks(), timeout=0)
     except Exception as e:  # noqa: BLE001
         print(f"graphiti_health: fatal initialization error: {e}")
         sys.exit(2)
@@ -11,6 +11,7 @@ Arguments:
   --body / -b   Episode textual content (required)
   --name / -n   Optional explicit episode name (default: auto timestamp)
   --source-desc Optional source description label (default: cli_insert)
+  --user-id     Optional user id; the episode goes to that user's Graphiti group
 
 Environment Requirements (see README_GRAPHITI_AZURE.md):
   AZURE_OPENAI_KEY, AZURE_OPENAI_VERSION, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_DEPLOYMENT
@@ -26,7 +27,6 @@ Exit Codes:
 from __future__ import annotations
 
 import argparse
-import asyncio
 import os
 import sys
 from datetime import datetime, timezone
@@ -38,9 +38,13 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
+# graphiti_client reads router / cache configuration from Django settings
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "memories_project.settings")
 
 # Reuse existing initialization logic (imports after path fix)
 from memories.graphiti_client import get_graphiti  # type: ignore  # noqa: E402
+from memories import graphiti_loop  # type: ignore  # noqa: E402
+from memories.graph_groups import group_for_user  # type: ignore  # noqa: E402
 from graphiti_core.nodes import EpisodeType  # type: ignore  # noqa: E402
 
 
@@ -60,6 +64,7 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--name", "-n", help="Optional episode name (single insert mode)")
     parser.add_argument("--source-desc", default="cli_insert", help="Source description label (single insert)")
+    parser.add_argument("--user-id", help="Insert into this user's Graphiti group (single insert)")
     return parser.parse_args()
 
 
@@ -85,7 +90,7 @@ def iso_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-async def insert_episode(body: str, name: str | None, source_desc: str):
+async def insert_episode(body: str, name: str | None, source_desc: str, group_id: str | None = None):
     graphiti = await get_graphiti()
     ep_name = name or f"memory-{iso_now()}"
     resp = await graphiti.add_episode(
@@ -94,6 +99,7 @@ async def insert_episode(body: str, name: str | None, source_desc: str):
         source=EpisodeType.text,
         source_description=source_desc,
         reference_time=datetime.utcnow(),
+        group_id=group_id,
     )
     return ep_name, resp
 
@@ -247,7 +253,7 @@ def main():
 
     if getattr(args, "sample_story", False):
         try:
-            successes, failures = asyncio.run(insert_sample_story())
+            successes, failures = graphiti_loop.run(insert_sample_story(), timeout=0)
             print(f"[insert_episode] STORY SUMMARY: {len(successes)} succeeded, {len(failures)} failed")
             if failures:
                 for n, err in failures:
@@ -258,7 +264,7 @@ def main():
             sys.exit(2)
     elif getattr(args, "gsi_memories", False):
         try:
-            successes, failures = asyncio.run(insert_gsi_memories())
+            successes, failures = graphiti_loop.run(insert_gsi_memories(), timeout=0)
             print(f"[insert_episode] GSI SUMMARY: {len(successes)} succeeded, {len(failures)} failed")
             if failures:
                 for n, err in failures:
@@ -272,7 +278,9 @@ def main():
             print("[insert_episode] ERROR: --body required in single insert mode")
             sys.exit(1)
         try:
-            ep_name, _ = asyncio.run(insert_episode(args.body, args.name, args.source_desc))
+            ep_name, _ = graphiti_loop.run(
+                insert_episode(args.body, args.name, args.source_desc, group_for_user(args.user_id)), timeout=0
+            )
             print(f"[insert_episode] SUCCESS: episode '{ep_name}' inserted")
             sys.exit(0)
         except Exception as e:  # noqa: BLE001
@@ -1,16 +1,16 @@
 """List recent Graphiti episodes.
 
-Simple utility that queries Neo4j directly for `Episodic` nodes ordered by `created_at` desc.
-Relies on the same environment variables used by `graphiti_client`.
+Lists `Episodic` nodes newest first with the keyset pagination in `memories/episodes.py`
+(index-backed, constant cost per page). Relies on the same environment variables used by `graphiti_client`.
 
 Usage:
   python scripts/list_recent_episodes.py --limit 5
-  python scripts/list_recent_episodes.py --limit 10 --json
+  python scripts/list_recent_episodes.py --limit 10 --json --content
+  python scripts/list_recent_episodes.py --limit 10 --cursor <next_cursor> --group-id <group>
 """
 from __future__ import annotations
 
 import argparse
-import asyncio
 import json
 import os
 from datetime import datetime
@@ -24,13 +24,19 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
+# graphiti_client reads router / cache configuration from Django settings
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "memories_project.settings")
 
-from memories.graphiti_client import get_graphiti  # type: ignore
+from memories import episodes, graphiti_loop  # type: ignore
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="List recent Graphiti episodes")
     p.add_argument("--limit", type=int, default=5, help="Number of episodes to list")
+    p.add_argument("--cursor", help="Continue from the next_cursor printed by a previous page")
+    p.add_argument("--group-id", help="Only list episodes of this Graphiti group")
+    p.add_argument("--content", action="store_true", help="Include episode content (JSON output)")
+    p.add_argument("--content-chars", type=int, default=None, help="Truncate content to this many characters")
     p.add_argument("--json", action="store_true", help="Output JSON instead of table")
     return p.parse_args()
 
@@ -40,21 +46,14 @@ def load_env():
         load_dotenv(".env")
 
 
-async def fetch(limit: int) -> list[dict[str, Any]]:
-    g = await get_graphiti()
-    # Attempt to pull the most common episodic properties.
-    cypher = (
-        "MATCH (e:Episodic) "
-        "RETURN e.uuid AS uuid, e.name AS name, e.source AS source, e.source_description AS source_description, "
-        "e.created_at AS created_at, e.content AS content "
-        "ORDER BY coalesce(e.created_at, datetime({epochmillis:0})) DESC "
-        "LIMIT $limit"
+async def fetch(args: argparse.Namespace) -> dict[str, Any]:
+    return await episodes.list_episodes(
+        limit=args.limit,
+        cursor=args.cursor,
+        group_id=args.group_id,
+        include_content=args.content,
+        content_chars=args.content_chars,
     )
-    records, _, _ = await g.driver.execute_query(cypher, limit=limit)
-    result = []
-    for r in records:
-        result.append({k: r.get(k) for k in ["uuid", "name", "source", "source_description", "created_at", "content"]})
-    return result
 
 
 def format_table(rows: list[dict[str, Any]]) -> str:
@@ -74,12 +73,15 @@ def format_table(rows: list[dict[str, Any]]) -> str:
 def main():
     args = parse_args()
     load_env()
-    rows = asyncio.run(fetch(args.limit))
+    page = graphiti_loop.run(fetch(args), timeout=0)
+    rows = page["episodes"]
     if args.json:
-        print(json.dumps(rows, default=str, indent=2))
+        print(json.dumps(page, default=str, indent=2))
     else:
         print(format_table(rows))
-        if rows and len(rows) < args.limit:
+        if page["next_cursor"]:
+            print(f"\nNext page: --cursor {page['next_cursor']}")
+        elif rows and len(rows) < args.limit:
             print(f"\nOnly {len(rows)} episodes found.")
 
 